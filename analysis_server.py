@@ -0,0 +1,386 @@
+"""
+Long-running local analysis service.
+
+    python3 analysis_server.py --port 8765 --workers 4
+    python3 analysis_server.py --unix /tmp/tonal.sock
+
+Speaks plain HTTP/1.1 (keep-alive) over TCP or a Unix socket:
+
+    POST /analyze/symbolic  {"path": "data/sample_01_c_major.mid"}
+    POST /analyze/audio     {"path": "music/take.m4a", "stream": false}
+    GET  /metrics
+    GET  /health
+
+Worker processes import music21 (and librosa) and run one small analysis at
+startup, then stay alive, so a request only pays for its own analysis.
+Requests wait in one bounded queue; when it is full new requests are refused
+with 503 and a Retry-After header instead of piling up. A request whose
+analysis fails gets 422; one whose worker died gets 500 (the pool is
+replaced, so a retry can succeed) and counts as a worker error, not a failure. A dispatcher hands
+work to a worker as soon as one is free, taking every queued request of the
+same kind (up to the batch limit) with it, so batches grow under load and
+cost nothing when idle.
+"""
+import os
+import io
+import json
+import time
+import asyncio
+import argparse
+import warnings
+import contextlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+# A batch key: requests with equal keys can run together in one worker call
+JobKind = Tuple[str, bool]
+
+_worker_state: Dict[str, Any] = {}
+
+def _init_worker(cache_dir: Optional[str], audio: bool, sample_rate: int, decode_cache_dir: Optional[str]):
+    """Imports the analysis stack and warms it up once per worker process."""
+    import music21
+    from batch_analysis import analyze_file, analyzer_fingerprint
+    from src.cache import ResultCache
+    from src.harmonic_analysis import HarmonicAnalyzer
+
+    _worker_state["cache"] = ResultCache(cache_dir, fingerprint=analyzer_fingerprint()) if cache_dir else None
+    _worker_state["analyze_file"] = analyze_file
+    warmup = music21.stream.Score([music21.stream.Part([music21.chord.Chord(["C4", "E4", "G4"]),
+                                                        music21.chord.Chord(["G3", "B3", "D4"])])])
+    HarmonicAnalyzer.analyze(warmup)
+
+    if audio:
+        import numpy as np
+        from src.audio_analysis import AudioAnalyzer, AudioFeatures
+        from src.cache import DecodedAudioCache
+        decode_cache = DecodedAudioCache(decode_cache_dir) if decode_cache_dir else None
+        analyzer = AudioAnalyzer(sample_rate=sample_rate, decode_cache=decode_cache)
+        t = np.arange(sample_rate * 2) / sample_rate
+        with warnings.catch_warnings():
+            # The warm-up clip is shorter than the lowest constant-Q filters
+            warnings.simplefilter("ignore")
+            analyzer.analyze_features(AudioFeatures(np.sin(2 * np.pi * 440 * t).astype(np.float32), sample_rate))
+        _worker_state["audio"] = analyzer
+
+def _run_job(kind: JobKind, payload: Dict[str, Any]) -> Dict[str, Any]:
+    path = payload["path"]
+    if kind[0] == "symbolic":
+        _, _, error, result = _worker_state["analyze_file"](path, cache=_worker_state["cache"], export=False)
+        return {"error": error} if error is not None else result
+    analyzer = _worker_state.get("audio")
+    if analyzer is None:
+        return {"error": "Audio analysis is disabled on this server"}
+    return analyzer.analyze_stream(path) if kind[1] else analyzer.analyze_file(path)
+
+def _run_batch(kind: JobKind, payloads: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], float]]:
+    """Worker: runs a batch of compatible jobs; returns (result, seconds) per job."""
+    outcomes = []
+    done: Dict[str, Tuple[Dict[str, Any], float]] = {}
+    # analyze_file reports progress on stdout, which would only flood the server log
+    with contextlib.redirect_stdout(io.StringIO()):
+        for payload in payloads:
+            # Concurrent requests for the same file share one analysis
+            if payload["path"] not in done:
+                start = time.perf_counter()
+                try:
+                    result = _run_job(kind, payload)
+                except Exception as e:
+                    result = {"error": str(e)}
+                done[payload["path"]] = (result, time.perf_counter() - start)
+            outcomes.append(done[payload["path"]])
+    return outcomes
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    """Mean, p50, p95 and p99 of samples given in seconds, in milliseconds."""
+    if not samples:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3
+    return {"mean": sum(ordered) / len(ordered) * 1e3, "p50": at(0.50), "p95": at(0.95), "p99": at(0.99)}
+
+class KindMetrics:
+    """Counters and the most recent latency samples for one job kind."""
+
+    def __init__(self, window: int = 10000):
+        self.completed = 0
+        self.failed = 0
+        self.worker_errors = 0
+        self.rejected = 0
+        self.batches = 0
+        self.latency: Deque[float] = deque(maxlen=window)
+        self.queue_wait: Deque[float] = deque(maxlen=window)
+        self.analysis: Deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed + self.worker_errors
+        return {"completed": self.completed, "failed": self.failed, "worker_errors": self.worker_errors,
+                "rejected": self.rejected, "mean_batch_size": finished / self.batches if self.batches else 0.0,
+                "latency_ms": percentiles(self.latency), "queue_wait_ms": percentiles(self.queue_wait),
+                "analysis_ms": percentiles(self.analysis)}
+
+class Job:
+    __slots__ = ("kind", "payload", "enqueued", "future")
+
+    def __init__(self, kind: JobKind, payload: Dict[str, Any], future: asyncio.Future):
+        self.kind = kind
+        self.payload = payload
+        self.enqueued = time.perf_counter()
+        self.future = future
+
+class AnalysisServer:
+    """
+    Queue, dispatcher and warm worker pool behind the HTTP front end.
+
+    At most `workers` batches are in flight; everything else waits in the
+    bounded queue, so its depth is the real backlog. max_batch limits how many
+    requests of one kind a worker takes at once (audio jobs are long, so they
+    default to one per batch). A worker that dies breaks the whole process
+    pool: the batches in flight on it fail, and the next batch gets a new pool.
+    """
+
+    def __init__(self, workers: int = 2, queue_size: int = 256, max_batch: Optional[Dict[str, int]] = None,
+                 cache_dir: Optional[str] = ".cache/results", audio: bool = True, sample_rate: int = 22050,
+                 decode_cache_dir: Optional[str] = None):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_batch = max_batch or {"symbolic": 16, "audio": 1}
+        self.audio = audio
+        self._initargs = (cache_dir, audio, sample_rate, decode_cache_dir)
+        self.pool = self._new_pool()
+        self.pool_restarts = 0
+        self.metrics = {"symbolic": KindMetrics(), "audio": KindMetrics()}
+        self.started = time.time()
+        self._queue: Optional[asyncio.Queue] = None
+        self._held: Deque[Job] = deque()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=self._initargs)
+
+    def _replace_pool(self, broken: ProcessPoolExecutor):
+        """Swaps in a new pool for a broken one (once, however many batches saw it break)."""
+        if self.pool is not broken:
+            return
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.pool = self._new_pool()
+        self.pool_restarts += 1
+
+    def warm_up(self):
+        """Blocks until every worker has started and run its warm-up analysis."""
+        list(self.pool.map(time.sleep, [0.05] * self.workers))
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        self.pool.shutdown(cancel_futures=True)
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() + len(self._held)
+
+    def submit(self, kind: JobKind, payload: Dict[str, Any]) -> Optional[asyncio.Future]:
+        """
+        Queues a job; returns None, counting a rejection, when the queue is full.
+        The future resolves to (status, result, latency, analysis seconds).
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self.queue_depth() >= self.queue_size:
+            self.metrics[kind[0]].rejected += 1
+            return None
+        self._queue.put_nowait(Job(kind, payload, future))
+        return future
+
+    async def _next_job(self) -> Job:
+        if self._held:
+            return self._held.popleft()
+        return await self._queue.get()
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Take a worker slot first, so jobs stay queued (and batchable) while all workers are busy
+            await self._slots.acquire()
+            first = await self._next_job()
+            batch = [first]
+            # Split the backlog evenly instead of letting one worker take a full batch while others idle
+            share = -(-(self.queue_depth() + 1) // self.workers)
+            limit = min(self.max_batch.get(first.kind[0], 1), share)
+            skipped: List[Job] = []
+            while len(batch) < limit and (self._held or not self._queue.empty()):
+                job = self._held.popleft() if self._held else self._queue.get_nowait()
+                (batch if job.kind == first.kind else skipped).append(job)
+            # Jobs of other kinds keep their place at the front of the line
+            self._held.extendleft(reversed(skipped))
+            self._in_flight += 1
+            pool = self.pool
+            try:
+                future = loop.run_in_executor(pool, _run_batch, first.kind, [job.payload for job in batch])
+            except BrokenProcessPool:
+                # Broken between batches; submit() raises instead of returning a failed future
+                self._replace_pool(pool)
+                pool = self.pool
+                future = loop.run_in_executor(pool, _run_batch, first.kind, [job.payload for job in batch])
+            future.add_done_callback(lambda f, batch=batch, pool=pool: self._finish(batch, f, pool))
+
+    def _finish(self, batch: List[Job], future: asyncio.Future, pool: ProcessPoolExecutor):
+        self._in_flight -= 1
+        self._slots.release()
+        metrics = self.metrics[batch[0].kind[0]]
+        metrics.batches += 1
+        now = time.perf_counter()
+        exc = future.exception()
+        if isinstance(exc, BrokenProcessPool):
+            self._replace_pool(pool)
+        for i, job in enumerate(batch):
+            if job.future.done():
+                continue
+            latency = now - job.enqueued
+            if exc is not None:
+                # The worker (or pool) died: a server fault, not a verdict on the file
+                metrics.worker_errors += 1
+                job.future.set_result((500, {"error": f"Worker failed: {exc!r}"}, latency, 0.0))
+                continue
+            result, seconds = future.result()[i]
+            if "error" in result:
+                metrics.failed += 1
+            else:
+                metrics.completed += 1
+            metrics.latency.append(latency)
+            metrics.analysis.append(seconds)
+            metrics.queue_wait.append(max(0.0, latency - seconds))
+            job.future.set_result((422 if "error" in result else 200, result, latency, seconds))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"uptime_s": time.time() - self.started, "workers": self.workers, "pool_restarts": self.pool_restarts,
+                "queue_depth": self.queue_depth(), "queue_capacity": self.queue_size,
+                "in_flight_batches": self._in_flight,
+                "kinds": {name: m.snapshot() for name, m in self.metrics.items()}}
+
+    async def handle(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, Any]]:
+        """Routes one HTTP request; returns (status, JSON body)."""
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        if method == "GET" and path == "/metrics":
+            return 200, self.snapshot()
+        if method != "POST" or path not in ("/analyze/symbolic", "/analyze/audio"):
+            return 404, {"error": f"No route for {method} {path}"}
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError as e:
+            return 400, {"error": f"Invalid JSON: {e}"}
+        if not isinstance(payload, dict) or not isinstance(payload.get("path"), str):
+            return 400, {"error": "Body must be a JSON object with a \"path\""}
+        if not os.path.isfile(payload["path"]):
+            return 404, {"error": f"No such file: {payload['path']}"}
+        name = path.rsplit("/", 1)[1]
+        if name == "audio" and not self.audio:
+            return 400, {"error": "Audio analysis is disabled on this server"}
+        future = self.submit((name, bool(payload.get("stream", False))), payload)
+        if future is None:
+            return 503, {"error": "Queue full", "queue_depth": self.queue_depth()}
+        status, result, latency, seconds = await future
+        return status, dict(result, server_timing={"latency_ms": latency * 1e3, "analysis_ms": seconds * 1e3})
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 422: "Unprocessable Entity",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+async def serve_connection(server: AnalysisServer, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Minimal HTTP/1.1 keep-alive loop: one JSON request and response at a time."""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            try:
+                status, response = await server.handle(method, path, body)
+            except Exception as e:
+                status, response = 500, {"error": str(e)}
+            data = json.dumps(response).encode()
+            keep_alive = headers.get("connection", "").lower() != "close"
+            head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n")
+            if status == 503:
+                head += "Retry-After: 1\r\n"
+            head += f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            writer.write(head.encode() + data)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def run_server(server: AnalysisServer, host: str = "127.0.0.1", port: int = 8765,
+                     unix: Optional[str] = None):
+    server.start()
+
+    def handler(reader, writer):
+        return serve_connection(server, reader, writer)
+    if unix:
+        listener = await asyncio.start_unix_server(handler, path=unix)
+        print(f"Serving on {unix}")
+    else:
+        listener = await asyncio.start_server(handler, host, port)
+        print(f"Serving on http://{host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Serve symbolic and audio analysis from warm workers.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="Listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Warm worker processes")
+    parser.add_argument("--queue-size", type=int, default=256,
+                        help="Queued requests beyond which new ones are refused with 503")
+    parser.add_argument("--max-batch", type=int, default=16, help="Symbolic requests per worker batch")
+    parser.add_argument("--audio-max-batch", type=int, default=1, help="Audio requests per worker batch")
+    parser.add_argument("--cache-dir", default=".cache/results", help="Symbolic result cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--decode-cache-dir", help="Cache decoded audio in this directory")
+    parser.add_argument("--sample-rate", type=int, default=22050)
+    parser.add_argument("--no-audio", action="store_true", help="Symbolic only; workers never import librosa")
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None):
+    args = build_parser(prog).parse_args(argv)
+    server = AnalysisServer(workers=args.workers, queue_size=args.queue_size,
+                            max_batch={"symbolic": args.max_batch, "audio": args.audio_max_batch},
+                            cache_dir=None if args.no_cache else args.cache_dir, audio=not args.no_audio,
+                            sample_rate=args.sample_rate, decode_cache_dir=args.decode_cache_dir)
+    print(f"Warming up {args.workers} worker(s)...")
+    server.warm_up()
+    try:
+        asyncio.run(run_server(server, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+if __name__ == "__main__":
+    main()
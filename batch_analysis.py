@@ -1,76 +1,362 @@
 import os
 import json
 import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+import music21
 from music21 import converter
-from src.harmonic_analysis import HarmonicAnalyzer
+from src.budget import BudgetedPool
+from src.cache import ResultCache
+from src.harmonic_analysis import ANALYZER_VERSION, HarmonicAnalyzer
+from src.instrumentation import configure, get_instrumentation, rollup
+from src.run_journal import DONE, FAILED, RunJournal, file_source
 
-def run_analysis():
-    data_dir = "data"
-    result_dir = "result"
-    analysis_dir = "analysis"
-    
+if TYPE_CHECKING:
+    # pandas is only needed when a store is used
+    from src.progression_index import ProgressionIndex
+    from src.result_store import ResultStore
+
+def analyzer_fingerprint(local_keys: bool = False) -> str:
+    """Identifies the analysis code, options and library versions that produced a cached result."""
+    fingerprint = f"analyzer={ANALYZER_VERSION};music21={music21.__version__}"
+    return fingerprint + ";local_keys" if local_keys else fingerprint
+
+def format_report(result_data: dict) -> str:
+    """The text report entry of one file's result."""
+    text = f"File: {result_data['filename']}\n"
+    text += f"Key: {result_data['detected_key']}\n"
+    timeline = result_data.get("key_timeline")
+    if timeline is not None and len(timeline) > 1:
+        regions = " -> ".join(f"{r['key']} ({r['start']:g})" for r in timeline)
+        text += f"Modulations: {regions}\n"
+    text += f"Progression: {' -> '.join(result_data['roman_numerals'])}\n"
+    text += "-" * 40 + "\n"
+    return text
+
+def _write_if_changed(path: str, text: str):
+    # An identical file is left alone, so its mtime keeps dating the last real change
+    try:
+        with open(path, 'r') as f:
+            if f.read() == text:
+                return
+    except OSError:
+        pass
+    with open(path, 'w') as f:
+        f.write(text)
+
+def result_json_path(base_name: str, result_dir: str = "result") -> str:
+    return os.path.join(result_dir, f"{base_name}_result.json")
+
+def write_outputs(base_name: str, result_data: dict, analysis_text: str,
+                  result_dir: str = "result", analysis_dir: str = "analysis"):
+    """Writes the per-file JSON result and text report, skipping files whose contents are unchanged."""
+    # Save to result/ (JSON)
+    _write_if_changed(result_json_path(base_name, result_dir), json.dumps(result_data, indent=4))
+
+    # Save individual analysis text
+    _write_if_changed(os.path.join(analysis_dir, f"{base_name}_analysis.txt"), analysis_text)
+
+def analyze_file(file_path: str, result_dir: str = "result", analysis_dir: str = "analysis",
+                 cache: Optional[ResultCache] = None, export: bool = True,
+                 local_keys: bool = False) -> Tuple[str, Optional[str], Optional[str], Optional[dict]]:
+    """
+    Analyzes a single MIDI file and, if export is set, writes its JSON result and text report.
+    With local_keys, Roman numerals follow the local key and the result gets a "key_timeline"
+    of the key regions (the cache must then be built with analyzer_fingerprint(local_keys=True)).
+    If a cache is given and holds an entry for the file's current contents,
+    parsing and analysis are skipped and the stored result is used.
+    When instrumentation is enabled, result_data gets a "timings" block of per-stage costs.
+    Returns (filename, analysis_text, error, result_data); on failure only error is set.
+    """
+    filename = os.path.basename(file_path)
+    base_name = os.path.splitext(filename)[0]
+    inst = get_instrumentation()
+
+    try:
+        with inst.scope() as timings:
+            result_data = None
+            cache_key = None
+            if cache is not None:
+                with inst.stage("cache_lookup"):
+                    cache_key = cache.key_for_file(file_path)
+                    entry = cache.get(cache_key)
+                if entry is not None:
+                    print(f"Cached {filename}")
+                    # The stored result belongs to the file contents, not the file name,
+                    # so the report is rebuilt for this file
+                    result_data = dict(entry["result_data"], filename=filename)
+                    analysis_text = format_report(result_data)
+
+            if result_data is None:
+                print(f"Analyzing {filename}...")
+
+                # Load Score
+                with inst.stage("parse"):
+                    score = converter.parse(file_path)
+
+                # Key and Roman Numeral Analysis in a single pass
+                timeline = None
+                if local_keys:
+                    key_obj, confidence, rn_sequence, timeline = HarmonicAnalyzer.analyze_local(score)
+                else:
+                    key_obj, confidence, rn_sequence = HarmonicAnalyzer.analyze(score)
+
+                # Prepare Result Data
+                result_data = {
+                    "filename": filename,
+                    "detected_key": f"{key_obj.tonic.name} {key_obj.mode}",
+                    "confidence": confidence,
+                    "chord_count": len(rn_sequence),
+                    "roman_numerals": rn_sequence
+                }
+                if timeline is not None:
+                    result_data["key_timeline"] = [{"start": r["start"], "end": r["end"], "key": r["key"],
+                                                    "confidence": r["confidence"]} for r in timeline]
+
+                # Prepare Analysis Report Entry
+                analysis_text = format_report(result_data)
+
+                if cache is not None:
+                    # Cached before timings are attached: they describe this run, not the file
+                    cache.put(cache_key, {"result_data": result_data})
+
+        if inst.enabled:
+            result_data = dict(result_data, timings=timings)
+
+        if export:
+            write_outputs(base_name, result_data, analysis_text, result_dir, analysis_dir)
+
+        return filename, analysis_text, None, result_data
+
+    except MemoryError as e:
+        # Told apart from other failures so a memory budget can be reported as such
+        print(f"Out of memory analyzing {filename}")
+        return filename, None, f"MemoryError: {e}", None
+    except Exception as e:
+        print(f"Error analyzing {filename}: {e}")
+        return filename, None, str(e), None
+
+def _budgeted_analyze_file(*args) -> Tuple[str, Optional[str], Optional[str], Optional[dict]]:
+    """analyze_file for a BudgetedPool worker: running out of memory ends the task as over budget."""
+    outcome = analyze_file(*args)
+    if outcome[2] is not None and outcome[2].startswith("MemoryError"):
+        raise MemoryError(outcome[2][len("MemoryError: "):])
+    return outcome
+
+def stage_report(results: List[dict]) -> str:
+    """Formats per-stage totals over all instrumented results for full_report.txt."""
+    totals = rollup([r["timings"] for r in results if "timings" in r])
+    if not totals:
+        return ""
+    lines = ["=" * 40 + "\n", f"Stage totals ({len(results)} files)\n"]
+    for name, total in sorted(totals.items(), key=lambda item: -item[1]["self"]):
+        line = (f"{name:<16} wall {total['wall']:9.3f} s  self {total['self']:9.3f} s  "
+                f"cpu {total['cpu']:9.3f} s  calls {total['calls']:6d}")
+        if "peak_mem" in total:
+            line += f"  peak {total['peak_mem'] / (1024 * 1024):8.1f} MiB"
+        lines.append(line + "\n")
+    return "".join(lines)
+
+def run_analysis(data_dir: str = "data", result_dir: str = "result", analysis_dir: str = "analysis",
+                 workers: int = 1, cache: Optional[ResultCache] = None,
+                 store: Optional["ResultStore"] = None, export: bool = True,
+                 index: Optional["ProgressionIndex"] = None, local_keys: bool = False,
+                 journal: Optional[RunJournal] = None, timeout: Optional[float] = None,
+                 memory_mb: Optional[int] = None, retry_failed: bool = False) -> Dict[str, str]:
+    """
+    Analyzes every MIDI file in data_dir.
+    With workers > 1 the files are spread over a process pool; each worker writes
+    its own per-file outputs and full_report.txt is assembled in sorted filename order.
+    Files whose contents are already in the cache are not re-analyzed.
+    If a store is given, all results are appended to it as one columnar batch;
+    export=False then skips the per-file JSON/text outputs.
+    If a progression index is given, the results it does not already hold as
+    they are (see ProgressionIndex.is_current) are added to it as one segment,
+    with the stat of their JSON file so update_from_dir skips them.
+    local_keys labels chords in their local key (see analyze_file).
+    With a journal, every file's outcome is recorded as soon as it is known and
+    files the journal already holds are not run again, so an interrupted run
+    resumes where it stopped and a finished one only runs new or changed files
+    (retry_failed also reruns files that did not finish as done). With a timeout (seconds) or memory_mb, every file runs in an
+    isolated worker under that budget (see BudgetedPool); files over budget are
+    recorded as failed with their partial stats instead of holding up the run.
+    With instrumentation enabled, per-stage totals are appended to full_report.txt.
+    Returns a mapping of filename -> error message for the files that failed.
+    """
     # Get all MIDI files
     midi_files = glob.glob(os.path.join(data_dir, "*.mid"))
     midi_files.sort()
-    
+
     if not midi_files:
-        print("No MIDI files found in data/")
-        return
-
-    summary_report = []
-
-    for file_path in midi_files:
-        filename = os.path.basename(file_path)
-        base_name = os.path.splitext(filename)[0]
-        print(f"Analyzing {filename}...")
-        
-        try:
-            # Load Score
-            score = converter.parse(file_path)
-            
-            # 1. Identify Key
-            key_obj = HarmonicAnalyzer.identify_key(score)
-            
-            # 2. Roman Numeral Analysis
-            # Note: harmonic_analysis.py returns (key, rn_sequence)
-            _, rn_sequence = HarmonicAnalyzer.roman_numeral_analysis(score)
-            
-            # Prepare Result Data
-            result_data = {
-                "filename": filename,
-                "detected_key": f"{key_obj.tonic.name} {key_obj.mode}",
-                "confidence": key_obj.correlationCoefficient,
-                "chord_count": len(rn_sequence),
-                "roman_numerals": rn_sequence
-            }
-            
-            # Save to result/ (JSON)
-            json_path = os.path.join(result_dir, f"{base_name}_result.json")
-            with open(json_path, 'w') as f:
-                json.dump(result_data, f, indent=4)
-            
-            # Prepare Analysis Report Entry
-            analysis_text = f"File: {filename}\n"
-            analysis_text += f"Key: {result_data['detected_key']}\n"
-            analysis_text += f"Progression: {' -> '.join(rn_sequence)}\n"
-            analysis_text += "-" * 40 + "\n"
-            
+        print(f"No MIDI files found in {data_dir}/")
+        return {}
+
+    os.makedirs(result_dir, exist_ok=True)
+    os.makedirs(analysis_dir, exist_ok=True)
+
+    outcomes: Dict[str, Tuple[str, Optional[str], Optional[str], Optional[dict]]] = {}
+    pending = midi_files
+    if journal is not None:
+        pending = journal.pending(midi_files, retry_failed)
+        for path in midi_files:
+            entry = journal.entry(path)
+            if entry is not None and path not in pending:
+                outcomes[path] = (entry["file"], entry.get("analysis_text"), entry.get("error"),
+                                  entry.get("result_data"))
+        if outcomes:
+            verb = "Reusing" if journal.completed else "Resuming from"
+            print(f"{verb} {journal.path}: {len(outcomes)} of {len(midi_files)} file(s) already finished")
+
+    def finish(path: str, outcome: Tuple[str, Optional[str], Optional[str], Optional[dict]],
+               state: Optional[str] = None, stats: Optional[Dict[str, Any]] = None):
+        outcomes[path] = outcome
+        if journal is not None:
+            _, analysis_text, error, result_data = outcome
+            fields: Dict[str, Any] = dict(stats or {})
+            if error is None:
+                fields.update(analysis_text=analysis_text, result_data=result_data)
+            else:
+                fields["error"] = error
+            journal.record(path, state or (DONE if error is None else FAILED), **fields)
+
+    n = len(pending)
+    inst = get_instrumentation()
+    # Workers get the parent's instrumentation settings whatever the start method
+    initargs = (inst.enabled, inst.trace_memory, inst.trace_path)
+    if n and (timeout is not None or memory_mb is not None):
+        pool = BudgetedPool(_budgeted_analyze_file, workers=workers, timeout=timeout, memory_mb=memory_mb,
+                            initializer=configure, initargs=initargs)
+        tasks = [(path, (path, result_dir, analysis_dir, cache, export, local_keys)) for path in pending]
+        for path, outcome in pool.run(tasks):
+            stats = {name: outcome[name] for name in ("seconds", "cpu_s", "peak_rss_mb") if name in outcome}
+            if outcome["state"] == "ok":
+                finish(path, outcome["value"], stats=stats)
+                continue
+            filename = os.path.basename(path)
+            print(f"Over budget: {filename}: {outcome['error']}")
+            stats["stages"] = outcome.get("stages", [])
+            finish(path, (filename, None, outcome["error"], None), outcome["state"], stats)
+    elif workers > 1 and n:
+        # Small chunks keep all workers busy without paying one IPC round trip per file
+        chunksize = max(1, n // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure, initargs=initargs) as executor:
+            # map() yields in submission order, so each outcome is journaled as soon as it is in
+            results = executor.map(analyze_file, pending, [result_dir] * n, [analysis_dir] * n, [cache] * n,
+                                   [export] * n, [local_keys] * n, chunksize=chunksize)
+            for path, outcome in zip(pending, results):
+                finish(path, outcome)
+    else:
+        for path in pending:
+            finish(path, analyze_file(path, result_dir, analysis_dir, cache, export, local_keys))
+
+    if cache is not None:
+        cache.evict()
+
+    summary_report: List[str] = []
+    errors: Dict[str, str] = {}
+    results: List[dict] = []
+    for filename, analysis_text, error, result_data in (outcomes[path] for path in midi_files):
+        if error is not None:
+            errors[filename] = error
+        else:
             summary_report.append(analysis_text)
-            
-            # Save individual analysis text
-            txt_path = os.path.join(analysis_dir, f"{base_name}_analysis.txt")
-            with open(txt_path, 'w') as f:
-                f.write(analysis_text)
-                
-        except Exception as e:
-            print(f"Error analyzing {filename}: {e}")
+            results.append(result_data)
+
+    if store is not None:
+        store.append_results(results)
+    if index is not None:
+        # Cache hits and unchanged scores are already indexed; re-adding them would
+        # turn every rerun into a segment holding the whole corpus
+        fresh = [r for r in results if not index.is_current(r)]
+        sources = [file_source(result_json_path(os.path.splitext(r["filename"])[0], result_dir)) if export else None
+                   for r in fresh]
+        index.add_results(fresh, sources=sources)
 
     # Save full summary
     with open(os.path.join(analysis_dir, "full_report.txt"), "w") as f:
         f.writelines(summary_report)
-        
+        f.write(stage_report(results))
+
+    if errors:
+        print(f"{len(errors)} file(s) failed:")
+        for filename, error in errors.items():
+            print(f"  {filename}: {error}")
+
+    if journal is not None:
+        journal.complete()
     print("Batch analysis complete.")
+    return errors
 
-if __name__ == "__main__":
-    run_analysis()
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Run harmonic analysis on all MIDI files in data/.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1, i.e. sequential)")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--result-dir", default="result")
+    parser.add_argument("--analysis-dir", default="analysis")
+    parser.add_argument("--cache-dir", default=".cache/results",
+                        help="Directory of the persistent result cache")
+    parser.add_argument("--cache-max-mb", type=int, default=512,
+                        help="Evict least-recently-used cache entries above this size")
+    parser.add_argument("--no-cache", action="store_true", help="Always re-analyze every file")
+    parser.add_argument("--clear-cache", action="store_true", help="Invalidate the whole cache before running")
+    parser.add_argument("--store", metavar="PATH",
+                        help="Also append results to a columnar result store at PATH (Parquet or .npz)")
+    parser.add_argument("--no-export", action="store_true",
+                        help="With --store, skip the per-file JSON and text outputs")
+    parser.add_argument("--local-keys", action="store_true",
+                        help="Track modulations with a sliding key window and label chords in their local key")
+    parser.add_argument("--index", metavar="PATH",
+                        help="Also add results to a Roman numeral progression index (see search_progressions.py)")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Record each file's outcome in a run journal; a later run with the same journal "
+                             "only runs files it does not hold, so an interrupted run resumes")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="With --journal, also rerun the files it holds as failed or over budget, "
+                             "including after a finished run")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS",
+                        help="Wall-clock budget per file; files over it are recorded as timed out")
+    parser.add_argument("--max-memory-mb", type=int, metavar="MB",
+                        help="Address-space budget of each (isolated) worker process")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage wall and CPU time in each result and in the report")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="With --profile, also record the tracemalloc peak of each stage")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="Write stage events to a Chrome trace file (implies --profile)")
+    return parser
 
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> Dict[str, str]:
+    """Command-line entry point; returns the errors of run_analysis."""
+    args = build_parser(prog).parse_args(argv)
+
+    if args.profile or args.profile_memory or args.trace:
+        configure(trace_memory=args.profile_memory, trace_path=args.trace).start_trace()
+
+    cache = None
+    if not args.no_cache:
+        cache = ResultCache(args.cache_dir, fingerprint=analyzer_fingerprint(args.local_keys),
+                            max_bytes=args.cache_max_mb * 1024 * 1024)
+        if args.clear_cache:
+            cache.clear()
+    store = None
+    if args.store:
+        from src.result_store import ResultStore
+        store = ResultStore(args.store)
+    index = None
+    if args.index:
+        from src.progression_index import ProgressionIndex
+        index = ProgressionIndex(args.index)
+    journal = None
+    if args.journal:
+        journal = RunJournal(args.journal, fingerprint=analyzer_fingerprint(args.local_keys))
+        if journal.discarded:
+            print(f"{args.journal} was written with other analysis settings; starting a new run")
+    return run_analysis(args.data_dir, args.result_dir, args.analysis_dir, workers=args.workers, cache=cache,
+                        store=store, export=not (store is not None and args.no_export), index=index,
+                        local_keys=args.local_keys, journal=journal, timeout=args.timeout,
+                        memory_mb=args.max_memory_mb, retry_failed=args.retry_failed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Batch harmonic and rhythmic analysis of the recordings in music/.
+
+    python3 batch_audio_analysis.py --workers 8
+    python3 batch_audio_analysis.py --music-dir /archive --workers 16 --threads-per-worker 1 --stream
+
+Recordings are spread over a process pool, longest first so a long file picked
+up last cannot leave the other workers idle at the end. Each worker caps the
+BLAS/OpenMP/numba thread pools of the libraries it uses, so N workers use N x
+--threads-per-worker threads instead of N x cores. Per-file results go to
+result/<name>_audio_result.json (AudioAnalyzer.save_analysis), where <name> is
+the path under music/ (see result_names), and a corpus summary to
+result/audio_summary.json. A worker that dies (e.g. killed for running out of
+memory) fails only the recording it was analyzing and is replaced (see
+BudgetedPool); the rest of the batch goes on.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import soundfile as sf
+from threadpoolctl import threadpool_limits
+from src.audio_analysis import AudioAnalyzer
+from src.budget import BudgetedPool
+from src.cache import DecodedAudioCache
+from src.data_loader import MusicDataLoader, output_name
+from src.instrumentation import configure, get_instrumentation, rollup
+from src.run_journal import file_source
+
+if TYPE_CHECKING:
+    from src.similarity_index import HarmonicSimilarityIndex
+
+# Thread pools sized from the environment when their library is loaded
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "NUMBA_NUM_THREADS")
+
+# Rough byte rate of compressed recordings (128 kbit/s), for files soundfile cannot open
+_COMPRESSED_BYTES_PER_S = 16000
+
+_worker_state: Dict[str, Any] = {}
+
+@contextlib.contextmanager
+def thread_environment(threads: int):
+    """
+    Sizes the thread pools of libraries loaded by processes started inside the
+    block (worker processes inherit the environment), then restores it.
+    """
+    saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    os.environ.update({name: str(threads) for name in THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                del os.environ[name]
+            else:
+                os.environ[name] = value
+
+def limit_threads(threads: int):
+    """Caps the BLAS/OpenMP (through threadpoolctl) and numba thread pools already loaded in this process."""
+    threadpool_limits(threads)
+    if "numba" in sys.modules:
+        import numba
+        numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+
+def estimated_duration(file_path: str) -> float:
+    """Length in seconds from the file header, or estimated from the file size for compressed formats."""
+    try:
+        return float(sf.info(file_path).duration)
+    except Exception:
+        return os.path.getsize(file_path) / _COMPRESSED_BYTES_PER_S
+
+def longest_first(files: Sequence[str]) -> List[str]:
+    """Files ordered by decreasing (estimated) duration, ties by path."""
+    return sorted(files, key=lambda path: (-estimated_duration(path), path))
+
+def result_names(files: Sequence[str], music_dir: str) -> Dict[str, str]:
+    """
+    Output name of every recording: its path under music_dir (see output_name),
+    with the extension kept where recordings differ only by it (x.wav, x.m4a).
+    """
+    stems = [output_name(path, music_dir) for path in files]
+    counts = Counter(stems)
+    return {path: output_name(path, music_dir, keep_extension=counts[stem] > 1) for path, stem in zip(files, stems)}
+
+def result_path(name: str, result_dir: str) -> str:
+    return os.path.join(result_dir, f"{name}_audio_result.json")
+
+def _init_worker(threads: int, sample_rate: int, decode_cache_dir: Optional[str], profile: bool,
+                 trace_memory: bool):
+    """Limits native threads and builds the analyzer once per worker process."""
+    limit_threads(threads)
+    configure(profile, trace_memory)
+    decode_cache = DecodedAudioCache(decode_cache_dir) if decode_cache_dir else None
+    _worker_state["analyzer"] = AudioAnalyzer(sample_rate=sample_rate, decode_cache=decode_cache)
+
+def analyze_recording(file_path: str, output_path: str,
+                      stream: bool = False) -> Tuple[str, Optional[str], Optional[Dict[str, Any]], float]:
+    """
+    Analyzes one recording with the worker's analyzer and saves its JSON result to output_path.
+    Returns (file_path, error, results, seconds); on failure results is None.
+    """
+    analyzer: AudioAnalyzer = _worker_state["analyzer"]
+    start = time.perf_counter()
+    try:
+        results = analyzer.analyze_stream(file_path) if stream else analyzer.analyze_file(file_path)
+        if "error" in results:
+            return file_path, results["error"], None, time.perf_counter() - start
+        analyzer.save_analysis(results, output_path)
+    except Exception as e:
+        return file_path, str(e), None, time.perf_counter() - start
+    return file_path, None, results, time.perf_counter() - start
+
+def corpus_summary(outcomes: List[Tuple[str, Optional[str], Optional[Dict[str, Any]], float]],
+                   wall: float, workers: int, threads: int, names: Dict[str, str]) -> Dict[str, Any]:
+    """
+    Key, mode and tempo distributions, per-file rows, errors and throughput of a
+    batch. Rows and errors are keyed by the recordings' output names.
+    """
+    rows = []
+    errors = {}
+    for file_path, error, results, seconds in sorted(outcomes, key=lambda outcome: outcome[0]):
+        if error is not None:
+            errors[names[file_path]] = error
+            continue
+        rows.append({"name": names[file_path], "filename": os.path.basename(file_path),
+                     "key": f"{results['estimated_key_root']} {results['estimated_mode']}",
+                     "key_confidence": float(results["key_confidence"]), "tempo": float(results["tempo"]),
+                     "duration": float(results["duration"]), "analysis_s": seconds})
+    keys: Dict[str, int] = {}
+    for row in rows:
+        keys[row["key"]] = keys.get(row["key"], 0) + 1
+    tempo = np.array([row["tempo"] for row in rows])
+    audio_seconds = float(sum(row["duration"] for row in rows))
+    summary = {
+        "files": len(outcomes),
+        "analyzed": len(rows),
+        "failed": len(errors),
+        "workers": workers,
+        "threads_per_worker": threads,
+        "audio_seconds": audio_seconds,
+        "wall_s": wall,
+        "audio_seconds_per_s": audio_seconds / wall if wall else 0.0,
+        "keys": dict(sorted(keys.items(), key=lambda item: -item[1])),
+        "modes": {mode: sum(row["key"].endswith(mode) for row in rows) for mode in ("major", "minor")},
+        "tempo": {"mean": float(tempo.mean()), "median": float(np.median(tempo)),
+                  "min": float(tempo.min()), "max": float(tempo.max())} if len(tempo) else {},
+        "recordings": rows,
+        "errors": errors,
+    }
+    timings = [results["timings"] for _, error, results, _ in outcomes if error is None and "timings" in results]
+    if timings:
+        summary["stage_totals"] = rollup(timings)
+    return summary
+
+def run_audio_analysis(music_dir: str = "music", result_dir: str = "result", workers: int = 1,
+                       threads_per_worker: Optional[int] = None, sample_rate: int = 22050, stream: bool = False,
+                       decode_cache_dir: Optional[str] = None,
+                       similarity_index: Optional["HarmonicSimilarityIndex"] = None) -> Dict[str, Any]:
+    """
+    Analyzes every recording under music_dir and writes the per-file results and
+    audio_summary.json to result_dir. Files are handed out longest first, one at
+    a time, so idle workers always take the longest remaining file.
+    threads_per_worker defaults to an even share of the cores.
+    If a similarity index is given, the results are added to it under the
+    recordings' output names (see result_names).
+    Returns the corpus summary.
+    """
+    files = MusicDataLoader(music_dir).get_audio_files()
+    if not files:
+        print(f"No audio files found in {music_dir}/")
+        return {}
+    os.makedirs(result_dir, exist_ok=True)
+
+    threads = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+    inst = get_instrumentation()
+    initargs = (threads, sample_rate, decode_cache_dir, inst.enabled, inst.trace_memory)
+    ordered = longest_first(files)
+    names = result_names(files, music_dir)
+    outcomes = []
+    start = time.perf_counter()
+    if workers > 1:
+        pool = BudgetedPool(analyze_recording, workers=workers, initializer=_init_worker, initargs=initargs)
+        tasks = [(path, (path, result_path(names[path], result_dir), stream)) for path in ordered]
+        with thread_environment(threads):
+            for path, result in pool.run(tasks):
+                if result["state"] == "ok":
+                    outcome = result["value"]
+                else:
+                    # The worker died under this file (analyze_recording catches analysis errors)
+                    outcome = (path, f"{result['state']}: {result['error']}", None, result["seconds"])
+                outcomes.append(outcome)
+                print(f"[{len(outcomes)}/{len(files)}] {names[path]}"
+                      + (f": {outcome[1]}" if outcome[1] else f" ({outcome[3]:.1f} s)"))
+    else:
+        _init_worker(*initargs)
+        for path in ordered:
+            print(f"Analyzing {names[path]}...")
+            outcomes.append(analyze_recording(path, result_path(names[path], result_dir), stream))
+    wall = time.perf_counter() - start
+
+    if similarity_index is not None:
+        analyzed = [(path, results) for path, error, results, _ in outcomes if error is None]
+        similarity_index.add_results([names[path] for path, _ in analyzed], [results for _, results in analyzed],
+                                     [file_source(result_path(names[path], result_dir)) for path, _ in analyzed])
+
+    summary = corpus_summary(outcomes, wall, workers, threads, names)
+    with open(os.path.join(result_dir, "audio_summary.json"), 'w') as f:
+        json.dump(summary, f, indent=4)
+
+    if summary["errors"]:
+        print(f"{summary['failed']} file(s) failed:")
+        for filename, error in summary["errors"].items():
+            print(f"  {filename}: {error}")
+    print(f"Analyzed {summary['analyzed']} recording(s), {summary['audio_seconds'] / 60:.1f} min of audio in "
+          f"{wall:.1f} s ({summary['audio_seconds_per_s']:.1f}x real time, {workers} worker(s) x {threads} "
+          f"thread(s))")
+    return summary
+
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Run harmonic and rhythmic analysis on all "
+                                                            "recordings in music/.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1, i.e. sequential)")
+    parser.add_argument("--threads-per-worker", type=int,
+                        help="BLAS/OpenMP/numba threads per worker (default: cores / workers)")
+    parser.add_argument("--music-dir", default="music")
+    parser.add_argument("--result-dir", default="result")
+    parser.add_argument("--sample-rate", type=int, default=22050)
+    parser.add_argument("--stream", action="store_true",
+                        help="Bounded-memory block analysis (soundfile-readable formats only)")
+    parser.add_argument("--decode-cache-dir", help="Cache decoded audio in this directory")
+    parser.add_argument("--similarity-index", metavar="PATH",
+                        help="Also add results to a harmonic similarity index (see similar_recordings.py)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Record per-stage timings in each result and stage totals in the summary")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="With --profile, also record the tracemalloc peak of each stage")
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> Dict[str, Any]:
+    """Command-line entry point; returns the corpus summary."""
+    args = build_parser(prog).parse_args(argv)
+    if args.profile or args.profile_memory:
+        configure(trace_memory=args.profile_memory)
+    similarity_index = None
+    if args.similarity_index:
+        from src.similarity_index import HarmonicSimilarityIndex
+        similarity_index = HarmonicSimilarityIndex(args.similarity_index)
+    return run_audio_analysis(args.music_dir, args.result_dir, workers=args.workers,
+                              threads_per_worker=args.threads_per_worker, sample_rate=args.sample_rate,
+                              stream=args.stream, decode_cache_dir=args.decode_cache_dir,
+                              similarity_index=similarity_index)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+Benchmark suite for the symbolic, audio, training-data, model and inference hot paths.
+
+Each suite runs in a fresh process so its peak RSS is its own. Results are
+written as JSON; --compare flags regressions against a saved baseline.
+
+    python3 benchmarks/run_benchmarks.py --suites symbolic --corpus-size 1000
+    python3 benchmarks/run_benchmarks.py --suites audio --audio-minutes 1 10
+    python3 benchmarks/run_benchmarks.py --suites tokens model --corpus-size 1000
+    python3 benchmarks/run_benchmarks.py --suites inference --inference-batch-sizes 1 8 32
+    python3 benchmarks/run_benchmarks.py --suites slicing --slicing-lengths 1 16 64
+    python3 benchmarks/run_benchmarks.py --output new.json --compare baseline.json
+"""
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import platform
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Ensure src and the generator scripts are importable
+sys.path.append(ROOT)
+
+DEFAULT_CACHE_DIR = os.path.join(ROOT, ".cache", "bench")
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Latency statistics in seconds."""
+    arr = np.asarray(samples, dtype=np.float64)
+    if arr.size == 0:
+        return {"count": 0}
+    return {
+        "count": int(arr.size),
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "max": float(arr.max()),
+        "total": float(arr.sum()),
+    }
+
+def peak_rss_mb() -> float:
+    # ru_maxrss survives the fork+exec that starts a spawned worker, so it would report
+    # the parent's peak; the kernel's per-address-space high-water mark does not
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+# --- Synthetic corpora ------------------------------------------------------------
+
+def synthetic_midi_corpus(size: int, cache_dir: str = DEFAULT_CACHE_DIR) -> List[str]:
+    """
+    Writes (once) a randomized corpus of `size` MIDI files with generate_corpus.py,
+    whose manifest.jsonl holds each file's intended key and Roman numerals.
+    """
+    from generate_corpus import generate_corpus
+    corpus_dir = os.path.join(cache_dir, f"synthetic_{size}")
+    existing = sorted(glob.glob(os.path.join(corpus_dir, "*.mid")))
+    if len(existing) < size or not os.path.exists(os.path.join(corpus_dir, "manifest.jsonl")):
+        generate_corpus(size, corpus_dir, seed=0, workers=min(size // 1000 + 1, os.cpu_count() or 1))
+    return sorted(glob.glob(os.path.join(corpus_dir, "*.mid")))[:size]
+
+def synthetic_audio(minutes: float, cache_dir: str = DEFAULT_CACHE_DIR, sr: int = 22050) -> str:
+    """
+    Renders (once) a `minutes`-long recording of the generate_samples.py progressions
+    as additive sine tones at 120 bpm, written block by block to a wav file.
+    """
+    import soundfile as sf
+    from music21 import pitch
+    import generate_samples
+    path = os.path.join(cache_dir, f"audio_{minutes:g}min.wav")
+    if os.path.exists(path):
+        return path
+    os.makedirs(cache_dir, exist_ok=True)
+    blocks = []
+    for _, _, progression in generate_samples.SAMPLES:
+        for notes, dur in progression:
+            t = np.arange(int(dur * 0.5 * sr)) / sr
+            envelope = np.minimum(1.0, 20 * t) * np.exp(-1.5 * t)
+            tone = sum(np.sin(2 * np.pi * pitch.Pitch(n).frequency * t) for n in notes)
+            blocks.append((0.2 * envelope * tone / len(notes)).astype(np.float32))
+    loop = np.concatenate(blocks)
+    total = int(minutes * 60 * sr)
+    tmp_path = f"{path}.tmp.wav"
+    with sf.SoundFile(tmp_path, 'w', samplerate=sr, channels=1, subtype='FLOAT') as f:
+        written = 0
+        while written < total:
+            chunk = loop[:total - written]
+            f.write(chunk)
+            written += len(chunk)
+    os.replace(tmp_path, path)
+    return path
+
+# --- Suites ---------------------------------------------------------------------------
+
+def bench_symbolic(files: List[str], manifest: Optional[str] = None) -> Dict[str, Any]:
+    """Per-stage latency, plus key and Roman numeral accuracy when a ground-truth manifest is given."""
+    from music21 import converter
+    from src.data_loader import MusicDataLoader
+    from src.harmonic_analysis import HarmonicAnalyzer
+    from generate_corpus import load_manifest, score_results
+    loader = MusicDataLoader()
+    stages: Dict[str, List[float]] = {"load_note_events": [], "parse": [], "key": [], "chordify": [], "rn": []}
+    per_file: List[float] = []
+    results: List[Dict[str, Any]] = []
+    if files:
+        # Warm-up: first-use imports and music21 caches are not what we want to measure
+        HarmonicAnalyzer.analyze(converter.parse(files[0]))
+    start = time.perf_counter()
+    for path in files:
+        t0 = time.perf_counter()
+        loader.load_note_events(path)
+        t1 = time.perf_counter()
+        score = converter.parse(path)
+        t2 = time.perf_counter()
+        k = HarmonicAnalyzer.identify_key(score)
+        t3 = time.perf_counter()
+        chords = HarmonicAnalyzer.get_chord_sequence(score)
+        t4 = time.perf_counter()
+        rn = HarmonicAnalyzer.roman_numerals(chords, k)
+        t5 = time.perf_counter()
+        results.append({"filename": os.path.basename(path), "detected_key": f"{k.tonic.name} {k.mode}",
+                        "roman_numerals": rn})
+        stages["load_note_events"].append(t1 - t0)
+        stages["parse"].append(t2 - t1)
+        stages["key"].append(t3 - t2)
+        stages["chordify"].append(t4 - t3)
+        stages["rn"].append(t5 - t4)
+        per_file.append(t5 - t1)
+    wall = time.perf_counter() - start
+    return {
+        "files": len(files),
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+        "per_file": summarize(per_file),
+        "throughput": {"files_per_s": len(files) / wall if wall else 0.0},
+        "accuracy": score_results(load_manifest(manifest), results) if manifest else None,
+    }
+
+def bench_audio(files: List[str], sr: int = 22050) -> Dict[str, Any]:
+    import librosa
+    from src.audio_analysis import AudioFeatures
+    stages: Dict[str, List[float]] = {"decode": [], "stft": [], "hpss": [], "chroma": [], "tonnetz": [], "beats": []}
+    audio_seconds = 0.0
+    # Warm-up: librosa's lazy imports and numba JIT compilation happen on first use
+    warm = AudioFeatures(np.random.default_rng(0).standard_normal(sr).astype(np.float32) * 0.1, sr)
+    warm.beats
+    warm.tonnetz
+    if files:
+        librosa.load(files[0], sr=sr, duration=1.0)
+    start = time.perf_counter()
+    for path in files:
+        t0 = time.perf_counter()
+        y, _ = librosa.load(path, sr=sr)
+        features = AudioFeatures(y, sr)
+        stages["decode"].append(time.perf_counter() - t0)
+        # Touch the feature graph in dependency order so each stage is timed on its own
+        for stage, node in (("stft", "stft"), ("hpss", "hpss"), ("chroma", "chroma"),
+                            ("tonnetz", "tonnetz"), ("beats", "beats")):
+            t = time.perf_counter()
+            getattr(features, node)
+            stages[stage].append(time.perf_counter() - t)
+        audio_seconds += features.duration
+    wall = time.perf_counter() - start
+    return {
+        "files": len(files),
+        "audio_seconds": audio_seconds,
+        "stages": {name: summarize(samples) for name, samples in stages.items()},
+        "throughput": {"audio_seconds_per_s": audio_seconds / wall if wall else 0.0},
+    }
+
+def bench_model(vocab_size: int = 512, d_model: int = 256, nhead: int = 8, num_layers: int = 4,
+                batch_size: int = 8, seq_len: int = 256, repeats: int = 10) -> Dict[str, Any]:
+    import torch
+    from src.models import MusicTransformer
+    torch.manual_seed(0)
+    model = MusicTransformer(vocab_size, d_model=d_model, nhead=nhead, num_layers=num_layers).eval()
+    src = torch.randint(0, vocab_size, (batch_size, seq_len))
+    tgt = torch.randint(0, vocab_size, (batch_size, seq_len))
+    latencies = []
+    with torch.inference_mode():
+        model(src, tgt)  # warm-up
+        for _ in range(repeats):
+            t = time.perf_counter()
+            model(src, tgt)
+            latencies.append(time.perf_counter() - t)
+    total = sum(latencies)
+    return {
+        "config": {"vocab_size": vocab_size, "d_model": d_model, "nhead": nhead, "num_layers": num_layers,
+                   "batch_size": batch_size, "seq_len": seq_len, "threads": torch.get_num_threads()},
+        "stages": {"forward": summarize(latencies)},
+        "throughput": {"tokens_per_s": repeats * batch_size * seq_len * 2 / total if total else 0.0},
+    }
+
+def bench_tokens(files: List[str], max_len: int = 512, batch_size: int = 32, workers: int = 1,
+                 epochs: int = 3) -> Dict[str, Any]:
+    """Tokenizes a corpus into shards, then measures how fast TokenShardDataset feeds batches."""
+    import tempfile
+    from src.token_dataset import TokenShardDataset
+    from src.tokenizer import write_token_shards
+    with tempfile.TemporaryDirectory() as shard_dir:
+        t = time.perf_counter()
+        meta = write_token_shards(files, shard_dir, workers=workers)
+        write_time = time.perf_counter() - t
+        dataset = TokenShardDataset(shard_dir, max_len=max_len, batch_size=batch_size)
+        latencies = []
+        tokens = 0
+        start = time.perf_counter()
+        for epoch in range(epochs):
+            dataset.set_epoch(epoch)
+            batches = iter(dataset)
+            while True:
+                t = time.perf_counter()
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                latencies.append(time.perf_counter() - t)
+                tokens += batch[0].numel()
+        wall = time.perf_counter() - start
+        padding = dataset.padding_fraction()
+    return {
+        "files": len(files),
+        "config": {"max_len": max_len, "batch_size": batch_size, "workers": workers, "epochs": epochs},
+        "corpus_tokens": meta["num_tokens"],
+        "padding_fraction": padding,
+        "stages": {"write_shards": summarize([write_time]), "batch": summarize(latencies)},
+        "throughput": {"files_per_s": len(files) / write_time if write_time else 0.0,
+                       "tokens_per_s": tokens / wall if wall else 0.0},
+    }
+
+def bench_inference(batch_sizes: List[int], vocab_size: int = 512, d_model: int = 256, nhead: int = 8,
+                    num_layers: int = 4, requests: int = 64, repeats: int = 3) -> Dict[str, Any]:
+    """InferenceSession throughput and parity for fp32, int8 and traced variants at several batch sizes."""
+    import torch
+    from src.inference import InferenceSession
+    from src.models import MusicTransformer
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    model = MusicTransformer(vocab_size, d_model=d_model, nhead=nhead, num_layers=num_layers)
+    reqs = [(rng.integers(1, vocab_size, rng.integers(16, 257)).tolist(),
+             rng.integers(1, vocab_size, rng.integers(8, 129)).tolist()) for _ in range(requests)]
+    variants = {"fp32": {}, "fp32_trace": {"jit": "trace"}, "int8": {"quantize": True},
+                "int8_trace": {"quantize": True, "jit": "trace"}}
+    stages: Dict[str, Dict[str, float]] = {}
+    throughput: Dict[str, float] = {}
+    parity: Dict[str, Dict[str, float]] = {}
+    for variant, options in variants.items():
+        session = InferenceSession(model, **options)
+        parity[variant] = session.check_parity(reqs[:16])
+        for batch_size, stats in session.benchmark(reqs, batch_sizes, repeats).items():
+            stages[f"{variant}/bs{batch_size}"] = {"count": repeats, "mean": stats["mean_ms"] / 1e3,
+                                                   "p50": stats["p50_ms"] / 1e3, "p99": stats["p99_ms"] / 1e3}
+            throughput[f"{variant}/bs{batch_size}_seq_per_s"] = stats["sequences_per_s"]
+    return {
+        "config": {"vocab_size": vocab_size, "d_model": d_model, "nhead": nhead, "num_layers": num_layers,
+                   "requests": requests, "threads": torch.get_num_threads()},
+        "parity": parity,
+        "stages": stages,
+        "throughput": throughput,
+    }
+
+def bench_slicing(files: List[str], lengths: List[int], repeats: int = 3) -> Dict[str, Any]:
+    """
+    chordify() + Roman numerals against onset-grid slicing + Roman numerals on
+    long scores made by joining `length` pieces of the corpus end to end.
+    """
+    from src.data_loader import MusicDataLoader, NoteEvents
+    from src.harmonic_analysis import HarmonicAnalyzer, rn_memo, slice_memo
+    loader = MusicDataLoader()
+    pieces = [loader.load_note_events(path) for path in files]
+    pieces = [events.notes for events in pieces if events is not None and len(events)]
+    k = HarmonicAnalyzer.analyze_events(NoteEvents(pieces[0]))[0]
+    stages: Dict[str, Dict[str, float]] = {}
+    throughput: Dict[str, float] = {}
+    slices_per_score: Dict[str, Dict[str, int]] = {}
+    for length in lengths:
+        parts, start = [], 0.0
+        for i in range(length):
+            notes = pieces[i % len(pieces)].copy()
+            notes['onset'] += start
+            notes['offset'] += start
+            start = float(np.ceil(notes['offset'].max()))
+            parts.append(notes)
+        events = NoteEvents(np.concatenate(parts))
+        score = events.to_stream()
+        chordify_times, slice_times = [], []
+        for _ in range(repeats):
+            rn_memo.clear()
+            t = time.perf_counter()
+            chords = HarmonicAnalyzer.get_chord_sequence(score)
+            HarmonicAnalyzer.roman_numerals(chords, k)
+            chordify_times.append(time.perf_counter() - t)
+            slice_memo.clear()
+            t = time.perf_counter()
+            slices = HarmonicAnalyzer.get_chord_slices(events, merge=False)
+            HarmonicAnalyzer.slice_roman_numerals(slices, k)
+            slice_times.append(time.perf_counter() - t)
+        stages[f"chordify/{len(events)}_notes"] = summarize(chordify_times)
+        stages[f"slice/{len(events)}_notes"] = summarize(slice_times)
+        throughput[f"speedup/{len(events)}_notes"] = float(np.mean(chordify_times) / np.mean(slice_times))
+        slices_per_score[f"{len(events)}_notes"] = {"chordify": len(chords), "slice": len(slices)}
+    return {
+        "files": len(files),
+        "slices": slices_per_score,
+        "stages": stages,
+        "throughput": throughput,
+    }
+
+def _run_suite(name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Child-process entry point: runs one suite and attaches its peak RSS."""
+    func = {"symbolic": bench_symbolic, "audio": bench_audio, "tokens": bench_tokens,
+            "model": bench_model, "inference": bench_inference,
+            "slicing": bench_slicing}[name.split(":")[0]]
+    result = func(**kwargs)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+def run_isolated(name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+        return pool.submit(_run_suite, name, kwargs).result()
+
+# --- Comparison ---------------------------------------------------------------------
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = 0.10) -> List[str]:
+    """
+    Returns human-readable regressions: stage mean latency or peak RSS more than
+    `threshold` above the baseline, or throughput more than `threshold` below it.
+    """
+    regressions = []
+    for suite, cur in current.get("suites", {}).items():
+        base = baseline.get("suites", {}).get(suite)
+        if base is None:
+            continue
+        for stage, stats in cur.get("stages", {}).items():
+            base_stats = base.get("stages", {}).get(stage)
+            if not base_stats or not base_stats.get("mean") or "mean" not in stats:
+                continue
+            ratio = stats["mean"] / base_stats["mean"]
+            if ratio > 1 + threshold:
+                regressions.append(f"{suite}/{stage}: mean {base_stats['mean'] * 1e3:.2f} ms -> "
+                                   f"{stats['mean'] * 1e3:.2f} ms ({ratio:.2f}x)")
+        for metric, value in cur.get("throughput", {}).items():
+            base_value = base.get("throughput", {}).get(metric)
+            if base_value and value < base_value / (1 + threshold):
+                regressions.append(f"{suite}/{metric}: {base_value:.2f} -> {value:.2f}")
+        if base.get("peak_rss_mb") and cur.get("peak_rss_mb", 0) > base["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{suite}/peak_rss_mb: {base['peak_rss_mb']:.1f} -> {cur['peak_rss_mb']:.1f}")
+    return regressions
+
+def library_versions() -> Dict[str, Optional[str]]:
+    versions = {}
+    for module in ("numpy", "music21", "librosa", "torch", "mido", "pretty_midi"):
+        try:
+            versions[module] = __import__(module).__version__
+        except Exception:
+            versions[module] = None
+    return versions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the symbolic, audio, training-data, model and "
+                                                 "inference hot paths.")
+    parser.add_argument("--suites", nargs="+", default=["symbolic", "audio", "tokens", "model"],
+                        choices=["symbolic", "audio", "tokens", "model", "inference", "slicing"])
+    parser.add_argument("--corpus-size", type=int, nargs="*", default=[10],
+                        help="Synthetic MIDI corpus sizes, e.g. 10 1000 10000 (data/*.mid is always included)")
+    parser.add_argument("--audio-minutes", type=float, nargs="*", default=[1],
+                        help="Synthetic recording lengths in minutes, e.g. 1 10 60 (music/ is always included)")
+    parser.add_argument("--model-batch-size", type=int, default=8)
+    parser.add_argument("--model-seq-len", type=int, default=256)
+    parser.add_argument("--inference-batch-sizes", type=int, nargs="+", default=[1, 4, 16, 32],
+                        help="Batch sizes for the inference suite's operating-point report")
+    parser.add_argument("--slicing-lengths", type=int, nargs="+", default=[1, 16, 64],
+                        help="Pieces joined into each score for the slicing suite")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Where synthetic corpora are kept")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results", "latest.json"))
+    parser.add_argument("--compare", metavar="BASELINE", help="Flag regressions against this results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    runs = []
+    if "symbolic" in args.suites:
+        runs.append(("symbolic:data", {"files": sorted(glob.glob(os.path.join(ROOT, "data", "*.mid")))}))
+        for size in args.corpus_size:
+            files = synthetic_midi_corpus(size, args.cache_dir)
+            manifest = os.path.join(os.path.dirname(files[0]), "manifest.jsonl") if files else None
+            runs.append((f"symbolic:synthetic_{size}", {"files": files, "manifest": manifest}))
+    if "audio" in args.suites:
+        music_files = sorted(glob.glob(os.path.join(ROOT, "music", "*")))
+        if music_files:
+            runs.append(("audio:music", {"files": music_files}))
+        for minutes in args.audio_minutes:
+            runs.append((f"audio:synthetic_{minutes:g}min", {"files": [synthetic_audio(minutes, args.cache_dir)]}))
+    if "tokens" in args.suites:
+        for size in args.corpus_size:
+            runs.append((f"tokens:synthetic_{size}", {"files": synthetic_midi_corpus(size, args.cache_dir)}))
+    if "model" in args.suites:
+        runs.append(("model:transformer", {"batch_size": args.model_batch_size, "seq_len": args.model_seq_len}))
+    if "inference" in args.suites:
+        runs.append(("inference:transformer", {"batch_sizes": args.inference_batch_sizes}))
+    if "slicing" in args.suites:
+        runs.append(("slicing:synthetic", {"files": synthetic_midi_corpus(max(args.corpus_size), args.cache_dir),
+                                           "lengths": args.slicing_lengths}))
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "versions": library_versions(),
+        },
+        "suites": {},
+    }
+    for name, kwargs in runs:
+        print(f"Running {name}...")
+        try:
+            results["suites"][name] = run_isolated(name, kwargs)
+        except Exception as e:
+            print(f"Error in {name}: {e}")
+            results["suites"][name] = {"error": str(e)}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    for name, suite in results["suites"].items():
+        if "error" in suite:
+            continue
+        stages = ", ".join(f"{stage} {stats['mean'] * 1e3:.1f} ms" for stage, stats in suite["stages"].items()
+                           if stats.get("count"))
+        print(f"  {name}: {stages}; peak RSS {suite['peak_rss_mb']:.0f} MB")
+        if suite.get("accuracy"):
+            print(f"    key accuracy {suite['accuracy']['key_accuracy']:.1%}, "
+                  f"Roman numeral accuracy {suite['accuracy']['rn_accuracy']:.1%}")
+
+    for name, suite in results["suites"].items():
+        if name.startswith("slicing:") and "error" not in suite:
+            for scale, speedup in suite["throughput"].items():
+                print(f"  {name} {scale.split('/')[1]}: slicing {speedup:.1f}x faster than chordify "
+                      f"({suite['slices'][scale.split('/')[1]]})")
+
+    for name, suite in results["suites"].items():
+        if name.startswith("inference:") and "error" not in suite:
+            print(f"  {name} operating points (sequences/s, p50/p99 ms per batch):")
+            for stage, stats in suite["stages"].items():
+                variant = stage.split("/")[0]
+                print(f"    {stage:<18} {suite['throughput'][stage + '_seq_per_s']:8.1f} seq/s  "
+                      f"p50 {stats['p50'] * 1e3:8.1f}  p99 {stats['p99'] * 1e3:8.1f}  "
+                      f"parity {'ok' if suite['parity'][variant]['ok'] else 'FAILED'}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Unified command-line entry point for the analysis tools.
+
+    python3 cli.py batch [batch_analysis options]
+    python3 cli.py watch [watch_corpus options]
+    python3 cli.py tokenize [prepare_tokens options]
+    python3 cli.py serve [analysis_server options]
+    python3 cli.py search [search_progressions options]
+    python3 cli.py audio music/*.m4a
+    python3 cli.py audio-batch [batch_audio_analysis options]
+    python3 cli.py similar [similar_recordings options]
+    python3 cli.py generate --set historical
+    python3 cli.py infer --src 60 64 67 --max-new-tokens 16
+
+Only the standard library is imported up front. Each subcommand imports its
+dependencies when it runs, so `--help` and symbolic-only runs never load torch
+or librosa. `--profile-startup` reports how long a subcommand took to become
+ready and which heavy libraries it pulled in.
+"""
+import os
+import sys
+import time
+import argparse
+from typing import Callable, List, Optional, Sequence
+
+_CLI_START = time.perf_counter()
+
+HEAVY_MODULES = ('music21', 'pretty_midi', 'pandas', 'librosa', 'torch', 'matplotlib')
+
+def loaded_heavy_modules() -> List[str]:
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+# Each loader does the subcommand's imports and returns the callable that runs it,
+# so import cost can be measured separately from the work itself.
+
+def load_batch(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import batch_analysis
+
+    def run() -> int:
+        errors = batch_analysis.main(extra, prog="cli.py batch")
+        return 1 if errors else 0
+    return run
+
+def load_watch(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import watch_corpus
+
+    def run() -> int:
+        watch_corpus.main(extra, prog="cli.py watch")
+        return 0
+    return run
+
+def load_tokenize(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import prepare_tokens
+
+    def run() -> int:
+        prepare_tokens.main(extra, prog="cli.py tokenize")
+        return 0
+    return run
+
+def load_serve(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    # Workers import the analysis stack themselves; the server process stays light
+    import analysis_server
+
+    def run() -> int:
+        analysis_server.main(extra, prog="cli.py serve")
+        return 0
+    return run
+
+def load_search(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import search_progressions
+
+    def run() -> int:
+        search_progressions.main(extra, prog="cli.py search")
+        return 0
+    return run
+
+def load_audio(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    from src.audio_analysis import AudioAnalyzer
+    from src.cache import DecodedAudioCache
+    from src.instrumentation import configure
+
+    def run() -> int:
+        if args.profile:
+            configure()
+        decode_cache = DecodedAudioCache(args.cache_dir) if args.cache_dir else None
+        analyzer = AudioAnalyzer(sample_rate=args.sample_rate, decode_cache=decode_cache)
+        os.makedirs(args.output_dir, exist_ok=True)
+        failed = 0
+        for file_path in args.files:
+            print(f"Analyzing {os.path.basename(file_path)}...")
+            if args.stream:
+                results = analyzer.analyze_stream(file_path)
+            else:
+                results = analyzer.analyze_file(file_path)
+            if "error" in results:
+                print(f"Error analyzing {file_path}: {results['error']}")
+                failed += 1
+                continue
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            analyzer.save_analysis(results, os.path.join(args.output_dir, f"{base_name}_audio_result.json"))
+            print(f"  {results['estimated_key_root']} {results['estimated_mode']}, "
+                  f"{results['tempo']:.1f} BPM, {results['duration']:.1f} s")
+        return 1 if failed else 0
+    return run
+
+def load_audio_batch(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import batch_audio_analysis
+
+    def run() -> int:
+        summary = batch_audio_analysis.main(extra, prog="cli.py audio-batch")
+        return 1 if summary.get("failed") else 0
+    return run
+
+def load_similar(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import similar_recordings
+
+    def run() -> int:
+        similar_recordings.main(extra, prog="cli.py similar")
+        return 0
+    return run
+
+def load_generate(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import generate_samples
+    import generate_historical_samples
+
+    def run() -> int:
+        if args.set in ("basic", "all"):
+            generate_samples.main(args.output_dir)
+        if args.set in ("historical", "all"):
+            generate_historical_samples.main(args.output_dir)
+        return 0
+    return run
+
+def load_infer(args: argparse.Namespace, extra: List[str]) -> Callable[[], int]:
+    import torch
+    from src.models import GenerativeModelFactory
+
+    def run() -> int:
+        torch.manual_seed(args.seed)
+        model = GenerativeModelFactory.create_model("transformer", vocab_size=args.vocab_size,
+                                                    d_model=args.d_model, nhead=args.nhead,
+                                                    num_layers=args.num_layers)
+        if args.checkpoint:
+            model.load_state_dict(torch.load(args.checkpoint, map_location="cpu"))
+        src = torch.tensor([args.src], dtype=torch.long)
+        generator = torch.Generator().manual_seed(args.seed) if args.sample else None
+        tokens = model.generate(src, args.max_new_tokens, bos_token_id=args.bos, eos_token_id=args.eos,
+                                do_sample=args.sample, temperature=args.temperature, top_k=args.top_k,
+                                generator=generator)
+        print(" ".join(str(t) for t in tokens[0].tolist()))
+        return 0
+    return run
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--profile-startup", action="store_true", default=argparse.SUPPRESS,
+                        help="Report subcommand startup time and the heavy libraries it imported")
+
+    parser = argparse.ArgumentParser(prog="cli.py", description="Tonal Semantics analysis tools.",
+                                     parents=[common])
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+    subparsers.required = True
+
+    # Options are forwarded to batch_analysis, whose parser also serves `batch --help`
+    batch = subparsers.add_parser("batch", parents=[common], add_help=False,
+                                  help="Symbolic harmonic analysis of a MIDI corpus (see batch_analysis.py)")
+    batch.set_defaults(loader=load_batch)
+
+    watch = subparsers.add_parser("watch", parents=[common], add_help=False,
+                                  help="Keep outputs in sync with a changing corpus (see watch_corpus.py)")
+    watch.set_defaults(loader=load_watch)
+
+    tokenize = subparsers.add_parser("tokenize", parents=[common], add_help=False,
+                                     help="Tokenize a MIDI corpus into training shards (see prepare_tokens.py)")
+    tokenize.set_defaults(loader=load_tokenize)
+
+    serve = subparsers.add_parser("serve", parents=[common], add_help=False,
+                                  help="Serve analysis requests from warm workers (see analysis_server.py)")
+    serve.set_defaults(loader=load_serve)
+
+    search = subparsers.add_parser("search", parents=[common], add_help=False,
+                                   help="Index and search Roman numeral progressions (see search_progressions.py)")
+    search.set_defaults(loader=load_search)
+
+    audio = subparsers.add_parser("audio", parents=[common], help="Harmonic and rhythmic analysis of audio files")
+    audio.add_argument("files", nargs="+")
+    audio.add_argument("--output-dir", default="result")
+    audio.add_argument("--sample-rate", type=int, default=22050)
+    audio.add_argument("--stream", action="store_true",
+                       help="Bounded-memory block analysis (soundfile-readable formats only)")
+    audio.add_argument("--cache-dir", help="Cache decoded audio in this directory")
+    audio.add_argument("--profile", action="store_true", help="Add per-stage timings to each result")
+    audio.set_defaults(loader=load_audio)
+
+    audio_batch = subparsers.add_parser("audio-batch", parents=[common], add_help=False,
+                                        help="Parallel analysis of a recording collection "
+                                             "(see batch_audio_analysis.py)")
+    audio_batch.set_defaults(loader=load_audio_batch)
+
+    similar = subparsers.add_parser("similar", parents=[common], add_help=False,
+                                    help="Find harmonically similar recordings (see similar_recordings.py)")
+    similar.set_defaults(loader=load_similar)
+
+    generate = subparsers.add_parser("generate", parents=[common], help="Write the sample MIDI corpus")
+    generate.add_argument("--set", choices=("basic", "historical", "all"), default="all")
+    generate.add_argument("--output-dir", default="data")
+    generate.set_defaults(loader=load_generate)
+
+    infer = subparsers.add_parser("infer", parents=[common], help="Generate tokens with a MusicTransformer")
+    infer.add_argument("--src", type=int, nargs="+", required=True, help="Source token ids")
+    infer.add_argument("--checkpoint", help="state_dict to load (random weights otherwise)")
+    infer.add_argument("--vocab-size", type=int, default=128)
+    infer.add_argument("--d-model", type=int, default=512)
+    infer.add_argument("--nhead", type=int, default=8)
+    infer.add_argument("--num-layers", type=int, default=6)
+    infer.add_argument("--max-new-tokens", type=int, default=32)
+    infer.add_argument("--bos", type=int, default=0)
+    infer.add_argument("--eos", type=int)
+    infer.add_argument("--sample", action="store_true", help="Sample instead of greedy decoding")
+    infer.add_argument("--temperature", type=float, default=1.0)
+    infer.add_argument("--top-k", type=int)
+    infer.add_argument("--seed", type=int, default=0)
+    infer.set_defaults(loader=load_infer)
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra and args.command not in ("batch", "watch", "tokenize", "serve", "search", "audio-batch", "similar"):
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    parsed = time.perf_counter()
+    run = args.loader(args, extra)
+    ready = time.perf_counter()
+    if getattr(args, "profile_startup", False):
+        print(f"[startup] {args.command}: ready in {ready - _CLI_START:.3f} s "
+              f"(argument parsing {parsed - _CLI_START:.3f} s, imports {ready - parsed:.3f} s); "
+              f"heavy modules: {', '.join(loaded_heavy_modules()) or 'none'}", file=sys.stderr)
+    status = run()
+    if getattr(args, "profile_startup", False):
+        print(f"[startup] {args.command}: finished in {time.perf_counter() - _CLI_START:.3f} s", file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
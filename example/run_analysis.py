@@ -8,6 +8,7 @@ import numpy as np
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from src.audio_analysis import AudioAnalyzer
+from src.cache import DecodedAudioCache
 
 def main():
     # Configuration
@@ -22,16 +23,18 @@ def main():
         print(f"Error: Input file not found at {input_file}")
         return
 
-    # Initialize Analyzer
-    analyzer = AudioAnalyzer()
+    # Initialize Analyzer (decoded PCM is cached so reruns skip ffmpeg and resampling)
+    cache_dir = os.path.join(os.path.dirname(__file__), "..", ".cache", "audio")
+    analyzer = AudioAnalyzer(decode_cache=DecodedAudioCache(cache_dir))
     
-    # Run Analysis
+    # Run Analysis (the feature graph is kept so plotting reuses its chromagram)
     print("Running harmonic and rhythmic analysis...")
-    results = analyzer.analyze_file(input_file)
-    
-    if "error" in results:
-        print(results["error"])
+    try:
+        features = analyzer.extract_features(input_file)
+    except Exception as e:
+        print(f"Could not load audio file: {e}")
         return
+    results = analyzer.analyze_features(features)
 
     # Save JSON results
     print(f"Saving JSON results to {json_output_path}")
@@ -40,9 +43,9 @@ def main():
     # Generate Visualizations
     print("Generating visualizations...")
     try:
-        y, sr = librosa.load(input_file, sr=22050)
-        chroma = librosa.feature.chroma_cqt(y=y, sr=sr)
-        
+        y, sr = features.y, features.sr
+        chroma = features.chroma
+
         plt.figure(figsize=(10, 8))
         
         # Subplot 1: Waveform
@@ -0,0 +1,281 @@
+import os
+import json
+import argparse
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import mido
+import numpy as np
+from generate_samples import SAMPLES
+from generate_historical_samples import HISTORICAL_SAMPLES
+
+TICKS_PER_BEAT = 480
+
+# Ways of filling one bar with chords, in quarter notes, per meter
+BAR_PATTERNS = {
+    '2/4': [[2.0], [1.0, 1.0]],
+    '3/4': [[3.0], [2.0, 1.0], [1.0, 2.0], [1.0, 1.0, 1.0]],
+    '4/4': [[4.0], [2.0, 2.0], [2.0, 1.0, 1.0], [1.0, 1.0, 2.0], [1.0, 1.0, 1.0, 1.0]],
+    '6/8': [[3.0], [1.5, 1.5]],
+}
+
+# Tonic spellings per pitch class, as music21 names them in batch_analysis results
+MAJOR_TONICS = ['C', 'D-', 'D', 'E-', 'E', 'F', 'F#', 'G', 'A-', 'A', 'B-', 'B']
+MINOR_TONICS = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']
+
+# A note as written: (onset, duration) in quarter notes, MIDI pitch, velocity
+Note = Tuple[float, float, int, int]
+
+def mido_key_name(tonic_pc: int, mode: str) -> str:
+    if mode == 'minor':
+        return MINOR_TONICS[tonic_pc].replace('-', 'b') + 'm'
+    return MAJOR_TONICS[tonic_pc].replace('-', 'b')
+
+def key_label(tonic_pc: int, mode: str) -> str:
+    """Key in batch_analysis' "detected_key" format, e.g. "E- major"."""
+    return f"{(MINOR_TONICS if mode == 'minor' else MAJOR_TONICS)[tonic_pc]} {mode}"
+
+def write_midi(path: str, parts: Sequence[Sequence[Note]], time_sig: str, tonic_pc: int, mode: str,
+               bpm: float = 120.0):
+    """
+    Writes a type 1 MIDI file straight from note lists with mido: a conductor
+    track with the time signature, key signature and tempo, then one track per part.
+    """
+    numerator, denominator = (int(x) for x in time_sig.split('/'))
+    mid = mido.MidiFile(type=1, ticks_per_beat=TICKS_PER_BEAT)
+    conductor = mido.MidiTrack([
+        mido.MetaMessage('time_signature', numerator=numerator, denominator=denominator, time=0),
+        mido.MetaMessage('key_signature', key=mido_key_name(tonic_pc, mode), time=0),
+        mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(bpm), time=0),
+    ])
+    mid.tracks.append(conductor)
+    for channel, notes in enumerate(parts):
+        events = []
+        for onset, duration, pitch, velocity in notes:
+            start = int(round(onset * TICKS_PER_BEAT))
+            end = int(round((onset + duration) * TICKS_PER_BEAT))
+            # Note-offs sort before note-ons at the same tick, so repeated notes re-attack
+            events.append((end, 0, pitch, 0))
+            events.append((start, 1, pitch, velocity))
+        events.sort()
+        track = mido.MidiTrack()
+        tick = 0
+        for t, is_on, pitch, velocity in events:
+            track.append(mido.Message('note_on' if is_on else 'note_off', channel=channel % 16, note=pitch,
+                                      velocity=velocity, time=t - tick))
+            tick = t
+        mid.tracks.append(track)
+    mid.save(path)
+
+def build_templates() -> Dict[str, Any]:
+    """
+    Turns the hand-written samples into transposable templates with ground truth.
+
+    Progression templates (generate_samples.SAMPLES) become lists of chords, each a
+    Roman numeral figure plus its pitches in semitones above the tonic. Historical
+    templates (generate_historical_samples.HISTORICAL_SAMPLES) keep their parts
+    relative to the tonic; their Roman numerals are what the analysis path
+    (MIDI -> music21 -> chordify) labels the untransposed template with in its
+    declared key.
+    """
+    from music21 import chord, converter, key, pitch
+    from src.harmonic_analysis import HarmonicAnalyzer
+
+    progressions: Dict[str, List[List[Tuple[str, List[int]]]]] = {"major": [], "minor": []}
+    for _, k_str, progression in SAMPLES:
+        k = key.Key(k_str)
+        tonic_midi = 60 + k.tonic.pitchClass
+        chords = []
+        for notes, _ in progression:
+            c = chord.Chord(notes)
+            figure = HarmonicAnalyzer.roman_numerals([c], k)[0]
+            chords.append((figure, sorted(p.midi - tonic_midi for p in c.pitches)))
+        progressions[k.mode].append(chords)
+
+    historical = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, parts_data, time_sig, key_sig in HISTORICAL_SAMPLES:
+            k = key.Key(key_sig or 'C')
+            tonic_midi = 60 + k.tonic.pitchClass
+            parts = []
+            for part_notes in parts_data:
+                offset = 0.0
+                notes = []
+                for n_str, dur in part_notes:
+                    if n_str != 'r':
+                        notes.append((offset, float(dur), pitch.Pitch(n_str).midi - tonic_midi))
+                    offset += dur
+                parts.append(notes)
+            path = os.path.join(tmp, f"{name}.mid")
+            write_midi(path, [[(o, d, rel + tonic_midi, 90) for o, d, rel in p] for p in parts],
+                       time_sig, k.tonic.pitchClass, k.mode)
+            chords = HarmonicAnalyzer.get_chord_sequence(converter.parse(path))
+            length = max(o + d for p in parts for o, d, _ in p)
+            historical.append({"name": name, "parts": parts, "time_sig": time_sig, "mode": k.mode,
+                               "tonic_pc": k.tonic.pitchClass, "length": length,
+                               "roman_numerals": HarmonicAnalyzer.roman_numerals(chords, k)})
+    return {"progressions": progressions, "historical": historical}
+
+def _bar_durations(rng: np.random.Generator, n_chords: int, time_sig: str) -> List[float]:
+    """Chord durations that never cross a barline; the last chord fills its bar."""
+    patterns = BAR_PATTERNS[time_sig]
+    durations: List[float] = []
+    while len(durations) < n_chords:
+        pattern = patterns[rng.integers(len(patterns))]
+        take = min(len(pattern), n_chords - len(durations))
+        bar = list(pattern[:take])
+        bar[-1] += sum(pattern[take:])
+        durations.extend(bar)
+    return durations
+
+def generate_progression(rng: np.random.Generator, templates: Dict[str, Any], max_phrases: int,
+                         substitution: float = 0.3) -> Dict[str, Any]:
+    """A random progression: phrases drawn from one mode's templates with some inner chords substituted."""
+    mode = 'minor' if rng.random() < 0.4 else 'major'
+    phrases = templates["progressions"][mode]
+    pool = [c for phrase in phrases for c in phrase]
+    chords: List[Tuple[str, List[int]]] = []
+    for _ in range(int(rng.integers(1, max_phrases + 1))):
+        phrase = list(phrases[rng.integers(len(phrases))])
+        for i in range(1, len(phrase) - 1):
+            if rng.random() < substitution:
+                phrase[i] = pool[rng.integers(len(pool))]
+        chords.extend(phrase)
+
+    tonic_pc = int(rng.integers(12))
+    time_sig = list(BAR_PATTERNS)[rng.integers(len(BAR_PATTERNS))]
+    durations = _bar_durations(rng, len(chords), time_sig)
+    notes: List[Note] = []
+    onset = 0.0
+    for (_, rel), duration in zip(chords, durations):
+        velocity = int(rng.integers(60, 101))
+        # Place the bass of every voicing between E2 and D#3
+        bass = rel[0]
+        base = 60 + tonic_pc - 12 * ((60 + tonic_pc + bass - 40) // 12)
+        # Random voicing: upper voices may move up an octave, the bass stays put so the figure holds
+        upper = sorted({r + 12 * int(rng.integers(0, 2)) for r in rel[1:]})
+        for r in [bass] + upper:
+            notes.append((onset, duration, base + r, velocity))
+        onset += duration
+    return {"parts": [notes], "time_sig": time_sig, "tonic_pc": tonic_pc, "mode": mode,
+            "roman_numerals": [figure for figure, _ in chords], "template": f"progression_{mode}"}
+
+def generate_historical(rng: np.random.Generator, templates: Dict[str, Any], max_repeats: int) -> Dict[str, Any]:
+    """A historical template transposed to a random key and repeated."""
+    template = templates["historical"][rng.integers(len(templates["historical"]))]
+    shift = int(rng.integers(-5, 7))
+    tonic_pc = (template["tonic_pc"] + shift) % 12
+    tonic_midi = 60 + template["tonic_pc"] + shift
+    repeats = int(rng.integers(1, max_repeats + 1))
+    velocity = int(rng.integers(60, 101))
+    parts = [[(o + r * template["length"], d, tonic_midi + rel, velocity) for r in range(repeats) for o, d, rel in p]
+             for p in template["parts"]]
+    return {"parts": parts, "time_sig": template["time_sig"], "tonic_pc": tonic_pc, "mode": template["mode"],
+            "roman_numerals": template["roman_numerals"] * repeats, "template": template["name"]}
+
+_templates: Optional[Dict[str, Any]] = None
+
+def _init_worker(templates: Dict[str, Any]):
+    global _templates
+    _templates = templates
+
+def _generate_range(start: int, stop: int, seed: int, output_dir: str, prefix: str, width: int,
+                    max_phrases: int, max_repeats: int, historical_share: float) -> List[Dict[str, Any]]:
+    """Worker: writes files start..stop-1. File i depends only on (seed, i), never on scheduling."""
+    rows = []
+    for i in range(start, stop):
+        rng = np.random.default_rng([seed, i])
+        if rng.random() < historical_share:
+            piece = generate_historical(rng, _templates, max_repeats)
+        else:
+            piece = generate_progression(rng, _templates, max_phrases)
+        bpm = float(rng.integers(60, 161))
+        filename = f"{prefix}_{i:0{width}d}.mid"
+        write_midi(os.path.join(output_dir, filename), piece["parts"], piece["time_sig"],
+                   piece["tonic_pc"], piece["mode"], bpm)
+        rows.append({"filename": filename, "template": piece["template"],
+                     "key": key_label(piece["tonic_pc"], piece["mode"]), "time_signature": piece["time_sig"],
+                     "tempo": bpm, "roman_numerals": piece["roman_numerals"]})
+    return rows
+
+def generate_corpus(count: int, output_dir: str, seed: int = 0, workers: int = 1, prefix: str = "synth",
+                    max_phrases: int = 4, max_repeats: int = 4, historical_share: float = 0.3,
+                    chunk: int = 256) -> str:
+    """
+    Writes count randomized MIDI files to output_dir plus manifest.jsonl, one
+    ground-truth row per file (intended key and Roman numeral sequence), in file
+    order. The output is identical for a given seed whatever the number of workers.
+    Returns the manifest path.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    templates = build_templates()
+    width = max(6, len(str(max(count - 1, 0))))
+    ranges = [(s, min(s + chunk, count)) for s in range(0, count, chunk)]
+    args = (seed, output_dir, prefix, width, max_phrases, max_repeats, historical_share)
+    manifest_path = os.path.join(output_dir, "manifest.jsonl")
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(templates,)) as pool:
+                futures = [pool.submit(_generate_range, s, e, *args) for s, e in ranges]
+                for future in futures:
+                    f.writelines(json.dumps(row) + "\n" for row in future.result())
+        else:
+            _init_worker(templates)
+            for s, e in ranges:
+                f.writelines(json.dumps(row) + "\n" for row in _generate_range(s, e, *args))
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+def load_manifest(manifest_path: str) -> Dict[str, Dict[str, Any]]:
+    """Ground-truth rows keyed by file name."""
+    with open(manifest_path, 'r') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return {row["filename"]: row for row in rows}
+
+def tonic_pitch_class(name: str) -> int:
+    """Pitch class of a music21 tonic name such as "E-" or "C#"."""
+    return ("C D EF G A B".index(name[0].upper()) + name.count('#') - name.count('-')) % 12
+
+def same_key(a: str, b: str) -> bool:
+    """Whether two "tonic mode" labels name the same key, so "D- major" matches "C# major"."""
+    (tonic_a, mode_a), (tonic_b, mode_b) = a.split(' '), b.split(' ')
+    return mode_a == mode_b and tonic_pitch_class(tonic_a) == tonic_pitch_class(tonic_b)
+
+def score_results(manifest: Dict[str, Dict[str, Any]], results: Sequence[Dict[str, Any]]) -> Dict[str, float]:
+    """
+    Accuracy of batch_analysis result dicts against the manifest: the share of
+    files whose detected key is the intended key (enharmonic spellings count as
+    the same key), and of Roman numerals that match the intended sequence
+    position by position (over the longer sequence).
+    """
+    key_hits = rn_hits = rn_total = files = 0
+    for result in results:
+        truth = manifest.get(result["filename"])
+        if truth is None:
+            continue
+        files += 1
+        key_hits += same_key(result["detected_key"], truth["key"])
+        expected, actual = truth["roman_numerals"], result["roman_numerals"]
+        rn_hits += sum(a == b for a, b in zip(expected, actual))
+        rn_total += max(len(expected), len(actual))
+    return {"files": files, "key_accuracy": key_hits / files if files else 0.0,
+            "rn_accuracy": rn_hits / rn_total if rn_total else 0.0}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a large randomized MIDI corpus with a ground-truth manifest.")
+    parser.add_argument("count", type=int, help="Number of files to write")
+    parser.add_argument("--output-dir", default=os.path.join("data", "synthetic"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--prefix", default="synth")
+    parser.add_argument("--max-phrases", type=int, default=4, help="Progression length, in template phrases")
+    parser.add_argument("--max-repeats", type=int, default=4, help="Repetitions of a historical template")
+    parser.add_argument("--historical-share", type=float, default=0.3,
+                        help="Share of files built from the historical templates")
+    args = parser.parse_args()
+    path = generate_corpus(args.count, args.output_dir, seed=args.seed, workers=args.workers, prefix=args.prefix,
+                           max_phrases=args.max_phrases, max_repeats=args.max_repeats,
+                           historical_share=args.historical_share)
+    print(f"Wrote {args.count} files and {path}")
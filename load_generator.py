@@ -0,0 +1,180 @@
+"""
+Load generator for analysis_server.py.
+
+    python3 load_generator.py --rate 20 --duration 30 data/*.mid
+    python3 load_generator.py --concurrency 8 --requests 500 --kind audio music/*.m4a
+
+Open loop (--rate) sends requests on a fixed schedule whatever the latency,
+which is what steady upstream traffic looks like; closed loop (--concurrency)
+keeps N requests outstanding. Reports throughput, latency percentiles and
+refused (503) requests, and compares the p99 latency with the server-reported
+analysis time of the same requests.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from analysis_server import percentiles
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection to the server (TCP or Unix socket)."""
+
+    def __init__(self, host: str, port: int, unix: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.unix = unix
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, Dict[str, Any]]:
+        if self.writer is None:
+            if self.unix:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.unix)
+            else:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split(b" ", 2)[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+class LoadStats:
+    def __init__(self):
+        self.latency: List[float] = []
+        self.analysis: List[float] = []
+        self.statuses: Dict[int, int] = {}
+
+    def record(self, status: int, latency: float, response: Dict[str, Any]):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == 200:
+            self.latency.append(latency)
+            self.analysis.append(response["server_timing"]["analysis_ms"] / 1e3)
+
+async def _send(conn: Connection, pool: "asyncio.Queue[Connection]", stats: LoadStats, path: str, kind: str,
+                stream: bool):
+    start = time.perf_counter()
+    try:
+        status, response = await conn.request("POST", f"/analyze/{kind}", {"path": path, "stream": stream})
+    except (ConnectionError, asyncio.IncompleteReadError) as e:
+        conn.close()
+        status, response = 0, {"error": str(e)}
+    stats.record(status, time.perf_counter() - start, response)
+    pool.put_nowait(conn)
+
+async def run_load(files: Sequence[str], kind: str = "symbolic", rate: Optional[float] = None,
+                   concurrency: int = 8, duration: float = 10.0, requests: Optional[int] = None,
+                   stream: bool = False, host: str = "127.0.0.1", port: int = 8765,
+                   unix: Optional[str] = None, seed: int = 0) -> Dict[str, Any]:
+    """
+    Drives the server and returns the load report. With a rate, requests are
+    sent open loop at that many per second (connections are opened as needed);
+    otherwise `concurrency` requests are kept outstanding. Runs for `duration`
+    seconds or until `requests` requests were sent.
+    """
+    rng = random.Random(seed)
+    stats = LoadStats()
+    pool: "asyncio.Queue[Connection]" = asyncio.Queue()
+    connections = [Connection(host, port, unix) for _ in range(concurrency)]
+    for conn in connections:
+        pool.put_nowait(conn)
+    tasks: List[asyncio.Task] = []
+    start = time.perf_counter()
+    sent = 0
+    while (requests is None or sent < requests) and time.perf_counter() - start < duration:
+        if rate:
+            delay = start + sent / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if pool.empty():
+                # Open loop: never wait for a connection, the schedule must hold
+                connections.append(Connection(host, port, unix))
+                pool.put_nowait(connections[-1])
+        conn = await pool.get()
+        tasks = [t for t in tasks if not t.done()]
+        tasks.append(asyncio.ensure_future(_send(conn, pool, stats, rng.choice(files), kind, stream)))
+        sent += 1
+    if tasks:
+        await asyncio.wait(tasks)
+    elapsed = time.perf_counter() - start
+
+    metrics_conn = Connection(host, port, unix)
+    _, server_metrics = await metrics_conn.request("GET", "/metrics")
+    metrics_conn.close()
+    for conn in connections:
+        conn.close()
+
+    latency = percentiles(stats.latency)
+    analysis = percentiles(stats.analysis)
+    return {
+        "sent": sent,
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(stats.latency) / elapsed if elapsed else 0.0,
+        "statuses": stats.statuses,
+        "latency_ms": latency,
+        "analysis_ms": analysis,
+        "p99_over_mean_analysis": latency["p99"] / analysis["mean"] if analysis["mean"] else 0.0,
+        "server": server_metrics,
+    }
+
+def print_report(report: Dict[str, Any]):
+    latency, analysis = report["latency_ms"], report["analysis_ms"]
+    print(f"Sent {report['sent']} requests in {report['elapsed_s']:.1f} s "
+          f"({report['throughput_per_s']:.1f} ok/s); statuses: "
+          + ", ".join(f"{status}: {n}" for status, n in sorted(report["statuses"].items())))
+    print(f"  latency   mean {latency['mean']:8.1f} ms  p50 {latency['p50']:8.1f} ms  "
+          f"p95 {latency['p95']:8.1f} ms  p99 {latency['p99']:8.1f} ms")
+    print(f"  analysis  mean {analysis['mean']:8.1f} ms  p50 {analysis['p50']:8.1f} ms  "
+          f"p95 {analysis['p95']:8.1f} ms  p99 {analysis['p99']:8.1f} ms")
+    print(f"  p99 latency is {report['p99_over_mean_analysis']:.1f}x the mean analysis time")
+    server = report["server"]
+    for name, kind in server["kinds"].items():
+        if kind["completed"] or kind["failed"] or kind["rejected"]:
+            print(f"  server {name}: {kind['completed']} ok, {kind['failed']} failed, {kind['rejected']} refused, "
+                  f"mean batch {kind['mean_batch_size']:.2f}, queue wait p99 {kind['queue_wait_ms']['p99']:.1f} ms")
+
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Drive analysis_server.py with a steady request load.")
+    parser.add_argument("files", nargs="+", help="Files to request (picked at random)")
+    parser.add_argument("--kind", choices=("symbolic", "audio"), default="symbolic")
+    parser.add_argument("--stream", action="store_true", help="Audio: use bounded-memory streaming analysis")
+    parser.add_argument("--rate", type=float, help="Open loop: requests per second")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Closed loop: outstanding requests (open loop: initial connections)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="Connect to a Unix socket instead of TCP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the report as JSON")
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None) -> Dict[str, Any]:
+    args = build_parser(prog).parse_args(argv)
+    report = asyncio.run(run_load(args.files, kind=args.kind, rate=args.rate, concurrency=args.concurrency,
+                                  duration=args.duration, requests=args.requests, stream=args.stream,
+                                  host=args.host, port=args.port, unix=args.unix, seed=args.seed))
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import os
+import argparse
+from typing import Optional, Sequence
+from src.data_loader import MusicDataLoader
+from src.tokenizer import RemiTokenizer, write_token_shards
+
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Tokenize a MIDI corpus into uint16 shards "
+                                                            "for MusicTransformer training.")
+    parser.add_argument("--data-dir", default="data", help="Searched recursively for .mid files")
+    parser.add_argument("--out-dir", default=os.path.join("data", "tokens"))
+    parser.add_argument("--workers", type=int, default=1, help="Number of tokenizer processes")
+    parser.add_argument("--shard-tokens", type=int, default=1 << 22, help="Tokens per shard file")
+    parser.add_argument("--resolution", type=int, default=12, help="Time steps per quarter note")
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None):
+    args = build_parser(prog).parse_args(argv)
+    files = sorted(MusicDataLoader(args.data_dir).get_files_by_extension(".mid"))
+    if not files:
+        print(f"No MIDI files found in {args.data_dir}/")
+        return
+    tokenizer = RemiTokenizer(resolution=args.resolution)
+    meta = write_token_shards(files, args.out_dir, tokenizer, workers=args.workers, shard_tokens=args.shard_tokens)
+    print(f"Wrote {meta['num_tokens']} tokens from {len(meta['files'])} of {len(files)} files "
+          f"into {meta['num_shards']} shard(s) in {args.out_dir}/ (vocabulary {meta['vocab_size']})")
+
+if __name__ == "__main__":
+    main()
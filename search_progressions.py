@@ -0,0 +1,72 @@
+import os
+import argparse
+from typing import Optional, Sequence
+from src.progression_index import ProgressionIndex, style_of, styles_from_manifest
+
+DEFAULT_INDEX = os.path.join("result", "progression_index")
+
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Index and search Roman numeral progressions "
+                                                            "in batch_analysis results.")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="Index directory")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    update = commands.add_parser("update", help="Index new or changed results and drop deleted ones")
+    update.add_argument("--result-dir", default="result")
+    update.add_argument("--styles", metavar="MANIFEST",
+                        help="Take styles from a generate_corpus manifest.jsonl (its \"template\" field)")
+    update.add_argument("--max-n", type=int, default=4, help="Longest indexed n-gram (new index only)")
+    update.add_argument("--strip-inversions", action="store_true",
+                        help="Key chords by numeral and quality only (new index only)")
+    update.add_argument("--transpose", action="store_true",
+                        help="Key n-grams by root intervals, so any transposition matches (new index only)")
+
+    query = commands.add_parser("query", help="Find a progression, e.g. \"ii V I\", \"ii * I\" or \"IV ... V I\"")
+    query.add_argument("pattern", nargs="+", help="Chords; * matches any chord, ... skips up to --max-gap chords")
+    query.add_argument("--max-gap", type=int, default=4)
+    query.add_argument("--limit", type=int, default=20, help="Matches to print")
+
+    stats = commands.add_parser("stats", help="Most frequent n-grams per style")
+    stats.add_argument("--n", type=int, default=3)
+    stats.add_argument("--top", type=int, default=10)
+    stats.add_argument("--style", help="Only this style")
+    stats.add_argument("--overall", action="store_true", help="Over the whole index instead of per style")
+
+    commands.add_parser("compact", help="Merge all segments into one")
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None):
+    args = build_parser(prog).parse_args(argv)
+    if args.command == "update":
+        index = ProgressionIndex(args.index, max_n=args.max_n, strip_inversions=args.strip_inversions,
+                                 transpose=args.transpose)
+        style = styles_from_manifest(args.styles) if args.styles else style_of
+        summary = index.update_from_dir(args.result_dir, style)
+        print(f"Indexed {summary['indexed']}, removed {summary['removed']}, unchanged {summary['unchanged']} "
+              f"({len(index)} files in {args.index})")
+        return
+
+    if not os.path.exists(os.path.join(args.index, "meta.json")):
+        print(f"No progression index at {args.index}; run `update` first")
+        return
+    index = ProgressionIndex(args.index)
+    if args.command == "query":
+        pattern = " ".join(args.pattern)
+        counts = index.count(pattern, args.max_gap)
+        print(f"{counts['matches']} match(es) in {counts['files']} file(s)")
+        for match in index.search(pattern, args.max_gap, limit=args.limit):
+            print(f"  {match['filename']} [{match['style']}] chords {match['start']}-{match['end'] - 1}: "
+                  f"{' -> '.join(match['figures'])}")
+    elif args.command == "stats":
+        report = index.ngram_stats(args.n, top=args.top, by_style=not args.overall, style=args.style)
+        for style, rows in report.items():
+            print(f"{style}:")
+            for ngram, count, share in rows:
+                print(f"  {ngram:<32} {count:8d}  {share:6.1%}")
+    elif args.command == "compact":
+        index.compact()
+        print(f"Compacted {args.index} ({len(index)} files)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import os
+import argparse
+from typing import Optional, Sequence
+from src.similarity_index import HarmonicSimilarityIndex
+
+DEFAULT_INDEX = os.path.join("result", "similarity_index")
+
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Index audio results by their chroma and tonnetz "
+                                                            "means and find harmonically similar recordings.")
+    parser.add_argument("--index", default=DEFAULT_INDEX, help="Index directory")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.required = True
+
+    update = commands.add_parser("update", help="Index the *_audio_result.json files and drop deleted ones")
+    update.add_argument("--result-dir", default="result")
+    update.add_argument("--tonnetz-weight", type=float, default=0.3,
+                        help="Share of tonnetz in the similarity, 0-1 (new index only)")
+
+    query = commands.add_parser("query", help="Recordings most similar to an indexed one")
+    query.add_argument("name", help="Recording name (its audio result file name without _audio_result.json)")
+    query.add_argument("--k", type=int, default=50)
+    query.add_argument("--nprobe", type=int, default=16,
+                       help="Partitions to scan in a partitioned index (0 scans everything); "
+                            "more partitions are slower but miss fewer neighbours")
+    query.add_argument("--no-transpose", action="store_true", help="Only match in the same key")
+
+    partition = commands.add_parser("partition", help="Train the approximate partitioned layer (k-means lists)")
+    partition.add_argument("--lists", type=int, help="Number of lists (default: sqrt of the index size)")
+    partition.add_argument("--iterations", type=int, default=10)
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None):
+    args = build_parser(prog).parse_args(argv)
+    if args.command == "update":
+        index = HarmonicSimilarityIndex(args.index, tonnetz_weight=args.tonnetz_weight)
+        summary = index.update_from_dir(args.result_dir)
+        print(f"Indexed {summary['indexed']}, removed {summary['removed']}, unchanged {summary['unchanged']} "
+              f"({len(index)} recordings in {args.index})")
+        return
+
+    if not os.path.exists(os.path.join(args.index, "meta.json")):
+        print(f"No similarity index at {args.index}; run `update` first")
+        return
+    index = HarmonicSimilarityIndex(args.index)
+    if args.command == "query":
+        try:
+            hits = index.similar(args.name, args.k, nprobe=args.nprobe or None, transpose=not args.no_transpose)
+        except KeyError as e:
+            print(e.args[0])
+            return
+        for hit in hits:
+            print(f"  {hit['similarity']:.4f}  {hit['transposition']:+3d}  {hit['name']}")
+    elif args.command == "partition":
+        index.partition(args.lists, iterations=args.iterations)
+        if index.partitioned:
+            print(f"Partitioned {args.index} into {len(index.centroids)} lists ({len(index)} recordings)")
+
+if __name__ == "__main__":
+    main()
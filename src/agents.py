@@ -1,4 +1,95 @@
-from typing import List, Dict, Any
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import List, Dict, Any, Callable, Optional, Tuple, Union
+from music21 import converter
+from src.budget import BudgetedPool
+from src.data_loader import MusicDataLoader, NoteEvents
+from src.harmonic_analysis import HarmonicAnalyzer
+
+class AnalysisContext:
+    """
+    Shared, lazily computed analysis state for one score.
+
+    Agents read what they need (parsed stream, note array, key, chord slices,
+    Roman numerals) and each item is computed at most once, however many agents
+    ask for it concurrently. Build one from a file path, a music21 score or a
+    NoteEvents array.
+    """
+
+    _FIELDS = ('score', 'note_events', 'key', 'chords', 'roman_numerals')
+
+    def __init__(self, source: Optional[str] = None, score=None, note_events: Optional[NoteEvents] = None):
+        self.source = source
+        self._values: Dict[str, Any] = {}
+        if score is not None:
+            self._values['score'] = score
+        if note_events is not None:
+            self._values['note_events'] = note_events
+        self._locks = {name: threading.Lock() for name in self._FIELDS}
+
+    def __getstate__(self):
+        # Locks cannot cross process boundaries; computed values can
+        return {'source': self.source, '_values': self._values}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._locks = {name: threading.Lock() for name in self._FIELDS}
+
+    def _get(self, name: str, compute: Callable[[], Any]) -> Any:
+        if name in self._values:
+            return self._values[name]
+        with self._locks[name]:
+            if name not in self._values:
+                self._values[name] = compute()
+        return self._values[name]
+
+    def prepare(self, *names: str) -> "AnalysisContext":
+        """Computes the named items now, e.g. before shipping the context to worker processes."""
+        for name in names or self._FIELDS:
+            getattr(self, name)
+        return self
+
+    @property
+    def score(self):
+        def compute():
+            if self.source is not None:
+                return converter.parse(self.source)
+            if 'note_events' in self._values:
+                return self._values['note_events'].to_stream()
+            raise ValueError("AnalysisContext has no source to build a score from")
+        return self._get('score', compute)
+
+    @property
+    def note_events(self) -> Optional[NoteEvents]:
+        def compute():
+            if self.source is not None and self.source.lower().endswith(('.mid', '.midi')):
+                return MusicDataLoader().load_note_events(self.source)
+            return None
+        return self._get('note_events', compute)
+
+    @property
+    def key(self):
+        return self._get('key', lambda: HarmonicAnalyzer.identify_key(self.score))
+
+    @property
+    def chords(self) -> list:
+        return self._get('chords', lambda: HarmonicAnalyzer.get_chord_sequence(self.score))
+
+    @property
+    def roman_numerals(self) -> List[str]:
+        return self._get('roman_numerals', lambda: HarmonicAnalyzer.roman_numerals(self.chords, self.key))
+
+    @classmethod
+    def wrap(cls, data: Any) -> "AnalysisContext":
+        """Returns data unchanged if it already is a context, otherwise builds one around it."""
+        if isinstance(data, cls):
+            return data
+        if isinstance(data, str):
+            return cls(source=data)
+        if isinstance(data, NoteEvents):
+            return cls(note_events=data)
+        return cls(score=data)
 
 class AnalysisAgent:
     """
@@ -23,12 +114,15 @@ class HarmonicAgent(AnalysisAgent):
 
     def analyze(self, score) -> Dict[str, Any]:
         """
-        Analyzes the harmonic structure of a score.
-        Placeholder for logic utilizing formal music theory rules or AI models.
+        Analyzes the harmonic structure of a score (or of a shared AnalysisContext).
+        Harmonic complexity is the share of distinct Roman numeral figures among all chords.
         """
         print(f"{self.name} is analyzing harmony...")
-        # TODO: Implement harmonic analysis logic (e.g., Roman Numeral Analysis)
-        return {"harmonic_complexity": "unknown", "key": "unknown"}
+        context = AnalysisContext.wrap(score)
+        k = context.key
+        rn_sequence = context.roman_numerals
+        complexity = len(set(rn_sequence)) / len(rn_sequence) if rn_sequence else 0.0
+        return {"harmonic_complexity": complexity, "key": f"{k.tonic.name} {k.mode}"}
 
 class OrchestratorAgent:
     """
@@ -43,3 +137,122 @@ class OrchestratorAgent:
             results[agent.name] = agent.analyze(score)
         return results
 
+def _run_agent(agent: AnalysisAgent, context: AnalysisContext):
+    """
+    Runs one agent and measures it where it runs (module level so process pools
+    can pickle it). A failing agent gets {"error": ...} as its result.
+    """
+    start = time.perf_counter()
+    try:
+        result = agent.analyze(context)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    return result, time.perf_counter() - start
+
+class ConcurrentOrchestratorAgent(OrchestratorAgent):
+    """
+    Runs agents concurrently over one shared AnalysisContext.
+
+    Expensive shared work (parsing, key finding, chordify) happens once per score
+    instead of once per agent, so a multi-agent analysis takes roughly as long as
+    its slowest agent. At most max_workers agents run at a time, and each agent's
+    timeout counts from when it starts. Agents run on threads by default; use
+    executor="process" for agents that hold the GIL, in which case the context is
+    prepared up front and pickled to a pool of worker processes that is kept
+    across scores (see close()).
+
+    Results map each agent name to its output, or to {"error": ...} if it failed or
+    exceeded its timeout; results[TIMINGS] maps agent names to wall-clock seconds.
+    A thread agent that overruns its timeout is abandoned rather than killed: its
+    result is discarded but its thread keeps running until it returns. A process
+    agent that overruns is killed and its worker replaced.
+    """
+
+    # Reserved result key of the per-agent timings
+    TIMINGS = "__timings__"
+
+    def __init__(self, agents: List[AnalysisAgent], max_workers: Optional[int] = None,
+                 timeout: Union[None, float, Dict[str, float]] = None, executor: str = "thread",
+                 prepare: tuple = ()):
+        super().__init__(agents)
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor: {executor}")
+        if any(agent.name == self.TIMINGS for agent in agents):
+            raise ValueError(f"Agent name {self.TIMINGS!r} is reserved for timings")
+        self.max_workers = max_workers or len(agents) or 1
+        self.timeout = timeout
+        self.executor = executor
+        self.prepare = prepare
+        self._process_pool: Optional[BudgetedPool] = None
+
+    def _timeout_for(self, agent: AnalysisAgent) -> Optional[float]:
+        if isinstance(self.timeout, dict):
+            return self.timeout.get(agent.name)
+        return self.timeout
+
+    def run_analysis(self, score) -> Dict[str, Any]:
+        context = AnalysisContext.wrap(score)
+        if self.executor == "process":
+            # Workers cannot share lazily computed state, so compute it once here
+            context.prepare(*(self.prepare or ('score', 'key', 'chords', 'roman_numerals')))
+            results, timings = self._run_processes(context)
+        else:
+            if self.prepare:
+                context.prepare(*self.prepare)
+            results, timings = self._run_threads(context)
+        # Agent order, whatever order they finished in
+        results = {agent.name: results[agent.name] for agent in self.agents}
+        results[self.TIMINGS] = {agent.name: timings[agent.name] for agent in self.agents}
+        return results
+
+    def _run_threads(self, context: AnalysisContext) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        queue = list(self.agents)[::-1]
+        running: Dict[Future, Tuple[AnalysisAgent, float, Optional[float]]] = {}
+        # One thread per agent, so an agent never waits behind abandoned ones;
+        # at most max_workers of them are admitted at a time
+        pool = ThreadPoolExecutor(max_workers=len(self.agents) or 1)
+        try:
+            while queue or running:
+                while queue and len(running) < self.max_workers:
+                    agent = queue.pop()
+                    future = pool.submit(_run_agent, agent, context)
+                    running[future] = (agent, time.perf_counter(), self._timeout_for(agent))
+                deadlines = [started + timeout for _, started, timeout in running.values() if timeout is not None]
+                wait_for = max(0.0, min(deadlines) - time.perf_counter()) if deadlines else None
+                done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+                for future in done:
+                    agent, _, _ = running.pop(future)
+                    results[agent.name], timings[agent.name] = future.result()
+                now = time.perf_counter()
+                for future, (agent, started, timeout) in list(running.items()):
+                    if timeout is not None and now - started >= timeout:
+                        del running[future]
+                        results[agent.name] = {"error": f"Timed out after {timeout} s"}
+                        timings[agent.name] = now - started
+        finally:
+            # Do not block on agents that overran their budget
+            pool.shutdown(wait=False, cancel_futures=True)
+        return results, timings
+
+    def _run_processes(self, context: AnalysisContext) -> Tuple[Dict[str, Any], Dict[str, float]]:
+        if self._process_pool is None:
+            self._process_pool = BudgetedPool(_run_agent, workers=self.max_workers, keep_workers=True)
+        results: Dict[str, Any] = {}
+        timings: Dict[str, float] = {}
+        tasks = [(agent.name, (agent, context)) for agent in self.agents]
+        timeouts = {agent.name: self._timeout_for(agent) for agent in self.agents}
+        for name, outcome in self._process_pool.run(tasks, timeouts):
+            if outcome["state"] == "ok":
+                results[name], timings[name] = outcome["value"]
+            else:
+                results[name] = {"error": outcome["error"]}
+                timings[name] = outcome["seconds"]
+        return results, timings
+
+    def close(self):
+        """Stops the worker processes kept for executor="process"."""
+        if self._process_pool is not None:
+            self._process_pool.close()
+            self._process_pool = None
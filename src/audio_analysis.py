@@ -1,59 +1,336 @@
 import librosa
 import numpy as np
 import json
-from typing import Dict, Any
+import soundfile as sf
+from functools import cached_property
+from typing import Dict, Any, List, Optional
+from src.cache import DecodedAudioCache
+from src.instrumentation import get_instrumentation, instrumented
+from src.key_profiles import KeyProfileEngine
+
+class AudioFeatures:
+    """
+    Feature graph for one decoded signal.
+
+    Every intermediate is computed on first access and then shared: the STFT is
+    taken once, HPSS runs on that spectrogram, each component is resynthesized
+    once (harmonic for the CQT chromagram, percussive for beat tracking) and
+    tonnetz is derived from that same chromagram instead of a second CQT.
+    Callers (plotting, downstream tools) can read any node without recomputing it.
+    """
+
+    def __init__(self, y: np.ndarray, sr: int, n_fft: int = 2048, hop_length: int = 512):
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+    @cached_property
+    def duration(self) -> float:
+        return float(librosa.get_duration(y=self.y, sr=self.sr))
+
+    @cached_property
+    @instrumented("stft")
+    def stft(self) -> np.ndarray:
+        return librosa.stft(self.y, n_fft=self.n_fft, hop_length=self.hop_length)
+
+    @cached_property
+    @instrumented("hpss")
+    def hpss(self):
+        """Harmonic and percussive complex spectrograms."""
+        return librosa.decompose.hpss(self.stft)
+
+    @property
+    def harmonic_stft(self) -> np.ndarray:
+        return self.hpss[0]
+
+    @property
+    def percussive_stft(self) -> np.ndarray:
+        return self.hpss[1]
+
+    @cached_property
+    @instrumented("y_harmonic")
+    def y_harmonic(self) -> np.ndarray:
+        return librosa.istft(self.harmonic_stft, hop_length=self.hop_length, n_fft=self.n_fft,
+                             length=len(self.y))
+
+    @cached_property
+    @instrumented("y_percussive")
+    def y_percussive(self) -> np.ndarray:
+        return librosa.istft(self.percussive_stft, hop_length=self.hop_length, n_fft=self.n_fft,
+                             length=len(self.y))
+
+    @cached_property
+    @instrumented("onset_envelope")
+    def onset_envelope(self) -> np.ndarray:
+        """
+        Onset strength of the percussive signal. Taken from the resynthesized signal
+        rather than the HPSS mask output directly, because the STFT round trip changes
+        the envelope enough to shift the tempo estimate.
+        """
+        return librosa.onset.onset_strength(y=self.y_percussive, sr=self.sr, hop_length=self.hop_length)
+
+    @cached_property
+    @instrumented("beats")
+    def beats(self):
+        """(tempo, beat_frames) from the percussive onset envelope."""
+        tempo, beat_frames = librosa.beat.beat_track(onset_envelope=self.onset_envelope, sr=self.sr,
+                                                     hop_length=self.hop_length)
+        return float(np.atleast_1d(tempo)[0]), beat_frames
+
+    @cached_property
+    @instrumented("chroma")
+    def chroma(self) -> np.ndarray:
+        return librosa.feature.chroma_cqt(y=self.y_harmonic, sr=self.sr, hop_length=self.hop_length)
+
+    @cached_property
+    @instrumented("tonnetz")
+    def tonnetz(self) -> np.ndarray:
+        return librosa.feature.tonnetz(chroma=self.chroma, sr=self.sr)
 
 class AudioAnalyzer:
     """
     Analyzer for audio files (wav, mp3, m4a, etc.) focusing on harmonic content.
     """
-    
-    def __init__(self, sample_rate: int = 22050):
+
+    def __init__(self, sample_rate: int = 22050, key_profile: str = 'krumhansl',
+                 decode_cache: Optional[DecodedAudioCache] = None):
         self.sr = sample_rate
+        self.key_engine = KeyProfileEngine(key_profile)
+        self.decode_cache = decode_cache
 
-    def analyze_file(self, file_path: str) -> Dict[str, Any]:
+    @instrumented("decode")
+    def load_audio(self, file_path: str) -> np.ndarray:
         """
-        Loads an audio file and performs harmonic and rhythmic analysis.
+        Decodes a file to mono float32 at self.sr, going through the decode cache if one is set.
         """
-        try:
-            # Load audio
-            y, sr = librosa.load(file_path, sr=self.sr)
-        except Exception as e:
-            return {"error": f"Could not load audio file: {e}"}
+        def decode() -> np.ndarray:
+            return librosa.load(file_path, sr=self.sr)[0]
+        if self.decode_cache is None:
+            return decode()
+        return self.decode_cache.load(file_path, self.sr, True, decode)
 
-        # Harmonic-Percussive Source Separation
-        y_harmonic, y_percussive = librosa.effects.hpss(y)
+    def extract_features(self, file_path: str) -> AudioFeatures:
+        """
+        Decodes an audio file once and returns its (lazily evaluated) feature graph.
+        """
+        return AudioFeatures(self.load_audio(file_path), self.sr)
 
+    def analyze_features(self, features: AudioFeatures) -> Dict[str, Any]:
+        """
+        Performs harmonic and rhythmic analysis on an already extracted feature graph.
+        """
         # 1. Tempo and Beat Tracking
-        tempo, beat_frames = librosa.beat.beat_track(y=y_percussive, sr=sr)
-        
+        tempo, beat_frames = features.beats
+
         # 2. Chromagram (Harmonic content)
-        chroma = librosa.feature.chroma_cqt(y=y_harmonic, sr=sr)
-        
-        # 3. Key Estimation (Simple heuristic using chroma mean)
-        # Sum chroma over time to get a pitch class distribution
-        chroma_mean = np.mean(chroma, axis=1)
-        # This is a very basic heuristic; sophisticated key finding would use templates
-        key_index = np.argmax(chroma_mean)
-        pitch_classes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-        estimated_key = pitch_classes[key_index]
-
-        # 4. Tonnetz (Tonal centroid features)
-        tonnetz = librosa.feature.tonnetz(y=y_harmonic, sr=sr)
+        chroma = features.chroma
+
+        # 3. Key Estimation (profile correlation over the mean chroma vector)
+        with get_instrumentation().stage("key"):
+            chroma_mean = np.mean(chroma, axis=1)
+            estimated_key, estimated_mode, key_confidence = self.key_engine.key_names(chroma_mean)[0]
+
+        # 4. Tonnetz (Tonal centroid features, derived from the same chromagram)
+        tonnetz = features.tonnetz
 
         analysis_results = {
-            "tempo": float(tempo),
+            "tempo": tempo,
             "estimated_key_root": estimated_key,
-            "duration": float(librosa.get_duration(y=y, sr=sr)),
+            "estimated_mode": estimated_mode,
+            "key_confidence": key_confidence,
+            "duration": features.duration,
             "beat_frames_count": len(beat_frames),
             "chroma_mean": chroma_mean.tolist(),
             "tonnetz_mean": np.mean(tonnetz, axis=1).tolist()
         }
-        
+
         return analysis_results
 
+    def analyze_file(self, file_path: str) -> Dict[str, Any]:
+        """
+        Loads an audio file and performs harmonic and rhythmic analysis.
+        """
+        inst = get_instrumentation()
+        with inst.scope() as timings:
+            try:
+                features = self.extract_features(file_path)
+            except Exception as e:
+                return {"error": f"Could not load audio file: {e}"}
+            results = self.analyze_features(features)
+        if inst.enabled:
+            results["timings"] = timings
+        return results
+
+    def analyze_stream(self, file_path: str, block_duration: float = 30.0, key_window: float = 10.0,
+                       beat_window: float = 60.0, n_fft: int = 2048, hop_length: int = 512,
+                       hpss_kernel: int = 31) -> Dict[str, Any]:
+        """
+        Bounded-memory analysis for long recordings.
+
+        Reads fixed-size overlapping blocks through librosa.stream (so the file must
+        be readable by soundfile, e.g. wav/flac/ogg) at its native sample rate and
+        never holds more than one block plus a few frames of context. Blocks overlap
+        by n_fft - hop_length samples so their STFT frames tile the signal exactly;
+        the HPSS median filter gets hpss_kernel // 2 frames of carried context on
+        each side of a block boundary. Chroma is taken from the harmonic spectrogram
+        (chroma_stft, as a CQT needs more context than a block provides), tonnetz is
+        derived per frame from it and beats are tracked over consecutive
+        beat_window-second stretches of the onset envelope.
+
+        Returns the same fields as analyze_file plus "key_timeline", a list of local
+        key estimates over consecutive key_window-second windows.
+        """
+        inst = get_instrumentation()
+        with inst.scope() as timings:
+            results = self._analyze_stream(file_path, block_duration, key_window, beat_window,
+                                           n_fft, hop_length, hpss_kernel)
+        if inst.enabled and "error" not in results:
+            results["timings"] = timings
+        return results
+
+    def _analyze_stream(self, file_path: str, block_duration: float, key_window: float,
+                        beat_window: float, n_fft: int, hop_length: int, hpss_kernel: int) -> Dict[str, Any]:
+        inst = get_instrumentation()
+        try:
+            info = sf.info(file_path)
+        except Exception as e:
+            return {"error": f"Could not open audio file for streaming: {e}"}
+        sr = info.samplerate
+        block_length = max(1, int(np.ceil(block_duration * sr / hop_length)))
+        window_frames = max(1, int(round(key_window * sr / hop_length)))
+        beat_frames = max(2, int(round(beat_window * sr / hop_length)))
+        half = hpss_kernel // 2
+
+        chroma_sum = np.zeros(12)
+        tonnetz_sum = np.zeros(6)
+        n_frames = 0
+        window_chroma = np.zeros(12)
+        window_count = 0
+        window_start = 0
+        key_timeline: List[Dict[str, Any]] = []
+        tempos: List[float] = []
+        tempo_weights: List[int] = []
+        beat_count = 0
+        # STFT frames not yet emitted, preceded by `emitted_ctx` frames kept only as filter context
+        pending = None
+        emitted_ctx = 0
+        prev_mel_db = None
+        onset_buffer: List[np.ndarray] = []
+        onset_buffered = 0
+
+        def consume(harmonic: np.ndarray, percussive: np.ndarray):
+            nonlocal n_frames, window_count, window_start, prev_mel_db, onset_buffered
+            nonlocal chroma_sum, tonnetz_sum, window_chroma
+            if harmonic.shape[1] == 0:
+                return
+            with inst.stage("chroma"):
+                chroma = librosa.feature.chroma_stft(S=np.abs(harmonic) ** 2, sr=sr, n_fft=n_fft, tuning=0.0)
+            with inst.stage("tonnetz"):
+                tonnetz = librosa.feature.tonnetz(chroma=chroma, sr=sr)
+            chroma_sum += chroma.sum(axis=1)
+            tonnetz_sum += tonnetz.sum(axis=1)
+
+            # Onset envelope: positive spectral flux of the percussive log-mel spectrogram,
+            # continued across blocks through the previous frame
+            mel_db = librosa.power_to_db(librosa.feature.melspectrogram(S=np.abs(percussive) ** 2, sr=sr),
+                                         top_db=None)
+            if prev_mel_db is not None:
+                mel_db_ext = np.hstack([prev_mel_db, mel_db])
+            else:
+                mel_db_ext = np.hstack([mel_db[:, :1], mel_db])
+            onset_env = np.maximum(0.0, np.diff(mel_db_ext, axis=1)).mean(axis=0)
+            prev_mel_db = mel_db[:, -1:]
+            onset_buffer.append(onset_env)
+            onset_buffered += len(onset_env)
+            if onset_buffered >= beat_frames:
+                flush_beats()
+
+            # Windowed key timeline
+            pos = 0
+            while pos < chroma.shape[1]:
+                take = min(window_frames - window_count, chroma.shape[1] - pos)
+                window_chroma += chroma[:, pos:pos + take].sum(axis=1)
+                window_count += take
+                pos += take
+                if window_count == window_frames:
+                    flush_window()
+            n_frames += chroma.shape[1]
+
+        def flush_beats():
+            nonlocal onset_buffered, beat_count
+            onset_env = np.concatenate(onset_buffer) if onset_buffer else np.zeros(0)
+            onset_buffer.clear()
+            onset_buffered = 0
+            if len(onset_env) < 2:
+                return
+            with inst.stage("beats"):
+                tempo, beats = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+            beat_count += len(beats)
+            if len(beats):
+                tempos.append(float(np.atleast_1d(tempo)[0]))
+                tempo_weights.append(len(onset_env))
+
+        def flush_window():
+            nonlocal window_count, window_start, window_chroma
+            if window_count == 0:
+                return
+            tonic, mode, confidence = self.key_engine.key_names(window_chroma)[0]
+            key_timeline.append({
+                "start": float(librosa.frames_to_time(window_start, sr=sr, hop_length=hop_length)),
+                "end": float(librosa.frames_to_time(window_start + window_count, sr=sr, hop_length=hop_length)),
+                "key": tonic,
+                "mode": mode,
+                "confidence": confidence,
+            })
+            window_start += window_count
+            window_count = 0
+            window_chroma = np.zeros(12)
+
+        stream = librosa.stream(file_path, block_length=block_length, frame_length=n_fft,
+                                hop_length=hop_length, mono=True)
+        for block in stream:
+            if len(block) < n_fft:
+                continue
+            with inst.stage("stft"):
+                S = librosa.stft(block, n_fft=n_fft, hop_length=hop_length, center=False)
+            buf = S if pending is None else np.hstack([pending, S])
+            with inst.stage("hpss"):
+                harmonic, percussive = librosa.decompose.hpss(buf, kernel_size=hpss_kernel)
+            # Frames within `half` of the end still lack right-hand context; emit them next time
+            ready = max(emitted_ctx, buf.shape[1] - half)
+            consume(harmonic[:, emitted_ctx:ready], percussive[:, emitted_ctx:ready])
+            # Carry the unemitted frames plus `half` already emitted ones as left-hand context
+            start = max(0, ready - half)
+            pending = buf[:, start:]
+            emitted_ctx = ready - start
+
+        if pending is not None and pending.shape[1] > emitted_ctx:
+            harmonic, percussive = librosa.decompose.hpss(pending, kernel_size=hpss_kernel)
+            consume(harmonic[:, emitted_ctx:], percussive[:, emitted_ctx:])
+        flush_window()
+        flush_beats()
+
+        if n_frames == 0:
+            return {"error": "Audio file is shorter than one analysis frame"}
+
+        chroma_mean = chroma_sum / n_frames
+        estimated_key, estimated_mode, key_confidence = self.key_engine.key_names(chroma_mean)[0]
+        tempo = float(np.average(tempos, weights=tempo_weights)) if tempos else 0.0
+
+        return {
+            "tempo": tempo,
+            "estimated_key_root": estimated_key,
+            "estimated_mode": estimated_mode,
+            "key_confidence": key_confidence,
+            "duration": float(info.frames / sr),
+            "beat_frames_count": beat_count,
+            "chroma_mean": chroma_mean.tolist(),
+            "tonnetz_mean": (tonnetz_sum / n_frames).tolist(),
+            "key_timeline": key_timeline,
+        }
+
     def save_analysis(self, results: Dict[str, Any], output_path: str):
         """Saves analysis results to a JSON file."""
         with open(output_path, 'w') as f:
             json.dump(results, f, indent=4)
-
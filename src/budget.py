@@ -0,0 +1,242 @@
+import os
+import time
+import resource
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from src.instrumentation import get_instrumentation
+
+def _proc_status(pid: int) -> Dict[str, float]:
+    """Peak resident set (MiB) and CPU time (s) of a live process, from /proc where available."""
+    stats: Dict[str, float] = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    stats["peak_rss_mb"] = int(line.split()[1]) / 1024
+        with open(f"/proc/{pid}/stat") as f:
+            # utime and stime are fields 14 and 15, after the parenthesized command name
+            fields = f.read().rsplit(")", 1)[1].split()
+        stats["cpu_s"] = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        pass
+    return stats
+
+def _reset_peak_rss():
+    # Writing 5 to clear_refs restarts VmHWM, so each task reports its own peak (Linux 4.0+)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _worker_main(conn: Connection, func: Callable, memory_mb: Optional[int],
+                 initializer: Optional[Callable], initargs: Sequence[Any]):
+    if initializer is not None:
+        initializer(*initargs)
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    get_instrumentation().listener = lambda name: conn.send(("stage", name))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        key, args = task
+        _reset_peak_rss()
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        outcome: Dict[str, Any] = {}
+        try:
+            outcome["value"] = func(*args)
+            outcome["state"] = "ok"
+        except MemoryError as e:
+            outcome.update(state="memory", error=f"MemoryError: {e}")
+        except Exception as e:
+            outcome.update(state="failed", error=str(e))
+        outcome["seconds"] = time.perf_counter() - start
+        outcome["cpu_s"] = time.process_time() - cpu_start
+        peak = _proc_status(os.getpid()).get("peak_rss_mb")
+        if peak is not None:
+            outcome["peak_rss_mb"] = peak
+        conn.send(("done", key, outcome))
+
+class _Worker:
+    def __init__(self, ctx, func: Callable, memory_mb: Optional[int], initializer: Optional[Callable],
+                 initargs: Sequence[Any]):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, func, memory_mb, initializer, initargs),
+                                   daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.key: Any = None
+        self.started = 0.0
+        self.timeout: Optional[float] = None
+        self.cpu_start = 0.0
+        self.stages: List[str] = []
+
+    def assign(self, key: Any, args: Sequence[Any], timeout: Optional[float]):
+        self.key = key
+        self.started = time.perf_counter()
+        self.timeout = timeout
+        self.cpu_start = _proc_status(self.process.pid).get("cpu_s", 0.0)
+        self.stages = []
+        self.conn.send((key, tuple(args)))
+
+    def drain(self) -> Optional[Dict[str, Any]]:
+        """Reads pending stage messages; returns the outcome if the task finished meanwhile."""
+        try:
+            while self.conn.poll():
+                message = self.conn.recv()
+                if message[0] == "stage":
+                    self.stages.append(message[1])
+                else:
+                    return message[2]
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class BudgetedPool:
+    """
+    Worker processes that run each task under a wall-clock and memory budget.
+
+    Every worker is a separate process, so a task that hangs or blows up cannot
+    take the run down with it. memory_mb caps each worker's address space
+    (RLIMIT_AS), so an allocation past it raises MemoryError inside the task,
+    and the worker is replaced afterwards. A task still running after timeout
+    seconds has its worker killed and replaced. Workers report every
+    instrumentation stage they enter, so an over-budget task is reported with
+    the stage it was stuck in, its elapsed and CPU time and its peak RSS.
+    A pool of n workers therefore finishes m tasks in at most about
+    ceil(m / n) * timeout seconds.
+
+    Workers are stopped when run() returns, unless keep_workers is set: the
+    idle workers are then reused by the next run() until close().
+    """
+
+    def __init__(self, func: Callable, workers: int = 1, timeout: Optional[float] = None,
+                 memory_mb: Optional[int] = None, initializer: Optional[Callable] = None,
+                 initargs: Sequence[Any] = (), keep_workers: bool = False):
+        self.func = func
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.initializer = initializer
+        self.initargs = initargs
+        self.keep_workers = keep_workers
+        self._ctx = multiprocessing.get_context()
+        self._idle: List[_Worker] = []
+
+    def _spawn(self) -> _Worker:
+        return _Worker(self._ctx, self.func, self.memory_mb, self.initializer, self.initargs)
+
+    def run(self, tasks: Iterable[Tuple[Any, Sequence[Any]]],
+            timeouts: Optional[Dict[Any, Optional[float]]] = None) -> Iterator[Tuple[Any, Dict[str, Any]]]:
+        """
+        Runs (key, args) tasks and yields (key, outcome) as they finish. The
+        outcome's state is "ok" (with the return value under "value"), "failed",
+        "memory", "timeout" or "crashed" (the worker died, e.g. by a signal);
+        it also carries seconds, cpu_s, peak_rss_mb, error and, when the task
+        did not finish, the stages it entered. timeouts overrides the pool's
+        timeout for the tasks with those keys (None: no limit); a timeout is
+        counted from when a worker picks the task up.
+        """
+        queue = list(tasks)[::-1]
+        idle = self._idle
+        idle.extend(self._spawn() for _ in range(min(self.workers, len(queue)) - len(idle)))
+        busy: Dict[Connection, _Worker] = {}
+        try:
+            while queue or busy:
+                while queue and idle:
+                    worker = idle.pop()
+                    key, args = queue.pop()
+                    worker.assign(key, args, timeouts.get(key, self.timeout) if timeouts else self.timeout)
+                    busy[worker.conn] = worker
+                wait_for = None
+                deadlines = [w.started + w.timeout for w in busy.values() if w.timeout is not None]
+                if deadlines:
+                    wait_for = max(0.0, min(deadlines) - time.perf_counter())
+                for conn in wait(list(busy), wait_for):
+                    worker = busy[conn]
+                    try:
+                        message = conn.recv()
+                    except (EOFError, OSError):
+                        outcome = self._unfinished(worker, "crashed", "")
+                        worker.kill()
+                        outcome["error"] = f"worker exited with code {worker.process.exitcode}"
+                        del busy[conn]
+                        yield worker.key, outcome
+                        if queue:
+                            idle.append(self._spawn())
+                        continue
+                    if message[0] == "stage":
+                        worker.stages.append(message[1])
+                        continue
+                    _, key, outcome = message
+                    del busy[conn]
+                    if outcome["state"] == "memory":
+                        # The heap may be in any state after a failed allocation
+                        worker.kill()
+                        if queue:
+                            idle.append(self._spawn())
+                    else:
+                        idle.append(worker)
+                    if outcome["state"] != "ok":
+                        outcome["stages"] = worker.stages
+                    yield key, outcome
+                if deadlines:
+                    now = time.perf_counter()
+                    for conn, worker in list(busy.items()):
+                        if worker.timeout is None or now - worker.started < worker.timeout:
+                            continue
+                        del busy[conn]
+                        outcome = worker.drain()
+                        if outcome is not None and outcome["state"] != "memory":
+                            # Finished just as the budget ran out
+                            idle.append(worker)
+                        else:
+                            if outcome is None:
+                                where = f" in {worker.stages[-1]}" if worker.stages else ""
+                                outcome = self._unfinished(worker, "timeout",
+                                                           f"timed out after {worker.timeout:g} s{where}")
+                            worker.kill()
+                            if queue:
+                                idle.append(self._spawn())
+                        if outcome["state"] != "ok":
+                            outcome["stages"] = worker.stages
+                        yield worker.key, outcome
+        finally:
+            for worker in busy.values():
+                worker.kill()
+            if not self.keep_workers:
+                self.close()
+
+    def close(self):
+        """Stops the idle workers."""
+        for worker in self._idle:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            worker.process.join(timeout=5)
+            worker.conn.close()
+        self._idle = []
+
+    @staticmethod
+    def _unfinished(worker: _Worker, state: str, error: str) -> Dict[str, Any]:
+        outcome: Dict[str, Any] = {"state": state, "error": error, "seconds": time.perf_counter() - worker.started,
+                                   "stages": worker.stages}
+        status = _proc_status(worker.process.pid)
+        if "cpu_s" in status:
+            outcome["cpu_s"] = status["cpu_s"] - worker.cpu_start
+        if "peak_rss_mb" in status:
+            outcome["peak_rss_mb"] = status["peak_rss_mb"]
+        return outcome
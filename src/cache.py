@@ -0,0 +1,219 @@
+import os
+import json
+import shutil
+import hashlib
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+
+def file_digest(file_path: str) -> "hashlib._Hash":
+    """SHA-256 of a file's bytes, read in 1 MiB blocks."""
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h
+
+def _cache_size(cache_dir: str) -> int:
+    total = 0
+    for root, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            total += os.path.getsize(os.path.join(root, filename))
+    return total
+
+def _evict_lru(cache_dir: str, max_bytes: Optional[int]) -> int:
+    """
+    Removes least-recently-used files (oldest mtime first) under cache_dir until
+    it fits in max_bytes. Returns the number of files removed.
+    """
+    if max_bytes is None:
+        return 0
+    return _evict_lru_to(cache_dir, max_bytes, max_bytes)[0]
+
+def _evict_lru_to(cache_dir: str, max_bytes: int, target_bytes: int) -> Tuple[int, int]:
+    """
+    If cache_dir holds more than max_bytes, removes least-recently-used files
+    until it holds at most target_bytes. Returns (files removed, bytes left).
+    """
+    entries = []
+    total = 0
+    for root, _, filenames in os.walk(cache_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0, total
+    entries.sort()
+    removed = 0
+    for _, entry_size, path in entries:
+        if total <= target_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= entry_size
+        removed += 1
+    return removed, total
+
+def _touch(path: str):
+    # Refresh the mtime so eviction is least-recently-used rather than oldest-written
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+class ResultCache:
+    """
+    Persistent, content-addressed cache of per-file analysis results.
+
+    Entries are keyed by the SHA-256 of the input file bytes combined with a
+    fingerprint of the analyzer (code version, library versions), so editing a
+    score or upgrading the analysis both produce a miss.  Entries are stored as
+    small JSON files, sharded by the first two hex digits of the key.
+    """
+
+    def __init__(self, cache_dir: str = ".cache/results", fingerprint: str = "",
+                 max_bytes: Optional[int] = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+
+    def key_for_file(self, file_path: str) -> str:
+        """Returns the cache key for the current contents of file_path."""
+        h = file_digest(file_path)
+        h.update(b'\0')
+        h.update(self.fingerprint.encode('utf-8'))
+        return h.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns the stored entry for key, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        _touch(path)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]):
+        """Stores entry under key. The write is atomic so concurrent workers never see partial files."""
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, path)
+
+    def size(self) -> int:
+        """Total size in bytes of all cache entries."""
+        return _cache_size(self.cache_dir)
+
+    def evict(self) -> int:
+        """
+        Removes least-recently-used entries until the cache fits in max_bytes.
+        Returns the number of entries removed.
+        """
+        return _evict_lru(self.cache_dir, self.max_bytes)
+
+    def clear(self):
+        """Invalidates the whole cache."""
+        if os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+class DecodedAudioCache:
+    """
+    Persistent cache of decoded, resampled PCM.
+
+    Entries are float32 .npy files keyed by the file bytes, target sample rate and
+    mono flag, and are opened with np.load(mmap_mode='r') so repeat analyses of a
+    recording skip ffmpeg/audioread decoding and resampling entirely and read the
+    samples zero-copy. The cache is kept under max_bytes by LRU eviction.
+    Writes keep a running total of the cache size (measured once, on the first
+    write), and only a write that takes it over max_bytes walks the cache, to
+    evict down to EVICT_TO of the cap, so the walks are spread over many writes.
+    """
+
+    # Fraction of max_bytes an eviction frees the cache down to
+    EVICT_TO = 0.9
+
+    def __init__(self, cache_dir: str = ".cache/audio", max_bytes: Optional[int] = 4 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._size: Optional[int] = None
+
+    def key_for_file(self, file_path: str, sr: int, mono: bool = True) -> str:
+        h = file_digest(file_path)
+        h.update(f"\0sr={sr};mono={int(mono)}".encode('utf-8'))
+        return h.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Returns a read-only memory map of the cached samples, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            y = np.load(path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        _touch(path)
+        return y
+
+    def put(self, key: str, y: np.ndarray):
+        """Stores samples as float32, atomically, then enforces the size cap."""
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.max_bytes is not None and self._size is None:
+            self._size = _cache_size(self.cache_dir)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(y, dtype=np.float32))
+            written = f.tell()
+        os.replace(tmp_path, path)
+        if self._size is not None:
+            self._size += written - replaced
+            if self._size > self.max_bytes:
+                # Other processes may share the directory, so eviction re-measures it
+                self._size = _evict_lru_to(self.cache_dir, self.max_bytes, int(self.max_bytes * self.EVICT_TO))[1]
+
+    def load(self, file_path: str, sr: int, mono: bool, decode: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Returns the decoded samples of file_path, calling decode() only on a miss.
+        """
+        key = self.key_for_file(file_path, sr, mono)
+        y = self.get(key)
+        if y is not None:
+            return y
+        y = decode()
+        self.put(key, y)
+        # Hand back the memory map so a miss and a hit behave identically
+        # (unless the entry was too large to survive eviction)
+        cached = self.get(key)
+        return cached if cached is not None else y
+
+    def size(self) -> int:
+        return _cache_size(self.cache_dir)
+
+    def evict(self) -> int:
+        if self.max_bytes is None:
+            return 0
+        removed, self._size = _evict_lru_to(self.cache_dir, self.max_bytes, self.max_bytes)
+        return removed
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+        self._size = None
@@ -0,0 +1,161 @@
+import numpy as np
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+import music21
+from music21 import key
+
+# One row per vertical slice: its time span in quarter notes, the pitch classes
+# sounding (bit pc set for pitch class pc), the lowest sounding MIDI pitch and
+# how many notes sound
+CHORD_SLICE_DTYPE = np.dtype([
+    ('onset', np.float64),
+    ('offset', np.float64),
+    ('pc_mask', np.uint16),
+    ('bass', np.uint8),
+    ('n_notes', np.uint16),
+])
+
+_PC_BITS = (1 << np.arange(12)).astype(np.uint16)
+
+def slice_chords(notes: np.ndarray, min_duration: float = 0.0, merge: bool = True,
+                 block_size: int = 1 << 15) -> np.ndarray:
+    """
+    Cuts a NOTE_EVENT_DTYPE array into vertical slices, like music21's
+    chordify(), without building any music21 objects.
+
+    The slice boundaries are the union of all onsets and offsets. Sorted
+    searches give each note the range of slices it spans; a difference array
+    over the 128 pitches, summed cumulatively, then tells which pitches sound in
+    every slice. Slices are processed in blocks of block_size so memory stays
+    bounded on very long scores. Slices where nothing sounds are left out;
+    slices shorter than min_duration are dropped, and with merge, consecutive
+    slices with the same pitch classes and bass become one (as when a held chord
+    is re-struck or a voice repeats a pitch).
+    Returns a CHORD_SLICE_DTYPE array in time order.
+    """
+    notes = notes[notes['offset'] > notes['onset']]
+    if len(notes) == 0:
+        return np.zeros(0, dtype=CHORD_SLICE_DTYPE)
+    bounds = np.unique(np.concatenate([notes['onset'], notes['offset']]))
+    n_slices = len(bounds) - 1
+    first = np.searchsorted(bounds, notes['onset'])
+    last = np.searchsorted(bounds, notes['offset']) - 1
+    pitch = notes['pitch'].astype(np.int64)
+
+    pc_mask = np.zeros(n_slices, dtype=np.uint16)
+    bass = np.zeros(n_slices, dtype=np.uint8)
+    n_notes = np.zeros(n_slices, dtype=np.uint16)
+    for start in range(0, n_slices, block_size):
+        stop = min(start + block_size, n_slices)
+        inside = (first < stop) & (last >= start)
+        lo = np.maximum(first[inside], start) - start
+        hi = np.minimum(last[inside], stop - 1) - start
+        counts = np.zeros((stop - start + 1, 128), dtype=np.int32)
+        np.add.at(counts, (lo, pitch[inside]), 1)
+        np.add.at(counts, (hi + 1, pitch[inside]), -1)
+        sounding = np.cumsum(counts, axis=0)[:-1]
+        n_notes[start:stop] = sounding.sum(axis=1)
+        active = sounding > 0
+        bass[start:stop] = np.argmax(active, axis=1)
+        by_octave = np.zeros((stop - start, 132), dtype=bool)
+        by_octave[:, :128] = active
+        pc_mask[start:stop] = by_octave.reshape(-1, 11, 12).any(axis=1) @ _PC_BITS
+
+    slices = np.zeros(n_slices, dtype=CHORD_SLICE_DTYPE)
+    slices['onset'] = bounds[:-1]
+    slices['offset'] = bounds[1:]
+    slices['pc_mask'] = pc_mask
+    slices['bass'] = bass
+    slices['n_notes'] = n_notes
+    slices = slices[(n_notes > 0) & (slices['offset'] - slices['onset'] >= min_duration)]
+    if merge and len(slices) > 1:
+        changed = (slices['pc_mask'][1:] != slices['pc_mask'][:-1]) | (slices['bass'][1:] != slices['bass'][:-1])
+        starts = np.flatnonzero(np.concatenate([[True], changed]))
+        merged = slices[starts]
+        merged['offset'] = np.maximum.reduceat(slices['offset'], starts)
+        merged['n_notes'] = np.maximum.reduceat(slices['n_notes'], starts)
+        slices = merged
+    return slices
+
+def slice_pitch_classes(pc_mask: int) -> List[int]:
+    """Pitch classes set in a slice's pc_mask, ascending."""
+    return [pc for pc in range(12) if pc_mask >> pc & 1]
+
+def key_spelling(k: key.Key) -> List[str]:
+    """
+    Pitch name for each pitch class in k: the scale degree's name when the
+    pitch class is diatonic (in minor also the raised sixth and seventh),
+    otherwise sharps in sharp keys and flats in flat keys.
+    """
+    names = [music21.pitch.Pitch(pc).name for pc in range(12)]
+    if k.sharps < 0:
+        names = [music21.pitch.Pitch(pc).getEnharmonic().name if '#' in name else name
+                 for pc, name in enumerate(names)]
+    scale = list(k.getPitches()[:7])
+    if k.mode == 'minor':
+        scale += [k.pitchFromDegree(6).transpose('A1'), k.pitchFromDegree(7).transpose('A1')]
+    for p in scale:
+        names[p.pitchClass] = p.name
+    return names
+
+def slice_chord(pc_mask: int, bass: int, spelling: Optional[List[str]] = None) -> music21.chord.Chord:
+    """
+    Close-position music21 chord of a slice: the bass, then the other pitch
+    classes within the octave above it, spelled with `spelling` (see
+    key_spelling) or music21's default MIDI spelling.
+    """
+    pitches = []
+    for midi in sorted({bass + (pc - bass) % 12 for pc in slice_pitch_classes(pc_mask)}):
+        p = music21.pitch.Pitch(midi)
+        if spelling is not None:
+            p = music21.pitch.Pitch(spelling[midi % 12])
+            p.octave = 4
+            p.octave += int(round((midi - p.ps) / 12))
+        pitches.append(p)
+    return music21.chord.Chord(pitches)
+
+class SliceFigureMemo:
+    """
+    Bounded LRU memo of Roman numeral figures of chord slices, keyed by
+    (pitch-class mask, bass pitch class, key). A hit costs one dict lookup; only
+    a miss builds a music21 chord. Slices carry no spelling, so chords are
+    spelled in the key (see key_spelling), and figures describe the
+    close-position voicing: spread voicings get plain figures ("V7" rather than
+    compound-interval ones).
+    """
+
+    def __init__(self, maxsize: int = 8192, max_keys: int = 64):
+        self.maxsize = maxsize
+        self.max_keys = max_keys
+        self._figures: "OrderedDict[Tuple[int, int, str, str], str]" = OrderedDict()
+        self._spellings: "OrderedDict[Tuple[str, str], List[str]]" = OrderedDict()
+
+    def _spelling(self, k: key.Key) -> List[str]:
+        spelling_key = (k.tonic.name, k.mode)
+        spelling = self._spellings.get(spelling_key)
+        if spelling is not None:
+            self._spellings.move_to_end(spelling_key)
+            return spelling
+        spelling = self._spellings[spelling_key] = key_spelling(k)
+        if len(self._spellings) > self.max_keys:
+            self._spellings.popitem(last=False)
+        return spelling
+
+    def figures(self, slices: np.ndarray, k: key.Key) -> List[str]:
+        figures = []
+        for pc_mask, bass in zip(slices['pc_mask'].tolist(), slices['bass'].tolist()):
+            memo_key = (pc_mask, bass % 12, k.tonic.name, k.mode)
+            figure = self._figures.get(memo_key)
+            if figure is not None:
+                self._figures.move_to_end(memo_key)
+            else:
+                c = slice_chord(pc_mask, bass, self._spelling(k))
+                figure = self._figures[memo_key] = music21.roman.romanNumeralFromChord(c, k).figure
+                if len(self._figures) > self.maxsize:
+                    self._figures.popitem(last=False)
+            figures.append(figure)
+        return figures
+
+    def clear(self):
+        self._figures.clear()
+        self._spellings.clear()
@@ -1,18 +1,136 @@
 import os
-from typing import List, Optional, Union
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Union
+import mido
 import music21
-import pretty_midi
+import numpy as np
+from src.instrumentation import instrumented
+
+if TYPE_CHECKING:
+    import pretty_midi
+
+# One row per note. Onsets and offsets are in quarter notes (MIDI ticks / ticks per beat),
+# which is the time base music21 and the harmonic analysis work in.
+NOTE_EVENT_DTYPE = np.dtype([
+    ('onset', np.float64),
+    ('offset', np.float64),
+    ('pitch', np.uint8),
+    ('velocity', np.uint8),
+    ('part', np.uint16),
+])
+
+# Key signature changes: sharps (negative for flats) and mode (0 = major, 1 = minor)
+KEY_SIGNATURE_DTYPE = np.dtype([
+    ('time', np.float64),
+    ('sharps', np.int8),
+    ('mode', np.uint8),
+])
+
+TIME_SIGNATURE_DTYPE = np.dtype([
+    ('time', np.float64),
+    ('numerator', np.uint8),
+    ('denominator', np.uint8),
+])
+
+# mido spells key signatures by tonic name; map them back to the MIDI sharps count
+_MAJOR_KEY_SHARPS = {'Cb': -7, 'Gb': -6, 'Db': -5, 'Ab': -4, 'Eb': -3, 'Bb': -2, 'F': -1, 'C': 0,
+                     'G': 1, 'D': 2, 'A': 3, 'E': 4, 'B': 5, 'F#': 6, 'C#': 7}
+_MINOR_KEY_SHARPS = {'Ab': -7, 'Eb': -6, 'Bb': -5, 'F': -4, 'C': -3, 'G': -2, 'D': -1, 'A': 0,
+                     'E': 1, 'B': 2, 'F#': 3, 'C#': 4, 'G#': 5, 'D#': 6, 'A#': 7}
+
+# Recordings the audio analysis can decode (soundfile natively, the rest through audioread/ffmpeg)
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.ogg', '.aiff', '.aif', '.mp3', '.m4a')
+
+class NoteEvents:
+    """
+    Compact, array-backed representation of a symbolic score.
+
+    Holds a NOTE_EVENT_DTYPE structured array sorted by onset plus key and time
+    signature side tables. A few dozen bytes per note instead of a music21 object
+    graph; convert with to_stream() only when an analysis needs music21.
+    """
+
+    def __init__(self, notes: np.ndarray, key_signatures: Optional[np.ndarray] = None,
+                 time_signatures: Optional[np.ndarray] = None, source: Optional[str] = None):
+        self.notes = notes
+        self.key_signatures = key_signatures if key_signatures is not None else np.zeros(0, KEY_SIGNATURE_DTYPE)
+        self.time_signatures = time_signatures if time_signatures is not None else np.zeros(0, TIME_SIGNATURE_DTYPE)
+        self.source = source
+
+    def __len__(self) -> int:
+        return len(self.notes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.notes.nbytes + self.key_signatures.nbytes + self.time_signatures.nbytes
+
+    @property
+    def duration(self) -> float:
+        """Length of the score in quarter notes."""
+        return float(self.notes['offset'].max()) if len(self.notes) else 0.0
+
+    @classmethod
+    def from_stream(cls, score: music21.stream.Stream) -> "NoteEvents":
+        """Collects the notes (chord members included) of a music21 stream, one part id per Part."""
+        rows = []
+        for part_idx, part in enumerate(score.parts if score.hasPartLikeStreams() else [score]):
+            flat = part.flatten()
+            for element in flat.notes:
+                onset = float(flat.elementOffset(element))
+                offset = onset + float(element.quarterLength)
+                velocity = element.volume.velocity or 64
+                for p in element.pitches:
+                    rows.append((onset, offset, int(p.midi), velocity, part_idx))
+        notes = np.array(rows, dtype=NOTE_EVENT_DTYPE)
+        notes.sort(order=['onset', 'part', 'pitch'])
+        return cls(notes)
+
+    def to_stream(self) -> music21.stream.Score:
+        """Builds a music21 Score with one Part per track."""
+        score = music21.stream.Score()
+        for part_id in np.unique(self.notes['part']):
+            part = music21.stream.Part()
+            part.id = f'Part-{int(part_id) + 1}'
+            for ks in self.key_signatures:
+                mode = 'minor' if ks['mode'] else 'major'
+                part.insert(float(ks['time']), music21.key.KeySignature(int(ks['sharps'])).asKey(mode))
+            for ts in self.time_signatures:
+                part.insert(float(ts['time']), music21.meter.TimeSignature(f"{ts['numerator']}/{ts['denominator']}"))
+            for row in self.notes[self.notes['part'] == part_id]:
+                n = music21.note.Note(int(row['pitch']))
+                n.quarterLength = float(row['offset'] - row['onset'])
+                n.volume.velocity = int(row['velocity'])
+                part.insert(float(row['onset']), n)
+            # Barlines split long notes into tied segments, as converter.parse does for MIDI
+            part.makeMeasures(inPlace=True)
+            part.makeTies(inPlace=True)
+            score.insert(0, part)
+        return score
+
+def output_name(file_path: str, root: str, keep_extension: bool = False) -> str:
+    """
+    Base name for the outputs of a file found under root: its relative path,
+    without the extension unless keep_extension, with directories joined by "__",
+    so same-named files in different directories get different outputs.
+    A file directly in root keeps its plain base name.
+    """
+    rel = os.path.relpath(file_path, root)
+    if not keep_extension:
+        rel = os.path.splitext(rel)[0]
+    return "__".join(rel.split(os.sep))
 
 class MusicDataLoader:
     """
     Handles loading and basic preprocessing of symbolic music data (MusicXML, MIDI).
     """
-    
+
     def __init__(self, data_dir: str = "data"):
         self.data_dir = data_dir
 
-    def load_midi(self, file_path: str) -> Optional[pretty_midi.PrettyMIDI]:
+    @instrumented("load_midi")
+    def load_midi(self, file_path: str) -> Optional["pretty_midi.PrettyMIDI"]:
         """Loads a MIDI file."""
+        # Imported on first use: the NoteEvents and music21 paths do not need it
+        import pretty_midi
         try:
             pm = pretty_midi.PrettyMIDI(file_path)
             return pm
@@ -20,6 +138,61 @@ class MusicDataLoader:
             print(f"Error loading MIDI file {file_path}: {e}")
             return None
 
+    @instrumented("load_note_events")
+    def load_note_events(self, file_path: str) -> Optional[NoteEvents]:
+        """
+        Loads a MIDI file straight into a NoteEvents array, reading the raw
+        messages with mido and never touching music21.
+        """
+        try:
+            mid = mido.MidiFile(file_path)
+        except Exception as e:
+            print(f"Error loading MIDI file {file_path}: {e}")
+            return None
+
+        tpb = float(mid.ticks_per_beat)
+        rows = []
+        key_rows = []
+        time_rows = []
+        for track_idx, track in enumerate(mid.tracks):
+            tick = 0
+            # Pending note-ons per (channel, pitch), matched first-in first-out
+            active: Dict[tuple, list] = {}
+            for msg in track:
+                tick += msg.time
+                if msg.type == 'note_on' and msg.velocity > 0:
+                    active.setdefault((msg.channel, msg.note), []).append((tick, msg.velocity))
+                elif msg.type == 'note_off' or msg.type == 'note_on':
+                    pending = active.get((msg.channel, msg.note))
+                    if pending:
+                        start, velocity = pending.pop(0)
+                        if tick > start:
+                            rows.append((start / tpb, tick / tpb, msg.note, velocity, track_idx))
+                elif msg.type == 'key_signature':
+                    minor = msg.key.endswith('m')
+                    table = _MINOR_KEY_SHARPS if minor else _MAJOR_KEY_SHARPS
+                    tonic = msg.key[:-1] if minor else msg.key
+                    if tonic in table:
+                        key_rows.append((tick / tpb, table[tonic], int(minor)))
+                elif msg.type == 'time_signature':
+                    time_rows.append((tick / tpb, msg.numerator, msg.denominator))
+
+        notes = np.array(rows, dtype=NOTE_EVENT_DTYPE)
+        notes.sort(order=['onset', 'part', 'pitch'])
+        key_signatures = np.unique(np.array(key_rows, dtype=KEY_SIGNATURE_DTYPE))
+        time_signatures = np.unique(np.array(time_rows, dtype=TIME_SIGNATURE_DTYPE))
+        return NoteEvents(notes, key_signatures, time_signatures, source=file_path)
+
+    def load_corpus_note_events(self, extension: str = ".mid") -> Dict[str, NoteEvents]:
+        """Loads every matching file in data_dir as NoteEvents, skipping files that fail."""
+        corpus = {}
+        for file_path in sorted(self.get_files_by_extension(extension)):
+            events = self.load_note_events(file_path)
+            if events is not None:
+                corpus[file_path] = events
+        return corpus
+
+    @instrumented("load_musicxml")
     def load_musicxml(self, file_path: str) -> Optional[music21.stream.Score]:
         """Loads a MusicXML file."""
         try:
@@ -38,8 +211,14 @@ class MusicDataLoader:
                     files.append(os.path.join(root, filename))
         return files
 
+    def get_audio_files(self, extensions: Sequence[str] = AUDIO_EXTENSIONS) -> List[str]:
+        """Recursively finds audio recordings in data_dir, sorted by path."""
+        files = []
+        for extension in extensions:
+            files.extend(self.get_files_by_extension(extension))
+        return sorted(set(files))
+
 if __name__ == "__main__":
     # Example usage
     loader = MusicDataLoader()
     print("MusicDataLoader initialized.")
-
@@ -1,12 +1,71 @@
 import music21
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 from music21 import chord, key, stream
+from src.chord_slicing import SliceFigureMemo, slice_chords
+from src.data_loader import NoteEvents
+from src.instrumentation import instrumented
+from src.key_profiles import KeyProfileEngine, pitch_class_histogram
+from src.key_tracking import LocalKeyTracker, key_label
+
+# Bump whenever a change alters analysis output, so cached results are invalidated
+ANALYZER_VERSION = "1"
+
+class RomanNumeralMemo:
+    """
+    Bounded LRU memo of Roman numeral figures.
+
+    romanNumeralFromChord is by far the most expensive call in the symbolic path,
+    yet the same handful of voicings recurs throughout a piece (and across a corpus).
+    Chords are keyed by their spelling and intervals above the bass, which is all the
+    figure depends on, so octave transpositions of one voicing share an entry.
+    """
+
+    def __init__(self, maxsize: int = 8192):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._figures: "OrderedDict[tuple, str]" = OrderedDict()
+
+    @staticmethod
+    def chord_key(c: chord.Chord, k: key.Key) -> tuple:
+        """Normalized identity of a chord in a key."""
+        bass = c.bass()
+        voicing = tuple(sorted({(p.name, int(p.ps - bass.ps)) for p in c.pitches}))
+        return (bass.name, voicing, k.tonic.name, k.mode)
+
+    def figure(self, c: chord.Chord, k: key.Key) -> str:
+        """Returns the Roman numeral figure of c in k, computing it only on a miss."""
+        memo_key = self.chord_key(c, k)
+        figure = self._figures.get(memo_key)
+        if figure is not None:
+            self.hits += 1
+            self._figures.move_to_end(memo_key)
+            return figure
+        self.misses += 1
+        figure = music21.roman.romanNumeralFromChord(c, k).figure
+        self._figures[memo_key] = figure
+        if len(self._figures) > self.maxsize:
+            self._figures.popitem(last=False)
+        return figure
+
+    def clear(self):
+        self._figures.clear()
+        self.hits = 0
+        self.misses = 0
+
+# Shared by every analysis in the process, so a batch worker reuses figures across files
+rn_memo = RomanNumeralMemo()
+slice_memo = SliceFigureMemo()
 
 class HarmonicAnalyzer:
     """
     Tools for analyzing musical grammar and syntax based on formal music theory.
     """
-    
+
     @staticmethod
+    @instrumented("key")
     def identify_key(score: stream.Score):
         """
         Estimates the key of a music21 stream.
@@ -14,6 +73,20 @@ class HarmonicAnalyzer:
         return score.analyze('key')
 
     @staticmethod
+    @instrumented("key_batch")
+    def identify_keys(note_events_list: list, profile: str = 'aarden') -> List[Tuple[str, str, float]]:
+        """
+        Estimates the key of many scores at once from their NoteEvents, with one
+        batched profile correlation instead of a music21 analysis per score.
+        Returns (tonic, mode, correlation) per score.
+        """
+        if not note_events_list:
+            return []
+        histograms = np.stack([pitch_class_histogram(e.notes) for e in note_events_list])
+        return KeyProfileEngine(profile).key_names(histograms)
+
+    @staticmethod
+    @instrumented("chordify")
     def get_chord_sequence(score: stream.Score):
         """
         Extracts a sequence of chords from a music21 stream.
@@ -26,18 +99,117 @@ class HarmonicAnalyzer:
         return chords
 
     @staticmethod
-    def roman_numeral_analysis(score: stream.Score):
+    @instrumented("chordify")
+    def get_timed_chord_sequence(score: stream.Score) -> Tuple[List[chord.Chord], List[float]]:
+        """
+        Like get_chord_sequence, plus the offset of each chord from the start of
+        the score in quarter notes.
+        """
+        flat = score.chordify().flatten()
+        chords = list(flat.getElementsByClass(chord.Chord))
+        return chords, [float(flat.elementOffset(c)) for c in chords]
+
+    @staticmethod
+    @instrumented("slice")
+    def get_chord_slices(events: NoteEvents, min_duration: float = 0.0, merge: bool = True) -> np.ndarray:
+        """
+        Vertical slices of a NoteEvents score as a CHORD_SLICE_DTYPE array
+        (pitch-class mask and bass per slice); a much cheaper stand-in for
+        get_chord_sequence on large scores. See chord_slicing.slice_chords.
+        """
+        return slice_chords(events.notes, min_duration=min_duration, merge=merge)
+
+    @staticmethod
+    @instrumented("roman_numerals")
+    def slice_roman_numerals(slices: np.ndarray, k: key.Key) -> List[str]:
+        """
+        Labels each chord slice with its Roman numeral figure relative to k.
+        """
+        return slice_memo.figures(slices, k)
+
+    @staticmethod
+    def analyze_events(events: NoteEvents, profile: str = 'aarden', min_duration: float = 0.0,
+                       merge: bool = True) -> Tuple[key.Key, float, List[str]]:
+        """
+        Symbolic analysis straight from NoteEvents, without parsing a music21
+        score: profile-correlation key, then Roman numerals of the chord slices.
+        Returns (key, correlation, rn_sequence) like analyze().
+        """
+        tonic, mode, correlation = KeyProfileEngine(profile).find_keys(pitch_class_histogram(events.notes))
+        name, mode_name = key_label(int(tonic[0]) + 12 * int(mode[0])).split(' ')
+        k = key.Key(name, mode_name)
+        slices = HarmonicAnalyzer.get_chord_slices(events, min_duration=min_duration, merge=merge)
+        return k, float(correlation[0]), HarmonicAnalyzer.slice_roman_numerals(slices, k)
+
+    @staticmethod
+    @instrumented("key_timeline")
+    def key_timeline(score: stream.Score, tracker: Optional[LocalKeyTracker] = None) -> List[Dict[str, Any]]:
+        """
+        Local keys of a score over time (see LocalKeyTracker.timeline); a piece
+        that modulates gets one region per key it passes through.
+        """
+        return (tracker or LocalKeyTracker()).timeline(NoteEvents.from_stream(score).notes)
+
+    @staticmethod
+    @instrumented("roman_numerals")
+    def roman_numerals(chords: List[chord.Chord], k: key.Key) -> List[str]:
+        """
+        Labels each chord with its Roman numeral figure relative to k.
+        """
+        return [rn_memo.figure(c, k) for c in chords]
+
+    @staticmethod
+    @instrumented("roman_numerals")
+    def local_roman_numerals(chords: List[chord.Chord], offsets: List[float],
+                             timeline: List[Dict[str, Any]]) -> List[str]:
+        """
+        Labels each chord relative to the local key in force at its offset.
+        """
+        region_keys = [key.Key(region["key"].split(' ')[0], region["mode"]) for region in timeline]
+        regions = LocalKeyTracker.key_at(timeline, np.asarray(offsets, dtype=np.float64))
+        return [rn_memo.figure(c, region_keys[r]) for c, r in zip(chords, regions)]
+
+    @staticmethod
+    def roman_numeral_analysis(score: stream.Score, local_keys: bool = False):
         """
         Performs a basic Roman Numeral Analysis.
+        With local_keys, chords are labeled in the local key found by key_timeline
+        instead of the global key, which is still returned.
         """
         k = HarmonicAnalyzer.identify_key(score)
+        if local_keys:
+            rn_sequence, _ = HarmonicAnalyzer._local_analysis(score)
+            return k, rn_sequence
         chords = HarmonicAnalyzer.get_chord_sequence(score)
-        rn_sequence = []
-        
-        for c in chords:
-            # music21 can determine Roman Numerals relative to a key
-            rn = music21.roman.romanNumeralFromChord(c, k)
-            rn_sequence.append(rn.figure)
-            
+        # music21 can determine Roman Numerals relative to a key
+        rn_sequence = HarmonicAnalyzer.roman_numerals(chords, k)
         return k, rn_sequence
 
+    @staticmethod
+    def _local_analysis(score: stream.Score, tracker: Optional[LocalKeyTracker] = None
+                        ) -> Tuple[List[str], List[Dict[str, Any]]]:
+        timeline = HarmonicAnalyzer.key_timeline(score, tracker)
+        chords, offsets = HarmonicAnalyzer.get_timed_chord_sequence(score)
+        if not timeline:
+            return [], timeline
+        return HarmonicAnalyzer.local_roman_numerals(chords, offsets, timeline), timeline
+
+    @staticmethod
+    def analyze(score: stream.Score) -> Tuple[key.Key, float, List[str]]:
+        """
+        Single-pass symbolic analysis: the key and the chordified stream are each
+        computed once. Returns (key, confidence, rn_sequence).
+        """
+        k, rn_sequence = HarmonicAnalyzer.roman_numeral_analysis(score)
+        return k, k.correlationCoefficient, rn_sequence
+
+    @staticmethod
+    def analyze_local(score: stream.Score, tracker: Optional[LocalKeyTracker] = None
+                      ) -> Tuple[key.Key, float, List[str], List[Dict[str, Any]]]:
+        """
+        Like analyze, but Roman numerals follow the local key. Also returns the
+        key timeline: (global key, confidence, rn_sequence, timeline).
+        """
+        k = HarmonicAnalyzer.identify_key(score)
+        rn_sequence, timeline = HarmonicAnalyzer._local_analysis(score, tracker)
+        return k, k.correlationCoefficient, rn_sequence, timeline
@@ -0,0 +1,146 @@
+import copy
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import torch
+import torch.nn as nn
+from src.models import MusicTransformer
+
+# A request is a (source tokens, target tokens) pair; its result holds the logits
+# for every target position
+Request = Tuple[Sequence[int], Sequence[int]]
+
+@contextmanager
+def _mha_fastpath(enabled: bool) -> Iterator[None]:
+    # The fused encoder fast path reads Linear.weight directly, which dynamically
+    # quantized layers do not expose as a tensor
+    previous = torch.backends.mha.get_fastpath_enabled()
+    torch.backends.mha.set_fastpath_enabled(enabled)
+    try:
+        yield
+    finally:
+        torch.backends.mha.set_fastpath_enabled(previous)
+
+class InferenceSession:
+    """
+    Batched CPU inference for a MusicTransformer.
+
+    predict() sorts requests by length and groups neighbours into batches of up
+    to max_batch_size, so each batch pads little; padding is masked with key
+    padding masks and the target with a causal mask. Everything runs under
+    torch.inference_mode. Optionally the Linear layers are dynamically quantized
+    to int8 (quantize=True) and the model is compiled with TorchScript
+    (jit="script", or jit="trace", traced on the first batch, which also works
+    for quantized models) or torch.compile (jit="compile"). The fp32 model is
+    kept as the reference for check_parity().
+    """
+
+    def __init__(self, model: MusicTransformer, quantize: bool = False, jit: Optional[str] = None,
+                 max_batch_size: int = 16, pad_token_id: int = 0, num_threads: Optional[int] = None):
+        if jit not in (None, "script", "trace", "compile"):
+            raise ValueError(f"Unknown jit mode: {jit}")
+        if jit == "script" and quantize:
+            raise ValueError("TorchScript cannot script the quantized encoder; use jit='trace' or 'compile'")
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+        self.reference = model.eval()
+        runtime: nn.Module = model
+        if quantize:
+            runtime = torch.ao.quantization.quantize_dynamic(copy.deepcopy(model), {nn.Linear}, dtype=torch.qint8)
+        if jit == "script":
+            runtime = torch.jit.script(runtime)
+        elif jit == "compile":
+            runtime = torch.compile(runtime, dynamic=True)
+        self.runtime = runtime
+        self.quantize = quantize
+        self.jit = jit
+        # Traced graphs are recorded on the unfused path, so they must also run on it
+        self._fastpath = not quantize and jit != "trace"
+        self.max_batch_size = max_batch_size
+        self.pad_token_id = pad_token_id
+
+    def _pad(self, sequences: List[Sequence[int]]) -> Tuple[torch.Tensor, torch.Tensor]:
+        lengths = np.array([len(s) for s in sequences])
+        tokens = np.full((len(sequences), int(lengths.max())), self.pad_token_id, dtype=np.int64)
+        for i, s in enumerate(sequences):
+            tokens[i, :len(s)] = s
+        mask = np.arange(tokens.shape[1])[None, :] >= lengths[:, None]
+        return torch.from_numpy(tokens), torch.from_numpy(mask)
+
+    def batches(self, requests: Sequence[Request], batch_size: Optional[int] = None) -> List[List[int]]:
+        """Request indices grouped into length-sorted batches."""
+        batch_size = batch_size or self.max_batch_size
+        order = sorted(range(len(requests)), key=lambda i: (len(requests[i][0]), len(requests[i][1])))
+        return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+    def run_batch(self, requests: Sequence[Request]) -> torch.Tensor:
+        """Runs one padded batch; returns [batch, max target length, vocab] logits."""
+        src, src_mask = self._pad([r[0] for r in requests])
+        tgt, tgt_mask = self._pad([r[1] for r in requests])
+        causal = MusicTransformer.causal_mask(tgt.shape[1])
+        inputs = (src, tgt, causal, src_mask, tgt_mask)
+        with torch.inference_mode(), _mha_fastpath(self._fastpath):
+            if self.jit == "trace" and not isinstance(self.runtime, torch.jit.ScriptModule):
+                self.runtime = torch.jit.trace(self.runtime, inputs, check_trace=False)
+            return self.runtime(*inputs)
+
+    def predict(self, requests: Sequence[Request], batch_size: Optional[int] = None) -> List[torch.Tensor]:
+        """Logits [len(tgt), vocab] for each request, in request order."""
+        results: List[Optional[torch.Tensor]] = [None] * len(requests)
+        for batch in self.batches(requests, batch_size):
+            logits = self.run_batch([requests[i] for i in batch])
+            for row, i in enumerate(batch):
+                results[i] = logits[row, :len(requests[i][1])]
+        return results
+
+    def check_parity(self, requests: Sequence[Request], atol: Optional[float] = None,
+                     min_agreement: float = 0.95) -> Dict[str, float]:
+        """
+        Compares predict() with the fp32 reference model run one unpadded request
+        at a time. Returns the max absolute logit difference, the share of target
+        positions whose top-1 token agrees and whether both are within bounds.
+        atol defaults to 1e-4, or no bound for quantized sessions, whose logits
+        legitimately move; those are held to min_agreement instead.
+        """
+        if atol is None:
+            atol = float('inf') if self.quantize else 1e-4
+        outputs = self.predict(requests)
+        max_diff = 0.0
+        agree = total = 0
+        with torch.inference_mode():
+            for (src, tgt), out in zip(requests, outputs):
+                src_t = torch.tensor([list(src)], dtype=torch.long)
+                tgt_t = torch.tensor([list(tgt)], dtype=torch.long)
+                ref = self.reference(src_t, tgt_t, MusicTransformer.causal_mask(len(tgt)))[0]
+                max_diff = max(max_diff, (ref - out).abs().max().item())
+                agree += int((ref.argmax(-1) == out.argmax(-1)).sum())
+                total += len(tgt)
+        agreement = agree / total if total else 1.0
+        return {"max_abs_diff": max_diff, "top1_agreement": agreement,
+                "ok": max_diff <= atol and agreement >= min_agreement}
+
+    def benchmark(self, requests: Sequence[Request], batch_sizes: Sequence[int] = (1, 4, 16, 32),
+                  repeats: int = 3) -> Dict[int, Dict[str, float]]:
+        """
+        Throughput per batch size: sequences/s over all requests and mean, p50
+        and p99 latency of one batch, in milliseconds.
+        """
+        report = {}
+        for batch_size in batch_sizes:
+            batches = [[requests[i] for i in b] for b in self.batches(requests, batch_size)]
+            self.run_batch(batches[0])  # warm-up (and compilation for jit="compile")
+            latencies = []
+            for _ in range(repeats):
+                for batch in batches:
+                    t = time.perf_counter()
+                    self.run_batch(batch)
+                    latencies.append(time.perf_counter() - t)
+            total = sum(latencies)
+            report[batch_size] = {
+                "sequences_per_s": len(requests) * repeats / total if total else 0.0,
+                "mean_ms": total / len(latencies) * 1e3,
+                "p50_ms": float(np.percentile(latencies, 50)) * 1e3,
+                "p99_ms": float(np.percentile(latencies, 99)) * 1e3,
+            }
+        return report
@@ -0,0 +1,194 @@
+import os
+import json
+import functools
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+class _NullStage:
+    """Shared no-op context manager returned while instrumentation is disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ('inst', 'name', 'wall', 'cpu', 'mem_start', 'child_peak', 'child_wall')
+
+    def __init__(self, inst: "Instrumentation", name: str):
+        self.inst = inst
+        self.name = name
+        self.child_peak = 0
+        self.child_wall = 0.0
+
+    def __enter__(self):
+        inst = self.inst
+        stack = inst._local_stack()
+        if inst.trace_memory:
+            self.mem_start, outer_peak = tracemalloc.get_traced_memory()
+            if stack:
+                # Resetting the peak below would lose the enclosing stage's high-water mark
+                stack[-1].child_peak = max(stack[-1].child_peak, outer_peak)
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        inst = self.inst
+        stack = inst._local_stack()
+        stack.pop()
+        peak = None
+        if inst.trace_memory:
+            absolute_peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            peak = absolute_peak - self.mem_start
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, absolute_peak)
+        if stack:
+            stack[-1].child_wall += wall
+        inst._record(self.name, self.wall, wall, wall - self.child_wall, cpu, peak)
+        return False
+
+class Instrumentation:
+    """
+    Opt-in per-stage timing and memory instrumentation.
+
+    Code marks its stages with `with get_instrumentation().stage("parse"):`.
+    While disabled (the default) stage() returns a shared no-op context manager,
+    so the cost is two attribute checks per stage. When enabled, each stage records
+    wall time (inclusive of nested stages, plus "self" time excluding them), process
+    CPU time and, with trace_memory, the tracemalloc peak above the stage's starting
+    allocation. Stages are rolled up into every open scope()
+    and, if trace_path is set, appended to a Chrome trace file (one JSON event per
+    line, loadable in chrome://tracing or Perfetto).
+
+    A listener, if set, is called with the name of every stage as it starts,
+    enabled or not, so a supervisor can tell where a stuck process is.
+    """
+
+    def __init__(self, enabled: bool = False, trace_memory: bool = False, trace_path: Optional[str] = None):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.trace_path = trace_path if enabled else None
+        self.listener: Optional[Callable[[str], None]] = None
+        self._local = threading.local()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _local_stack(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _scopes(self) -> List[Dict[str, Dict[str, float]]]:
+        scopes = getattr(self._local, 'scopes', None)
+        if scopes is None:
+            scopes = self._local.scopes = []
+        return scopes
+
+    def stage(self, name: str):
+        if self.listener is not None:
+            self.listener(name)
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    @contextmanager
+    def scope(self):
+        """
+        Collects the stages run inside the block into a dict of
+        {stage: {"wall": s, "self": s, "cpu": s, "calls": n, "peak_mem": bytes}}.
+        """
+        timings: Dict[str, Dict[str, float]] = {}
+        if not self.enabled:
+            yield timings
+            return
+        scopes = self._scopes()
+        scopes.append(timings)
+        try:
+            yield timings
+        finally:
+            scopes.remove(timings)
+
+    def _record(self, name: str, start: float, wall: float, self_wall: float, cpu: float, peak: Optional[int]):
+        for timings in self._scopes():
+            entry = timings.get(name)
+            if entry is None:
+                entry = timings[name] = {"wall": 0.0, "self": 0.0, "cpu": 0.0, "calls": 0}
+            entry["wall"] += wall
+            entry["self"] += self_wall
+            entry["cpu"] += cpu
+            entry["calls"] += 1
+            if peak is not None:
+                entry["peak_mem"] = max(entry.get("peak_mem", 0), peak)
+        if self.trace_path:
+            event: Dict[str, Any] = {
+                "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                "ts": start * 1e6, "dur": wall * 1e6, "args": {"self": self_wall, "cpu": cpu},
+            }
+            if peak is not None:
+                event["args"]["peak_mem"] = peak
+            # One short O_APPEND write per event, so concurrent workers can share the file
+            with open(self.trace_path, 'a') as f:
+                f.write(json.dumps(event) + ",\n")
+
+    def start_trace(self):
+        """Starts a fresh trace file (call once, before any worker writes to it)."""
+        if self.trace_path:
+            with open(self.trace_path, 'w') as f:
+                f.write("[\n")
+
+_instrumentation = Instrumentation()
+
+def get_instrumentation() -> Instrumentation:
+    return _instrumentation
+
+def set_instrumentation(inst: Instrumentation) -> Instrumentation:
+    """Installs inst as the process-wide instrumentation and returns it."""
+    global _instrumentation
+    _instrumentation = inst
+    return inst
+
+def configure(enabled: bool = True, trace_memory: bool = False, trace_path: Optional[str] = None) -> Instrumentation:
+    """Convenience wrapper, also usable as a process-pool initializer."""
+    return set_instrumentation(Instrumentation(enabled, trace_memory, trace_path))
+
+def instrumented(name: str) -> Callable:
+    """Decorator that runs the whole function as one stage."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            inst = _instrumentation
+            if inst.listener is not None:
+                inst.listener(name)
+            if not inst.enabled:
+                return func(*args, **kwargs)
+            with _Stage(inst, name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def rollup(timings_list: List[Dict[str, Dict[str, float]]]) -> Dict[str, Dict[str, float]]:
+    """Sums per-file timings into per-stage totals."""
+    totals: Dict[str, Dict[str, float]] = {}
+    for timings in timings_list:
+        for name, entry in timings.items():
+            total = totals.setdefault(name, {"wall": 0.0, "self": 0.0, "cpu": 0.0, "calls": 0})
+            total["wall"] += entry["wall"]
+            total["self"] += entry["self"]
+            total["cpu"] += entry["cpu"]
+            total["calls"] += entry["calls"]
+            if "peak_mem" in entry:
+                total["peak_mem"] = max(total.get("peak_mem", 0), entry["peak_mem"])
+    return totals
@@ -0,0 +1,70 @@
+import numpy as np
+from typing import Dict, List, Tuple
+
+PITCH_CLASSES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# Major and minor key profiles, tonic first (same values music21 uses for its key analyzers)
+KEY_PROFILES: Dict[str, Tuple[List[float], List[float]]] = {
+    'krumhansl': (
+        [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88],
+        [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17],
+    ),
+    'temperley': (
+        [0.748, 0.060, 0.488, 0.082, 0.670, 0.460, 0.096, 0.715, 0.104, 0.366, 0.057, 0.400],
+        [0.712, 0.084, 0.474, 0.618, 0.049, 0.460, 0.105, 0.747, 0.404, 0.067, 0.133, 0.330],
+    ),
+    'aarden': (
+        [17.7661, 0.145624, 14.9265, 0.160186, 19.8049, 11.3587, 0.291248, 22.062, 0.145624, 8.15494, 0.232998, 4.95122],
+        [18.2648, 0.737619, 14.0499, 16.8599, 0.702494, 14.4362, 0.702494, 18.6161, 4.56621, 1.93186, 7.37619, 1.75623],
+    ),
+}
+
+def pitch_class_histogram(notes: np.ndarray) -> np.ndarray:
+    """Duration-weighted pitch-class histogram of a NOTE_EVENT_DTYPE array."""
+    weights = notes['offset'] - notes['onset']
+    return np.bincount(notes['pitch'] % 12, weights=weights, minlength=12)
+
+class KeyProfileEngine:
+    """
+    Batched key finding by profile correlation (Krumhansl-Schmuckler).
+
+    The 24 rotated major/minor profiles are standardized once; a whole (N, 12)
+    matrix of pitch-class histograms or chroma vectors is then scored against all
+    of them with a single matrix multiply. Row k of the profile matrix is the key
+    with tonic k % 12, major for k < 12 and minor otherwise.
+    """
+
+    def __init__(self, profile: str = 'krumhansl'):
+        if profile not in KEY_PROFILES:
+            raise ValueError(f"Unknown key profile: {profile}")
+        self.profile = profile
+        major, minor = (np.asarray(p, dtype=np.float64) for p in KEY_PROFILES[profile])
+        rotations = [np.roll(major, tonic) for tonic in range(12)] + [np.roll(minor, tonic) for tonic in range(12)]
+        self.matrix = self._standardize(np.stack(rotations))
+
+    @staticmethod
+    def _standardize(x: np.ndarray) -> np.ndarray:
+        """Zero mean, unit norm rows; constant rows become all zeros (correlation 0)."""
+        centered = x - x.mean(axis=1, keepdims=True)
+        norms = np.linalg.norm(centered, axis=1, keepdims=True)
+        return np.divide(centered, norms, out=np.zeros_like(centered), where=norms > 0)
+
+    def correlate(self, histograms: np.ndarray) -> np.ndarray:
+        """Pearson correlation of each row of an (N, 12) matrix with all 24 keys, shape (N, 24)."""
+        h = np.atleast_2d(np.asarray(histograms, dtype=np.float64))
+        return self._standardize(h) @ self.matrix.T
+
+    def find_keys(self, histograms: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Best key per row. Returns (tonic pitch classes, modes, correlations) where
+        modes holds 0 for major and 1 for minor.
+        """
+        corr = self.correlate(histograms)
+        best = np.argmax(corr, axis=1)
+        return best % 12, best // 12, corr[np.arange(len(best)), best]
+
+    def key_names(self, histograms: np.ndarray) -> List[Tuple[str, str, float]]:
+        """Best key per row as (tonic name, 'major' | 'minor', correlation)."""
+        tonics, modes, correlations = self.find_keys(histograms)
+        return [(PITCH_CLASSES[t], 'minor' if m else 'major', float(c))
+                for t, m, c in zip(tonics, modes, correlations)]
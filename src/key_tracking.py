@@ -0,0 +1,151 @@
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+from src.key_profiles import KeyProfileEngine
+
+# Tonic spellings with the fewest accidentals, per mode, indexed by pitch class (music21 names)
+MAJOR_TONICS = ['C', 'D-', 'D', 'E-', 'E', 'F', 'F#', 'G', 'A-', 'A', 'B-', 'B']
+MINOR_TONICS = ['C', 'C#', 'D', 'E-', 'E', 'F', 'F#', 'G', 'G#', 'A', 'B-', 'B']
+
+def key_label(key_index: int) -> str:
+    """"tonic mode" name of a KeyProfileEngine key index (tonic k % 12, minor for k >= 12)."""
+    if key_index >= 12:
+        return f"{MINOR_TONICS[key_index % 12]} minor"
+    return f"{MAJOR_TONICS[key_index]} major"
+
+def key_distances() -> np.ndarray:
+    """
+    (24, 24) distances between keys: steps around the circle of fifths between
+    their key signatures, plus one half step for a change of mode, so relative
+    keys are 0.5 apart and parallel keys 3.5.
+    """
+    index = np.arange(24)
+    # A minor key shares its signature with the major key a minor third up
+    signature = (index % 12 + 3 * (index >= 12)) % 12
+    fifths = (signature * 7) % 12
+    steps = np.abs(fifths[:, None] - fifths[None, :])
+    steps = np.minimum(steps, 12 - steps).astype(np.float64)
+    return steps + 0.5 * ((index[:, None] >= 12) != (index[None, :] >= 12))
+
+def frame_histograms(notes: np.ndarray, hop: float, n_frames: Optional[int] = None) -> np.ndarray:
+    """
+    (n_frames, 12) pitch-class durations per frame of `hop` quarter notes: each
+    note adds the length of its overlap with every frame it spans. Built from
+    difference arrays, so the cost is O(notes + frames) however long the notes are.
+    """
+    if n_frames is None:
+        n_frames = int(np.ceil(notes['offset'].max() / hop)) if len(notes) else 0
+    frames = np.zeros((n_frames + 1, 12))
+    if len(notes) == 0 or n_frames == 0:
+        return frames[:n_frames]
+    onset = notes['onset'] / hop
+    offset = np.minimum(notes['offset'] / hop, n_frames)
+    pc = notes['pitch'].astype(np.int64) % 12
+    first = np.floor(onset).astype(np.int64)
+    last = np.minimum(np.ceil(offset).astype(np.int64) - 1, n_frames - 1)
+    keep = (offset > onset) & (first < n_frames)
+    onset, offset, pc, first, last = onset[keep], offset[keep], pc[keep], first[keep], last[keep]
+    # Every frame from first to last gets a full hop, through a cumulative sum
+    # of +1 / -1 markers; the partial first and last frames are corrected after
+    coverage = np.zeros((n_frames + 1, 12))
+    np.add.at(coverage, (first, pc), 1.0)
+    np.add.at(coverage, (last + 1, pc), -1.0)
+    frames += np.cumsum(coverage, axis=0)
+    np.add.at(frames, (first, pc), -(onset - first))
+    np.add.at(frames, (last, pc), -(last + 1 - offset))
+    return frames[:n_frames] * hop
+
+def sliding_sums(frames: np.ndarray, width: int) -> np.ndarray:
+    """
+    Sum over a window of `width` frames centred on each frame (zero beyond the
+    ends). The running total adds the frame entering the window and subtracts
+    the one leaving it, written as a difference of prefix sums.
+    """
+    before = width // 2
+    padded = np.concatenate([np.zeros((before + 1, frames.shape[1])), frames,
+                             np.zeros((width - before, frames.shape[1]))])
+    totals = np.cumsum(padded, axis=0)
+    return totals[width:width + len(frames)] - totals[:len(frames)]
+
+def viterbi(log_emissions: np.ndarray, log_transitions: np.ndarray) -> np.ndarray:
+    """Most likely state path; O(frames x states^2)."""
+    n_frames, n_states = log_emissions.shape
+    back = np.zeros((n_frames, n_states), dtype=np.int64)
+    score = log_emissions[0].copy()
+    for t in range(1, n_frames):
+        candidates = score[:, None] + log_transitions
+        back[t] = np.argmax(candidates, axis=0)
+        score = candidates[back[t], np.arange(n_states)] + log_emissions[t]
+    path = np.zeros(n_frames, dtype=np.int64)
+    path[-1] = int(np.argmax(score))
+    for t in range(n_frames - 1, 0, -1):
+        path[t - 1] = back[t, path[t]]
+    return path
+
+class LocalKeyTracker:
+    """
+    Sliding-window key analysis of NoteEvents.
+
+    The score is cut into frames of `hop` quarter notes, each frame gets a
+    duration-weighted pitch-class histogram, and a running sum over `window`
+    quarter notes (centred on the frame) gives every frame its local histogram.
+    All frames are scored against the 24 keys in one KeyProfileEngine matrix
+    multiply. With smoothing, a Viterbi pass over the key scores trades
+    per-frame fit against a cost for each modulation that grows with the
+    distance between the keys, so brief borrowed chords do not register as
+    modulations. Everything is linear in the length of the piece.
+    """
+
+    def __init__(self, profile: str = 'aarden', window: float = 8.0, hop: float = 1.0, smoothing: bool = True,
+                 switch_penalty: float = 2.0, distance_penalty: float = 0.25, sharpness: float = 10.0):
+        self.engine = KeyProfileEngine(profile)
+        self.window = window
+        self.hop = hop
+        self.smoothing = smoothing
+        self.sharpness = sharpness
+        self.log_transitions = -(switch_penalty + distance_penalty * key_distances()) * (1 - np.eye(24))
+
+    def histograms(self, notes: np.ndarray) -> np.ndarray:
+        """(frames, 12) local pitch-class histograms of a NOTE_EVENT_DTYPE array."""
+        width = max(1, int(round(self.window / self.hop)))
+        return sliding_sums(frame_histograms(notes, self.hop), width)
+
+    def scores(self, notes: np.ndarray) -> np.ndarray:
+        """(frames, 24) profile correlation of each frame's window with every key."""
+        return self.engine.correlate(self.histograms(notes)) if len(notes) else np.zeros((0, 24))
+
+    def frame_keys(self, notes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Key index (see key_label) and correlation per frame."""
+        scores = self.scores(notes)
+        if len(scores) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        if self.smoothing:
+            path = viterbi(self.sharpness * scores, self.log_transitions)
+        else:
+            path = np.argmax(scores, axis=1)
+        return path, scores[np.arange(len(path)), path]
+
+    def timeline(self, notes: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Key regions in score order: dicts with start and end (quarter notes), key
+        ("E- major"), tonic pitch class, mode and mean correlation.
+        """
+        path, correlation = self.frame_keys(notes)
+        regions = []
+        if len(path) == 0:
+            return regions
+        changes = np.flatnonzero(np.diff(path)) + 1
+        bounds = np.concatenate([[0], changes, [len(path)]])
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            k = int(path[start])
+            regions.append({"start": float(start * self.hop), "end": float(stop * self.hop), "key": key_label(k),
+                            "tonic": k % 12, "mode": "minor" if k >= 12 else "major",
+                            "confidence": float(correlation[start:stop].mean())})
+        return regions
+
+    @staticmethod
+    def key_at(timeline: List[Dict[str, Any]], times: np.ndarray) -> np.ndarray:
+        """Index into timeline of the region holding each time (the first or last region beyond the ends)."""
+        if not timeline:
+            return np.zeros(len(times), dtype=np.int64)
+        starts = np.array([region["start"] for region in timeline])
+        return np.clip(np.searchsorted(starts, times, side='right') - 1, 0, len(timeline) - 1)
@@ -1,5 +1,7 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
+from typing import Optional, Tuple
 
 class MusicTransformer(nn.Module):
     """
@@ -18,21 +20,199 @@ class MusicTransformer(nn.Module):
         )
         self.fc_out = nn.Linear(d_model, vocab_size)
 
-    def forward(self, src, tgt):
+    @staticmethod
+    def causal_mask(size: int, device=None) -> torch.Tensor:
+        """Float mask that stops each target position attending to later ones."""
+        return nn.Transformer.generate_square_subsequent_mask(size, device=device)
+
+    def forward(self, src, tgt, tgt_mask=None, src_key_padding_mask=None, tgt_key_padding_mask=None):
         """
         src: [batch_size, seq_len]
         tgt: [batch_size, seq_len]
+        tgt_mask: optional [tgt_len, tgt_len] attention mask, e.g. causal_mask(tgt_len)
+        *_key_padding_mask: optional [batch_size, seq_len] bool masks, True at padding
         """
         src_emb = self.embedding(src)
         tgt_emb = self.embedding(tgt)
-        out = self.transformer(src_emb, tgt_emb)
+        out = self.transformer(src_emb, tgt_emb, tgt_mask=tgt_mask,
+                               src_key_padding_mask=src_key_padding_mask,
+                               tgt_key_padding_mask=tgt_key_padding_mask,
+                               memory_key_padding_mask=src_key_padding_mask)
         return self.fc_out(out)
 
+    def encode(self, src, src_key_padding_mask=None):
+        """Runs the encoder once; the result is reused by every decoding step."""
+        return self.transformer.encoder(self.embedding(src), src_key_padding_mask=src_key_padding_mask)
+
+    # --- Incremental decoding -------------------------------------------------
+
+    @staticmethod
+    def _split_heads(x: torch.Tensor, nhead: int) -> torch.Tensor:
+        b, t, d = x.shape
+        return x.view(b, t, nhead, d // nhead).transpose(1, 2)
+
+    @staticmethod
+    def _merge_heads(x: torch.Tensor) -> torch.Tensor:
+        b, h, t, hd = x.shape
+        return x.transpose(1, 2).reshape(b, t, h * hd)
+
+    def _project(self, attn: nn.MultiheadAttention, x: torch.Tensor, index: int) -> torch.Tensor:
+        """Applies the query (0), key (1) or value (2) input projection of attn and splits heads."""
+        d = attn.embed_dim
+        weight = attn.in_proj_weight[index * d:(index + 1) * d]
+        bias = attn.in_proj_bias[index * d:(index + 1) * d] if attn.in_proj_bias is not None else None
+        return self._split_heads(F.linear(x, weight, bias), attn.num_heads)
+
+    def init_cache(self, memory: torch.Tensor, max_len: int, src_key_padding_mask=None) -> dict:
+        """
+        Builds the decoding cache: per layer, preallocated self-attention keys/values for
+        max_len positions and the cross-attention keys/values of memory (computed once).
+        """
+        layers = self.transformer.decoder.layers
+        b = memory.shape[0]
+        cache = {"length": 0, "self": [], "cross": [], "memory_mask": None}
+        if src_key_padding_mask is not None:
+            # SDPA boolean masks mark the positions that may be attended to
+            cache["memory_mask"] = ~src_key_padding_mask[:, None, None, :]
+        for layer in layers:
+            attn = layer.self_attn
+            hd = attn.embed_dim // attn.num_heads
+            shape = (b, attn.num_heads, max_len, hd)
+            cache["self"].append((memory.new_zeros(shape), memory.new_zeros(shape)))
+            cross = layer.multihead_attn
+            cache["cross"].append((self._project(cross, memory, 1), self._project(cross, memory, 2)))
+        return cache
+
+    def _decoder_step(self, x: torch.Tensor, cache: dict) -> torch.Tensor:
+        """Decodes one new position per sequence, x: [batch, 1, d_model]."""
+        pos = cache["length"]
+        for i, layer in enumerate(self.transformer.decoder.layers):
+            def self_block(h):
+                attn = layer.self_attn
+                keys, values = cache["self"][i]
+                keys[:, :, pos:pos + 1] = self._project(attn, h, 1)
+                values[:, :, pos:pos + 1] = self._project(attn, h, 2)
+                out = F.scaled_dot_product_attention(self._project(attn, h, 0),
+                                                     keys[:, :, :pos + 1], values[:, :, :pos + 1])
+                return attn.out_proj(self._merge_heads(out))
+
+            def cross_block(h):
+                attn = layer.multihead_attn
+                keys, values = cache["cross"][i]
+                out = F.scaled_dot_product_attention(self._project(attn, h, 0), keys, values,
+                                                     attn_mask=cache["memory_mask"])
+                return attn.out_proj(self._merge_heads(out))
+
+            def ff_block(h):
+                return layer.linear2(layer.dropout(layer.activation(layer.linear1(h))))
+
+            if layer.norm_first:
+                x = x + self_block(layer.norm1(x))
+                x = x + cross_block(layer.norm2(x))
+                x = x + ff_block(layer.norm3(x))
+            else:
+                x = layer.norm1(x + self_block(x))
+                x = layer.norm2(x + cross_block(x))
+                x = layer.norm3(x + ff_block(x))
+        cache["length"] = pos + 1
+        if self.transformer.decoder.norm is not None:
+            x = self.transformer.decoder.norm(x)
+        return x
+
+    def step(self, tokens: torch.Tensor, cache: dict) -> torch.Tensor:
+        """Feeds one token per sequence ([batch]) through the cached decoder; returns [batch, vocab] logits."""
+        return self.fc_out(self._decoder_step(self.embedding(tokens[:, None]), cache))[:, 0]
+
+    @torch.no_grad()
+    def cached_logits(self, src, tgt, src_key_padding_mask=None) -> torch.Tensor:
+        """Teacher-forced logits for tgt computed one position at a time through the KV cache."""
+        memory = self.encode(src, src_key_padding_mask)
+        cache = self.init_cache(memory, tgt.shape[1], src_key_padding_mask)
+        return torch.stack([self.step(tgt[:, t], cache) for t in range(tgt.shape[1])], dim=1)
+
+    @torch.no_grad()
+    def check_cache_parity(self, src, tgt, atol: float = 1e-4) -> Tuple[bool, float]:
+        """
+        Compares cached incremental logits with a full causally-masked forward pass.
+        Returns (within tolerance, max absolute difference).
+        """
+        was_training = self.training
+        self.eval()
+        try:
+            full = self(src, tgt, tgt_mask=self.causal_mask(tgt.shape[1], device=tgt.device))
+            cached = self.cached_logits(src, tgt)
+        finally:
+            self.train(was_training)
+        diff = (full - cached).abs().max().item()
+        return diff <= atol, diff
+
+    @torch.no_grad()
+    def generate(self, src, max_new_tokens: int, bos_token_id: int = 0, eos_token_id: Optional[int] = None,
+                 pad_token_id: Optional[int] = None, do_sample: bool = False, temperature: float = 1.0,
+                 top_k: Optional[int] = None, src_key_padding_mask=None, use_cache: bool = True,
+                 generator: Optional[torch.Generator] = None) -> torch.Tensor:
+        """
+        Autoregressively generates up to max_new_tokens tokens per source sequence.
+
+        src is encoded once. With use_cache the decoder keeps self-attention keys and
+        values across steps, so each step costs one position rather than a full
+        re-decode of the prefix. Decoding is greedy unless do_sample, in which case
+        logits are divided by temperature and optionally restricted to the top_k
+        candidates. Sequences that emit eos_token_id stop and are padded with
+        pad_token_id (default: eos_token_id); generation ends once all have stopped.
+
+        Returns [batch, 1 + generated] token ids, starting with bos_token_id.
+        """
+        was_training = self.training
+        self.eval()
+        try:
+            b = src.shape[0]
+            device = src.device
+            if pad_token_id is None:
+                pad_token_id = eos_token_id if eos_token_id is not None else bos_token_id
+            tokens = torch.full((b, 1), bos_token_id, dtype=torch.long, device=device)
+            finished = torch.zeros(b, dtype=torch.bool, device=device)
+            memory = self.encode(src, src_key_padding_mask)
+            cache = self.init_cache(memory, max_new_tokens, src_key_padding_mask) if use_cache else None
+
+            for _ in range(max_new_tokens):
+                if use_cache:
+                    logits = self.step(tokens[:, -1], cache)
+                else:
+                    # Reference path: re-decode the whole prefix every step
+                    t = tokens.shape[1]
+                    out = self.transformer.decoder(self.embedding(tokens), memory,
+                                                   tgt_mask=self.causal_mask(t, device=device),
+                                                   memory_key_padding_mask=src_key_padding_mask)
+                    logits = self.fc_out(out[:, -1])
+
+                if do_sample:
+                    logits = logits / max(temperature, 1e-6)
+                    if top_k is not None and top_k < logits.shape[-1]:
+                        kth = torch.topk(logits, top_k, dim=-1).values[:, -1:]
+                        logits = logits.masked_fill(logits < kth, float('-inf'))
+                    next_tokens = torch.multinomial(F.softmax(logits, dim=-1), 1, generator=generator)[:, 0]
+                else:
+                    next_tokens = logits.argmax(dim=-1)
+
+                next_tokens = next_tokens.masked_fill(finished, pad_token_id)
+                tokens = torch.cat([tokens, next_tokens[:, None]], dim=1)
+                if eos_token_id is not None:
+                    finished |= next_tokens == eos_token_id
+                    if bool(finished.all()):
+                        break
+            return tokens
+        finally:
+            self.train(was_training)
+
 class GenerativeModelFactory:
     @staticmethod
     def create_model(model_type: str, **kwargs):
+        """
+        Creates a model by type. "transformer" returns a MusicTransformer, which
+        supports KV-cached autoregressive decoding through generate().
+        """
         if model_type == "transformer":
             return MusicTransformer(**kwargs)
         else:
             raise ValueError(f"Unknown model type: {model_type}")
-
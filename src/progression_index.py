@@ -0,0 +1,613 @@
+import os
+import re
+import json
+import shutil
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Accidentals, the numeral itself (longest first) and the rest of the figure
+_FIGURE_RE = re.compile(r'^(?P<acc>[b#-]*)(?P<num>VII|VI|IV|V|III|II|I|vii|vi|iv|v|iii|ii|i)(?P<rest>.*)$')
+_QUALITY_RE = re.compile(r'^(/o|ø|o|\+)')
+_DEGREE_PC = {'I': 0, 'II': 2, 'III': 4, 'IV': 5, 'V': 7, 'VI': 9, 'VII': 11}
+_PC_NUMERAL = ['I', 'bII', 'II', 'bIII', 'III', 'IV', '#IV', 'V', 'bVI', 'VI', 'bVII', 'VII']
+
+# Query syntax: "*" matches any one chord, "..." (or "...N") skips up to max_gap (or N) chords
+WILDCARD = '*'
+GAP = '...'
+_ARROWS = {'->', '→', '-'}
+
+# n-gram keys are polynomial hashes of per-chord units; the unit packs a root
+# (0-11, 12 when the figure has no numeral) above a quality id
+_HASH_PRIME = np.uint64(0x100000001B3)
+_ROOT_SHIFT = 20
+_NO_ROOT = 12
+
+def parse_figure(figure: str, strip_inversions: bool = False) -> Tuple[str, int, str]:
+    """
+    Splits a Roman numeral figure into (indexed token, root, quality).
+
+    The root is the pitch class of the numeral relative to the tonic (0-11), or
+    -1 for figures without a numeral (e.g. "It6"); the quality is the numeral's
+    case and any o/ø/+ sign, followed by the figured bass unless
+    strip_inversions is set, in which case the token drops it too ("V65" -> "V").
+    """
+    match = _FIGURE_RE.match(figure)
+    # A letter right after the numeral ("It6", "Ger65") means it was not a numeral after all
+    if match is None or re.match(r'^(?![ob]|ø)[A-Za-z]|^b(?![\d#b-])', match['rest']):
+        return figure, -1, f"?{figure}"
+    acc, num, rest = match['acc'], match['num'], match['rest']
+    quality_sign = _QUALITY_RE.match(rest)
+    sign = quality_sign.group(0) if quality_sign else ""
+    root = (_DEGREE_PC[num.upper()] + acc.count('#') - acc.count('b') - acc.count('-')) % 12
+    quality = ('M' if num.isupper() else 'm') + sign
+    # Applied chords ("V7/V") are rooted on the degree they tonicize
+    applied = re.search(r'/([b#-]*)(VII|VI|IV|V|III|II|I|vii|vi|iv|v|iii|ii|i)$', rest)
+    if applied:
+        root = (root + _DEGREE_PC[applied.group(2).upper()] + applied.group(1).count('#')
+                - applied.group(1).count('b') - applied.group(1).count('-')) % 12
+    if strip_inversions:
+        return acc + num + sign + (applied.group(0) if applied else ""), root, quality
+    return figure, root, quality + rest[len(sign):]
+
+def style_of(filename: str) -> str:
+    """
+    Default style label of a corpus file: "century_NN" for the historical
+    samples, otherwise the name up to its first numbered part ("sample", "synth").
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    century = re.match(r'^century_(\d+)', stem)
+    if century:
+        return f"century_{century.group(1)}"
+    return re.split(r'_\d', stem, maxsplit=1)[0]
+
+class _Segment:
+    """One immutable, memory-mapped slice of the index."""
+
+    def __init__(self, path: str, max_n: int):
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "docs.json"), 'r') as f:
+            self.docs: List[Dict[str, Any]] = json.load(f)
+        self.doc_starts = np.load(os.path.join(path, "doc_starts.npy"))
+        self.tokens = np.load(os.path.join(path, "tokens.npy"), mmap_mode='r')
+        self.keys = [np.load(os.path.join(path, f"ngram-{n}-keys.npy"), mmap_mode='r') for n in range(1, max_n + 1)]
+        self.starts = [np.load(os.path.join(path, f"ngram-{n}-starts.npy"), mmap_mode='r') for n in range(1, max_n + 1)]
+        self.postings = [np.load(os.path.join(path, f"ngram-{n}-postings.npy"), mmap_mode='r')
+                         for n in range(1, max_n + 1)]
+        self.live = np.ones(len(self.docs), dtype=bool)
+
+    def doc_of(self, positions: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.doc_starts, positions, side='right') - 1
+
+    def lookup(self, n: int, key: np.uint64) -> np.ndarray:
+        keys = self.keys[n - 1]
+        i = int(np.searchsorted(keys, key))
+        if i == len(keys) or keys[i] != key:
+            return np.zeros(0, dtype=np.int64)
+        starts = self.starts[n - 1]
+        return np.asarray(self.postings[n - 1][starts[i]:starts[i + 1]], dtype=np.int64)
+
+    def doc_tokens(self, doc: int) -> np.ndarray:
+        return np.asarray(self.tokens[self.doc_starts[doc]:self.doc_starts[doc + 1]])
+
+class ProgressionIndex:
+    """
+    Inverted index from Roman numeral n-grams to (file, chord position) postings.
+
+    Each chord figure is mapped to a token id in a vocabulary shared by the whole
+    index; strip_inversions keys chords by numeral and quality only. With
+    transpose, n-grams are keyed by root intervals relative to their first chord,
+    so "ii V I" also finds "vi II V". Every n-gram of 1..max_n chords is stored
+    as sorted hash keys with offsets into a posting array of chord positions.
+
+    The index lives in a directory of immutable segments, each written by one
+    add() and read back through np.load(mmap_mode='r'), so opening the index and
+    querying it only touches the pages a query needs. Re-adding a file
+    supersedes its earlier postings and remove() hides files; compact() merges
+    all segments into one and drops superseded postings. A query looks up the
+    rarest n-gram of each run of concrete chords and verifies the candidates
+    against the token stream, so hash collisions never produce false matches.
+    """
+
+    def __init__(self, path: str = "result/progression_index", max_n: int = 4, strip_inversions: bool = False,
+                 transpose: bool = False, max_segments: int = 16):
+        self.path = path
+        self.max_segments = max_segments
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        else:
+            meta = {"max_n": max_n, "strip_inversions": strip_inversions, "transpose": transpose,
+                    "vocab": [], "roots": [], "qualities": [], "segments": [], "removed": []}
+        # An existing index keeps the options it was built with
+        self.max_n = meta["max_n"]
+        self.strip_inversions = meta["strip_inversions"]
+        self.transpose = meta["transpose"]
+        self.vocab: List[str] = meta["vocab"]
+        self.qualities: List[str] = meta["qualities"]
+        self._roots: List[int] = meta["roots"]
+        self._token_ids = {t: i for i, t in enumerate(self.vocab)}
+        self._quality_ids = {q: i for i, q in enumerate(self.qualities)}
+        self._token_quality: List[int] = []
+        for token in self.vocab:
+            self._token_quality.append(self._quality_ids[parse_figure(token, self.strip_inversions)[2]])
+        self._removed = set(meta["removed"])
+        self.segments = [_Segment(os.path.join(path, name), self.max_n) for name in meta["segments"]]
+        self._refresh_live()
+
+    # Building
+
+    def _token_id(self, figure: str) -> int:
+        token, root, quality = parse_figure(figure, self.strip_inversions)
+        token_id = self._token_ids.get(token)
+        if token_id is None:
+            quality_id = self._quality_ids.get(quality)
+            if quality_id is None:
+                quality_id = self._quality_ids[quality] = len(self.qualities)
+                self.qualities.append(quality)
+            token_id = self._token_ids[token] = len(self.vocab)
+            self.vocab.append(token)
+            self._roots.append(root)
+            self._token_quality.append(quality_id)
+        return token_id
+
+    def _tables(self, extra: Sequence[Tuple[int, int]] = ()) -> Tuple[np.ndarray, np.ndarray]:
+        """Root and quality id of every token id, followed by those of query-only figures (see _parse_query)."""
+        roots = np.array(self._roots + [root for root, _ in extra], dtype=np.int64)
+        quality = np.array(self._token_quality + [quality for _, quality in extra], dtype=np.int64)
+        return roots, quality
+
+    def _units(self, tokens: np.ndarray, base_roots: Optional[np.ndarray] = None,
+               tables: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+        """Hash units of tokens; with transpose, roots are taken relative to base_roots."""
+        if not self.transpose:
+            return tokens.astype(np.uint64) + np.uint64(1)
+        roots, quality = tables or self._tables()
+        relative = np.where(roots[tokens] < 0, _NO_ROOT, (roots[tokens] - np.maximum(base_roots, 0)) % 12)
+        return (relative.astype(np.uint64) << np.uint64(_ROOT_SHIFT)) + quality[tokens].astype(np.uint64) + np.uint64(1)
+
+    def _ngram_keys(self, tokens: np.ndarray, starts: np.ndarray, n: int,
+                    tables: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> np.ndarray:
+        """Hash keys of the n-grams of `tokens` that begin at `starts`."""
+        tables = tables or (self._tables() if self.transpose else None)
+        base = tables[0][tokens[starts]] if self.transpose else None
+        keys = np.zeros(len(starts), dtype=np.uint64)
+        for j in range(n):
+            keys = keys * _HASH_PRIME + self._units(tokens[starts + j], base, tables)
+        return keys
+
+    def _write_segment(self, docs: List[Dict[str, Any]], sequences: List[np.ndarray]) -> str:
+        numbers = [int(name.split('-')[1]) for name in os.listdir(self.path) if name.startswith("seg-")]
+        name = f"seg-{max(numbers, default=-1) + 1:06d}"
+        tmp_dir = os.path.join(self.path, f".{name}.{os.getpid()}.tmp")
+        os.makedirs(tmp_dir)
+
+        lengths = np.array([len(s) for s in sequences], dtype=np.int64)
+        doc_starts = np.concatenate([[0], np.cumsum(lengths)])
+        tokens = np.concatenate(sequences).astype(np.int32) if len(sequences) else np.zeros(0, np.int32)
+        position_dtype = np.int32 if len(tokens) < 2 ** 31 else np.int64
+        doc_end = np.repeat(doc_starts[1:], lengths)
+        np.save(os.path.join(tmp_dir, "doc_starts.npy"), doc_starts)
+        np.save(os.path.join(tmp_dir, "tokens.npy"), tokens)
+        positions = np.arange(len(tokens))
+        for n in range(1, self.max_n + 1):
+            starts = positions[positions + n <= doc_end]
+            keys = self._ngram_keys(tokens, starts, n)
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+            unique, first = np.unique(keys, return_index=True)
+            np.save(os.path.join(tmp_dir, f"ngram-{n}-keys.npy"), unique)
+            np.save(os.path.join(tmp_dir, f"ngram-{n}-starts.npy"), np.append(first, len(keys)).astype(np.int64))
+            np.save(os.path.join(tmp_dir, f"ngram-{n}-postings.npy"), starts[order].astype(position_dtype))
+        with open(os.path.join(tmp_dir, "docs.json"), 'w') as f:
+            json.dump(docs, f)
+        os.replace(tmp_dir, os.path.join(self.path, name))
+        return name
+
+    def _save_meta(self, segment_names: List[str]):
+        meta = {"max_n": self.max_n, "strip_inversions": self.strip_inversions, "transpose": self.transpose,
+                "vocab": self.vocab, "roots": self._roots, "qualities": self.qualities,
+                "segments": segment_names, "removed": sorted(self._removed)}
+        path = os.path.join(self.path, "meta.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        # meta.json is the commit point: segments it does not list are invisible
+        os.replace(tmp_path, path)
+
+    def _refresh_live(self):
+        latest: Dict[str, Tuple[int, int]] = {}
+        for s, segment in enumerate(self.segments):
+            segment.live[:] = True
+            for d, doc in enumerate(segment.docs):
+                previous = latest.get(doc["filename"])
+                if previous is not None:
+                    self.segments[previous[0]].live[previous[1]] = False
+                latest[doc["filename"]] = (s, d)
+        for filename in self._removed:
+            if filename in latest:
+                s, d = latest[filename]
+                self.segments[s].live[d] = False
+        self._latest = latest
+
+    def add(self, sequences: Sequence[Tuple[str, Sequence[str]]], styles: Optional[Sequence[str]] = None,
+            extra: Optional[Sequence[Dict[str, Any]]] = None) -> Optional[str]:
+        """
+        Indexes (filename, roman numerals) pairs as a new segment, superseding
+        earlier entries for the same files. styles default to style_of(filename);
+        extra holds further per-file fields kept with each document.
+        Returns the segment name.
+        """
+        if not sequences:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        docs = []
+        token_seqs = []
+        for i, (filename, figures) in enumerate(sequences):
+            doc = {"filename": filename, "style": styles[i] if styles is not None else style_of(filename)}
+            if extra is not None:
+                doc.update(extra[i])
+            docs.append(doc)
+            token_seqs.append(np.array([self._token_id(f) for f in figures], dtype=np.int32))
+            self._removed.discard(filename)
+        name = self._write_segment(docs, token_seqs)
+        self._save_meta([s.name for s in self.segments] + [name])
+        self.segments.append(_Segment(os.path.join(self.path, name), self.max_n))
+        self._refresh_live()
+        if len(self.segments) > self.max_segments:
+            self.compact()
+        return name
+
+    def add_results(self, results: Iterable[Dict[str, Any]], styles: Optional[Sequence[str]] = None,
+                    sources: Optional[Sequence[Optional[List[int]]]] = None) -> Optional[str]:
+        """
+        Indexes batch_analysis result dicts. sources gives the (mtime_ns, size)
+        of each result's JSON file, so update_from_dir knows it is indexed.
+        """
+        results = list(results)
+        extra = [{"key": r["detected_key"]} for r in results]
+        for fields, source in zip(extra, sources or []):
+            if source is not None:
+                fields["source"] = source
+        return self.add([(r["filename"], r["roman_numerals"]) for r in results], styles, extra)
+
+    def document(self, filename: str) -> Optional[Dict[str, Any]]:
+        """The indexed entry of a file, or None if it is not (or no longer) indexed."""
+        location = self._latest.get(filename)
+        if location is None or filename in self._removed:
+            return None
+        return self.segments[location[0]].docs[location[1]]
+
+    def is_current(self, result: Dict[str, Any]) -> bool:
+        """Whether the index already holds a batch_analysis result as it is (same key and chords)."""
+        doc = self.document(result["filename"])
+        if doc is None or doc.get("key") != result["detected_key"]:
+            return False
+        segment, d = self._latest[result["filename"]]
+        indexed = [self.vocab[t] for t in self.segments[segment].doc_tokens(d)]
+        return indexed == [parse_figure(f, self.strip_inversions)[0] for f in result["roman_numerals"]]
+
+    def update_from_dir(self, result_dir: str = "result",
+                        style: Callable[[str], str] = style_of) -> Dict[str, int]:
+        """
+        Brings the index in line with the *_result.json files in result_dir:
+        files whose JSON changed (by mtime and size) since they were indexed are
+        re-indexed as one new segment, files whose JSON is gone are removed.
+        Returns counts of indexed, removed and unchanged files.
+        """
+        results, stats, seen = [], [], set()
+        for name in sorted(os.listdir(result_dir)):
+            if not name.endswith("_result.json"):
+                continue
+            path = os.path.join(result_dir, name)
+            st = os.stat(path)
+            source = [st.st_mtime_ns, st.st_size]
+            # Entries are keyed by the score's filename, which is stored inside the JSON
+            with open(path, 'r') as f:
+                result = json.load(f)
+            seen.add(result["filename"])
+            doc = self.document(result["filename"])
+            if doc is not None and doc.get("source") == source:
+                continue
+            results.append(result)
+            stats.append(source)
+        gone = [f for f in self._latest if f not in seen and f not in self._removed]
+        if results:
+            self.add([(r["filename"], r["roman_numerals"]) for r in results], [style(r["filename"]) for r in results],
+                     [{"key": r["detected_key"], "source": source} for r, source in zip(results, stats)])
+        if gone:
+            self.remove(gone)
+        return {"indexed": len(results), "removed": len(gone), "unchanged": len(seen) - len(results)}
+
+    def remove(self, filenames: Iterable[str]):
+        """Hides files from queries and statistics until they are added again."""
+        self._removed.update(f for f in filenames if f in self._latest)
+        self._save_meta([s.name for s in self.segments])
+        self._refresh_live()
+
+    def compact(self):
+        """Rewrites all live documents as a single segment."""
+        if len(self.segments) <= 1 and not self._removed and all(s.live.all() for s in self.segments):
+            return
+        docs, token_seqs = [], []
+        for segment in self.segments:
+            for d in np.flatnonzero(segment.live):
+                docs.append(segment.docs[d])
+                token_seqs.append(segment.doc_tokens(d))
+        old = [s.path for s in self.segments]
+        name = self._write_segment(docs, token_seqs) if docs else None
+        self._removed.clear()
+        self._save_meta([name] if name else [])
+        self.segments = [_Segment(os.path.join(self.path, name), self.max_n)] if name else []
+        for path in old:
+            shutil.rmtree(path, ignore_errors=True)
+        self._refresh_live()
+
+    def __len__(self) -> int:
+        return sum(int(s.live.sum()) for s in self.segments)
+
+    # Querying
+
+    def parse_query(self, query: str, max_gap: int = 4) -> List[Tuple[List[Optional[int]], int]]:
+        """
+        Splits a query into parts separated by gaps. Each part is a list of token
+        ids (None for a wildcard) paired with the largest gap allowed before the
+        next part. A chord missing from the vocabulary becomes -1 and matches
+        nothing, except in a transposed index (see _parse_query).
+        """
+        return self._parse_query(query, max_gap)[0]
+
+    def _parse_query(self, query: str, max_gap: int = 4
+                     ) -> Tuple[List[Tuple[List[Optional[int]], int]], List[Tuple[int, int]]]:
+        """
+        parse_query, plus the (root, quality id) of figures missing from the
+        vocabulary that a transposed index can still match. These get ids past
+        the vocabulary for this query only; the vocabulary is not touched.
+        """
+        parts: List[Tuple[List[Optional[int]], int]] = []
+        extra: List[Tuple[int, int]] = []
+        extra_ids: Dict[str, int] = {}
+        current: List[Optional[int]] = []
+        for word in query.replace('→', ' ').split():
+            if word in _ARROWS:
+                continue
+            if word.startswith(GAP):
+                gap = int(word[len(GAP):]) if word[len(GAP):] else max_gap
+                if current:
+                    parts.append((current, gap))
+                    current = []
+                continue
+            if word == WILDCARD:
+                current.append(None)
+            else:
+                token, root, quality = parse_figure(word, self.strip_inversions)
+                token_id = self._token_ids.get(token, -1)
+                if token_id == -1 and self.transpose and root >= 0 and quality in self._quality_ids:
+                    # Transposed matching only compares roots and qualities, so an unseen
+                    # figure ("II" when only "V" was indexed) can still match
+                    if token not in extra_ids:
+                        extra_ids[token] = len(self.vocab) + len(extra)
+                        extra.append((root, self._quality_ids[quality]))
+                    token_id = extra_ids[token]
+                current.append(token_id)
+        if current:
+            parts.append((current, 0))
+        if not parts:
+            raise ValueError(f"Empty progression query: {query!r}")
+        return parts, extra
+
+    def _part_matches(self, segment: _Segment, part: List[Optional[int]],
+                      tables: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Verified start positions of one query part in a segment, with their
+        transposition offsets (always 0 without transpose). A part without a
+        rooted concrete chord fits any transposition and gets offset -1.
+        """
+        concrete = [j for j, t in enumerate(part) if t is not None]
+        if any(part[j] == -1 for j in concrete):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        n_tokens = len(segment.tokens)
+        if not concrete:
+            candidates = np.arange(max(0, n_tokens - len(part) + 1))
+        else:
+            # Runs of consecutive concrete chords; the rarest n-gram inside them is the anchor
+            best = None
+            for j in concrete:
+                run = 0
+                while j + run < len(part) and part[j + run] is not None and run < self.max_n:
+                    run += 1
+                    window = np.array(part[j:j + run], dtype=np.int64)
+                    key = self._ngram_keys(window, np.array([0]), run, tables)[0]
+                    postings = segment.lookup(run, key)
+                    if best is None or len(postings) < len(best[1]) or \
+                            (len(postings) == len(best[1]) and run > best[2]):
+                        best = (j, postings, run)
+            anchor, postings, _ = best
+            candidates = postings - anchor
+            candidates = candidates[(candidates >= 0) & (candidates + len(part) <= n_tokens)]
+        if len(candidates) == 0:
+            return candidates, candidates
+        # Whole part inside one document
+        candidates = candidates[segment.doc_of(candidates) == segment.doc_of(candidates + len(part) - 1)]
+        tokens = segment.tokens
+        offsets = np.zeros(len(candidates), dtype=np.int64)
+        if self.transpose:
+            roots, quality = tables or self._tables()
+            rooted = [j for j in concrete if roots[part[j]] >= 0]
+            if rooted:
+                offsets = (roots[tokens[candidates + rooted[0]]] - roots[part[rooted[0]]]) % 12
+            else:
+                # Matches in any transposition; the next part (or none) decides
+                offsets = np.full(len(candidates), -1, dtype=np.int64)
+            keep = np.ones(len(candidates), dtype=bool)
+            for j in concrete:
+                actual = np.asarray(tokens[candidates + j], dtype=np.int64)
+                expected_root = roots[part[j]]
+                keep &= quality[actual] == quality[part[j]]
+                if expected_root >= 0:
+                    keep &= (roots[actual] - offsets - expected_root) % 12 == 0
+                else:
+                    keep &= actual == part[j]
+        else:
+            keep = np.ones(len(candidates), dtype=bool)
+            for j in concrete:
+                keep &= tokens[candidates + j] == part[j]
+        return candidates[keep], offsets[keep]
+
+    def _segment_matches(self, segment: _Segment, parts: List[Tuple[List[Optional[int]], int]],
+                         tables: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """(start, end) positions of whole-query matches in a segment, end exclusive."""
+        first, _ = parts[0]
+        starts, offsets = self._part_matches(segment, first, tables)
+        ends = starts + len(first)
+        for (part, _), (_, gap) in zip(parts[1:], parts[:-1]):
+            if len(starts) == 0:
+                break
+            part_starts, part_offsets = self._part_matches(segment, part, tables)
+            # Every continuation within the gap, in the same document and transposition
+            # (an offset of -1 is a part without rooted chords, which fits any transposition):
+            # an earlier one can leave a later part no room that a later one would
+            chains = []
+            for skip in range(gap + 1):
+                at = ends + skip
+                i = np.searchsorted(part_starts, at)
+                found = i < len(part_starts)
+                found[found] &= part_starts[i[found]] == at[found]
+                candidate_offsets = np.full(len(starts), -1, dtype=part_offsets.dtype)
+                candidate_offsets[found] = part_offsets[i[found]]
+                found &= (candidate_offsets == offsets) | (candidate_offsets < 0) | (offsets < 0)
+                chains.append(np.stack([starts[found], at[found] + len(part),
+                                        np.maximum(offsets[found], candidate_offsets[found])]))
+            starts, ends, offsets = np.unique(np.concatenate(chains, axis=1), axis=1)
+            same_doc = segment.doc_of(starts) == segment.doc_of(ends - 1)
+            starts, ends, offsets = starts[same_doc], ends[same_doc], offsets[same_doc]
+        # One match per start, the shortest
+        starts, first_of_start = np.unique(starts, return_index=True)
+        ends = ends[first_of_start]
+        live = segment.live[segment.doc_of(starts)] if len(starts) else np.zeros(0, dtype=bool)
+        return starts[live], ends[live]
+
+    def search(self, query: str, max_gap: int = 4, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Finds a progression, e.g. "ii V I", "ii * I" or "IV ... V I". Returns one
+        dict per match with the file, its style, the chord positions
+        [start, end) and the matched figures, in index order.
+        """
+        parts, extra = self._parse_query(query, max_gap)
+        tables = self._tables(extra) if self.transpose else None
+        matches = []
+        for segment in self.segments:
+            starts, ends = self._segment_matches(segment, parts, tables)
+            if limit is not None:
+                starts, ends = starts[:limit - len(matches)], ends[:limit - len(matches)]
+            for start, end, doc in zip(starts.tolist(), ends.tolist(), segment.doc_of(starts).tolist()):
+                offset = int(segment.doc_starts[doc])
+                matches.append({"filename": segment.docs[doc]["filename"], "style": segment.docs[doc]["style"],
+                                "start": start - offset, "end": end - offset,
+                                "figures": [self.vocab[t] for t in segment.tokens[start:end]]})
+                if limit is not None and len(matches) >= limit:
+                    return matches
+        return matches
+
+    def count(self, query: str, max_gap: int = 4) -> Dict[str, int]:
+        """Number of matches and of files with at least one match."""
+        parts, extra = self._parse_query(query, max_gap)
+        tables = self._tables(extra) if self.transpose else None
+        occurrences = files = 0
+        for segment in self.segments:
+            starts, _ = self._segment_matches(segment, parts, tables)
+            occurrences += len(starts)
+            files += len(np.unique(segment.doc_of(starts)))
+        return {"matches": occurrences, "files": files}
+
+    def files(self, query: str, max_gap: int = 4) -> List[str]:
+        """Sorted names of the files containing the progression."""
+        parts, extra = self._parse_query(query, max_gap)
+        tables = self._tables(extra) if self.transpose else None
+        names = set()
+        for segment in self.segments:
+            starts, _ = self._segment_matches(segment, parts, tables)
+            names.update(segment.docs[d]["filename"] for d in np.unique(segment.doc_of(starts)))
+        return sorted(names)
+
+    # Statistics
+
+    def ngram_label(self, tokens: Sequence[int]) -> str:
+        """Display form of an n-gram; with transpose, written as if its first chord were I/i."""
+        if not self.transpose:
+            return ' '.join(self.vocab[t] for t in tokens)
+        base = next((self._roots[t] for t in tokens if self._roots[t] >= 0), 0)
+        labels = []
+        for t in tokens:
+            root = self._roots[t]
+            if root < 0:
+                labels.append(self.vocab[t])
+                continue
+            numeral = _PC_NUMERAL[(root - base) % 12]
+            quality = self.qualities[self._token_quality[t]]
+            if quality[0] == 'm':
+                numeral = numeral.lower()
+            labels.append(numeral + quality[1:])
+        return ' '.join(labels)
+
+    def ngram_stats(self, n: int = 3, top: int = 20, by_style: bool = True,
+                    style: Optional[str] = None) -> Dict[str, List[Tuple[str, int, float]]]:
+        """
+        Most frequent n-grams, per style (or over the whole index with
+        by_style=False, or for one style). Each entry is (n-gram, occurrences,
+        share of that style's n-grams).
+        """
+        if not 1 <= n <= self.max_n:
+            raise ValueError(f"n must be between 1 and {self.max_n}")
+        style_names: Dict[str, int] = {}
+        all_keys, all_styles, exemplars = [], [], {}
+        for segment in self.segments:
+            doc_style = np.array([style_names.setdefault(d["style"] if by_style else "all", len(style_names))
+                                  for d in segment.docs], dtype=np.int64)
+            keys = np.asarray(segment.keys[n - 1])
+            starts = np.asarray(segment.starts[n - 1])
+            postings = np.asarray(segment.postings[n - 1], dtype=np.int64)
+            posting_keys = np.repeat(keys, np.diff(starts))
+            docs = segment.doc_of(postings)
+            live = segment.live[docs]
+            all_keys.append(posting_keys[live])
+            all_styles.append(doc_style[docs[live]])
+            for key, first in zip(keys.tolist(), starts[:-1].tolist()):
+                exemplars.setdefault(key, (segment, int(postings[first])))
+        if not all_keys:
+            return {}
+        keys = np.concatenate(all_keys)
+        styles = np.concatenate(all_styles)
+        names = {i: name for name, i in style_names.items()}
+        report: Dict[str, List[Tuple[str, int, float]]] = {}
+        for style_id in np.unique(styles):
+            if style is not None and names[style_id] != style:
+                continue
+            unique, counts = np.unique(keys[styles == style_id], return_counts=True)
+            order = np.argsort(-counts, kind='stable')[:top]
+            total = counts.sum()
+            rows = []
+            for key, count in zip(unique[order].tolist(), counts[order].tolist()):
+                segment, position = exemplars[key]
+                rows.append((self.ngram_label(segment.tokens[position:position + n].tolist()), count, float(count / total)))
+            report[names[style_id]] = rows
+        return dict(sorted(report.items()))
+
+def load_results(result_dir: str) -> List[Dict[str, Any]]:
+    """Reads every *_result.json written by batch_analysis in result_dir."""
+    results = []
+    for name in sorted(os.listdir(result_dir)):
+        if name.endswith("_result.json"):
+            with open(os.path.join(result_dir, name), 'r') as f:
+                results.append(json.load(f))
+    return results
+
+def styles_from_manifest(path: str, key: str = "template") -> Callable[[str], str]:
+    """Style lookup from a generate_corpus manifest (or any JSON lines file with filename and `key`)."""
+    styles = {}
+    with open(path, 'r') as f:
+        for line in f:
+            row = json.loads(line)
+            styles[row["filename"]] = row[key]
+    return lambda filename: styles.get(filename, style_of(filename))
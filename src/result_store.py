@@ -0,0 +1,169 @@
+import os
+import glob
+import operator
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+COLUMNS = ['filename', 'tonic', 'mode', 'confidence', 'chord_count', 'roman_numerals']
+
+# Separator used to pack a Roman numeral sequence into one string column in .npz parts
+_RN_SEPARATOR = ' '
+
+_OPS = {
+    '==': operator.eq, '=': operator.eq, '!=': operator.ne,
+    '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    'in': lambda col, values: np.isin(col, list(values)),
+    'not in': lambda col, values: ~np.isin(col, list(values)),
+}
+
+Filter = Tuple[str, str, Any]
+
+class ResultStore:
+    """
+    Columnar, append-only store of per-file analysis results for a whole corpus.
+
+    Each append() writes one immutable part file into the store directory:
+    Parquet when pyarrow is installed, otherwise a NumPy .npz fallback. load()
+    returns a pandas DataFrame and applies (column, op, value) filters while
+    reading (pyarrow pushes them down to row groups; the .npz reader filters the
+    arrays before building the frame). When a file has been appended more than
+    once, the latest row wins.
+    """
+
+    def __init__(self, path: str = "result/corpus_store", backend: str = "auto"):
+        if backend == "auto":
+            backend = "parquet" if HAS_PYARROW else "npz"
+        if backend == "parquet" and not HAS_PYARROW:
+            raise ImportError("The parquet backend requires pyarrow")
+        if backend not in ("parquet", "npz"):
+            raise ValueError(f"Unknown result store backend: {backend}")
+        self.path = path
+        self.backend = backend
+
+    @staticmethod
+    def record_from_result(result_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Flattens a batch_analysis result dict into a store row."""
+        tonic, _, mode = result_data["detected_key"].partition(" ")
+        return {
+            "filename": result_data["filename"],
+            "tonic": tonic,
+            "mode": mode,
+            "confidence": float(result_data["confidence"]),
+            "chord_count": int(result_data["chord_count"]),
+            "roman_numerals": list(result_data["roman_numerals"]),
+        }
+
+    def _parts(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.path, f"part-*.{self.backend}")))
+
+    def _next_part_path(self) -> str:
+        parts = self._parts()
+        index = int(os.path.basename(parts[-1]).split('-')[1].split('.')[0]) + 1 if parts else 0
+        return os.path.join(self.path, f"part-{index:06d}.{self.backend}")
+
+    def append(self, records: Sequence[Dict[str, Any]]) -> Optional[str]:
+        """Writes one batch of store rows as a new part file. Returns its path."""
+        if not records:
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        part_path = self._next_part_path()
+        tmp_path = f"{part_path}.{os.getpid()}.tmp"
+        if self.backend == "parquet":
+            frame = pd.DataFrame.from_records(records, columns=COLUMNS)
+            frame.to_parquet(tmp_path, index=False)
+        else:
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    filename=np.array([r["filename"] for r in records], dtype=str),
+                    tonic=np.array([r["tonic"] for r in records], dtype=str),
+                    mode=np.array([r["mode"] for r in records], dtype=str),
+                    confidence=np.array([r["confidence"] for r in records], dtype=np.float64),
+                    chord_count=np.array([r["chord_count"] for r in records], dtype=np.int64),
+                    roman_numerals=np.array([_RN_SEPARATOR.join(r["roman_numerals"]) for r in records], dtype=str),
+                )
+        # Parts appear atomically, so readers never see a half-written batch
+        os.replace(tmp_path, part_path)
+        return part_path
+
+    def append_results(self, results: Sequence[Dict[str, Any]]) -> Optional[str]:
+        """Appends batch_analysis result dicts."""
+        return self.append([self.record_from_result(r) for r in results])
+
+    def _load_npz_part(self, part_path: str, filters: Optional[List[Filter]],
+                       columns: Optional[List[str]]) -> pd.DataFrame:
+        with np.load(part_path) as data:
+            mask = np.ones(len(data["filename"]), dtype=bool)
+            for column, op, value in filters or []:
+                mask &= _OPS[op](data[column], value)
+            wanted = columns or COLUMNS
+            frame = pd.DataFrame({c: data[c][mask] for c in wanted})
+        if "roman_numerals" in frame:
+            frame["roman_numerals"] = [s.split(_RN_SEPARATOR) if s else [] for s in frame["roman_numerals"]]
+        return frame
+
+    def load(self, filters: Optional[List[Filter]] = None, columns: Optional[List[str]] = None,
+             latest: bool = True) -> pd.DataFrame:
+        """
+        Loads the store as a DataFrame.
+        filters: list of (column, op, value) conditions that must all hold,
+                 e.g. [("mode", "==", "minor"), ("confidence", "<", 0.6)].
+        columns: subset of columns to read ("filename" is always included).
+        latest: keep only the most recently appended row per filename.
+        """
+        if columns is not None and "filename" not in columns:
+            columns = ["filename"] + list(columns)
+        parts = self._parts()
+        if not parts:
+            return pd.DataFrame(columns=columns or COLUMNS)
+        frames = []
+        for index, p in enumerate(parts):
+            if self.backend == "parquet":
+                part = pd.read_parquet(p, columns=columns, filters=filters or None)
+                if "roman_numerals" in part:
+                    part["roman_numerals"] = [list(rn) for rn in part["roman_numerals"]]
+            else:
+                part = self._load_npz_part(p, filters, columns)
+            part["_part"] = index
+            frames.append(part)
+        frame = pd.concat(frames, ignore_index=True)
+        if latest:
+            frame = frame.drop_duplicates("filename", keep="last")
+            if len(parts) > 1 and filters:
+                # A row that matches the filters may have been superseded by a newer,
+                # non-matching row in a later part; check against every part's file names
+                newest = self._newest_part_per_file(parts)
+                frame = frame[frame["_part"].to_numpy() == newest.reindex(frame["filename"]).to_numpy()]
+        return frame.drop(columns="_part").reset_index(drop=True)
+
+    def _newest_part_per_file(self, parts: List[str]) -> pd.Series:
+        names = []
+        for index, p in enumerate(parts):
+            if self.backend == "parquet":
+                column = pd.read_parquet(p, columns=["filename"])["filename"]
+            else:
+                with np.load(p) as data:
+                    column = pd.Series(data["filename"])
+            names.append(pd.DataFrame({"filename": column, "_part": index}))
+        return pd.concat(names).groupby("filename")["_part"].max()
+
+    def compact(self) -> Optional[str]:
+        """Rewrites all parts as a single part holding only the latest row per file."""
+        frame = self.load()
+        old_parts = self._parts()
+        if frame.empty:
+            return None
+        records = frame.to_dict("records")
+        for r in records:
+            r["roman_numerals"] = list(r["roman_numerals"])
+        new_part = self.append(records)
+        for p in old_parts:
+            os.remove(p)
+        return new_part
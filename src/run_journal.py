@@ -0,0 +1,136 @@
+import os
+import json
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+# Terminal states of a file in a run
+DONE = "done"
+FAILED = "failed"
+TIMEOUT = "timeout"
+MEMORY = "memory"
+CRASHED = "crashed"
+STATES = (DONE, FAILED, TIMEOUT, MEMORY, CRASHED)
+
+def file_source(file_path: str) -> List[int]:
+    """(mtime_ns, size) of a file; a journal entry only holds while these match."""
+    st = os.stat(file_path)
+    return [st.st_mtime_ns, st.st_size]
+
+class RunJournal:
+    """
+    Append-only record of how far a batch run got, so a restarted run resumes.
+
+    The journal is a JSON lines file: a header with the analyzer fingerprint,
+    then one line per finished file with its state (see STATES), the
+    (mtime, size) it was analyzed at, its cost and, when done, its result.
+    Each line is written with one write() and fsynced before the run moves on,
+    so a crash or kill loses at most the line being written. A torn last line
+    is cut off on load. Later lines for a file supersede earlier ones. A journal
+    written with a different fingerprint is started afresh. A completed run
+    (see complete()) keeps its entries, so the next run over it only runs new or
+    changed files, plus, with retry_failed, the files that did not finish as done.
+    """
+
+    def __init__(self, path: str, fingerprint: str = ""):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.discarded = False
+        self.completed = False
+        if os.path.exists(path):
+            self._load()
+        if not self.entries:
+            self._start()
+
+    def _load(self):
+        header = None
+        entries = {}
+        completed = False
+        good = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b"\n"):
+                    break
+                good += len(line)
+                if header is None:
+                    header = record
+                elif "file" in record:
+                    entries[record["file"]] = record
+                    completed = False
+                elif record.get("complete"):
+                    completed = True
+        if header is None or header.get("fingerprint") != self.fingerprint:
+            self.discarded = header is not None
+            return
+        # Only the last line can be torn; cut it off so new lines start cleanly
+        if good < os.path.getsize(self.path):
+            os.truncate(self.path, good)
+        self.entries = entries
+        self.completed = completed
+
+    def _start(self):
+        """Starts an empty journal, replacing any previous one atomically."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(json.dumps({"fingerprint": self.fingerprint, "started": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def reset(self):
+        """Forgets every entry."""
+        self.entries = {}
+        self.completed = False
+        self._start()
+
+    def record(self, file_path: str, state: str, **fields: Any):
+        """Durably records the terminal state of a file, with any extra fields."""
+        entry = {"file": os.path.basename(file_path), "state": state, "source": file_source(file_path),
+                 "finished": time.time()}
+        entry.update(fields)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.entries[entry["file"]] = entry
+        self.completed = False
+
+    def complete(self):
+        """Marks the run finished. Its entries stay valid for the next run."""
+        if self.completed:
+            return
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({"complete": True, "finished": time.time()}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed = True
+
+    def entry(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """The journal entry of a file, or None if it has none or the file changed since."""
+        entry = self.entries.get(os.path.basename(file_path))
+        if entry is None or entry["source"] != file_source(file_path):
+            return None
+        return entry
+
+    def pending(self, files: Sequence[str], retry_failed: bool = False) -> List[str]:
+        """
+        Files still to run: those without a current entry, plus, with
+        retry_failed, those that did not finish as done.
+        """
+        pending = []
+        for file_path in files:
+            entry = self.entry(file_path)
+            if entry is None or (retry_failed and entry["state"] != DONE):
+                pending.append(file_path)
+        return pending
+
+    def counts(self) -> Dict[str, int]:
+        counts = {state: 0 for state in STATES}
+        for entry in self.entries.values():
+            counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+        return counts
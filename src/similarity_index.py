@@ -0,0 +1,374 @@
+import os
+import json
+import shutil
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Embedding layout: 12 centred chroma bins, then the 6 tonnetz coordinates
+CHROMA_DIM = 12
+TONNETZ_DIM = 6
+EMBEDDING_DIM = CHROMA_DIM + TONNETZ_DIM
+
+def tonnetz_basis() -> np.ndarray:
+    """(6, 12) chroma-to-tonnetz projection, as librosa.feature.tonnetz builds it."""
+    scale = np.array([7 / 6, 7 / 6, 3 / 2, 3 / 2, 2 / 3, 2 / 3])
+    angles = np.multiply.outer(scale, np.arange(12, dtype=np.float64))
+    angles[::2] -= 0.5
+    radius = np.array([1, 1, 1, 1, 0.5, 0.5])
+    return radius[:, None] * np.cos(np.pi * angles)
+
+def transposition_matrices() -> np.ndarray:
+    """
+    (12, 18, 18) linear maps taking an embedding to the embedding of the same
+    recording transposed up 0..11 semitones. Chroma is rolled; each tonnetz
+    coordinate pair rotates by a fixed angle per semitone. The map is exact
+    for tonnetz means, because tonnetz is linear in the normalized chroma.
+    """
+    phi = tonnetz_basis()
+    phi_inv = np.linalg.pinv(phi)
+    maps = np.zeros((12, EMBEDDING_DIM, EMBEDDING_DIM))
+    for shift in range(12):
+        roll = np.roll(np.eye(12), shift, axis=0)
+        maps[shift, :CHROMA_DIM, :CHROMA_DIM] = roll
+        maps[shift, CHROMA_DIM:, CHROMA_DIM:] = phi @ roll @ phi_inv
+    return maps
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return np.divide(x, norms, out=np.zeros_like(x), where=norms > 0)
+
+def embed(chroma: np.ndarray, tonnetz: np.ndarray, tonnetz_weight: float = 0.3) -> np.ndarray:
+    """
+    (n, 18) float32 unit embeddings of per-recording chroma and tonnetz means.
+    Chroma is centred before normalizing, so its part of the dot product is the
+    Pearson correlation of the two chroma vectors. The dot product of two
+    embeddings is (1 - w) * chroma correlation + w * tonnetz cosine, with w = tonnetz_weight.
+    """
+    chroma = _unit_rows(np.atleast_2d(np.asarray(chroma, dtype=np.float64)))
+    chroma = _unit_rows(chroma - chroma.mean(axis=1, keepdims=True))
+    tonnetz = _unit_rows(np.atleast_2d(np.asarray(tonnetz, dtype=np.float64)))
+    return np.hstack([np.sqrt(1 - tonnetz_weight) * chroma, np.sqrt(tonnetz_weight) * tonnetz]).astype(np.float32)
+
+def _merge_top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keeps the k best (score, row) columns of every query row."""
+    if scores.shape[1] > k:
+        keep = np.argpartition(scores, -k, axis=1)[:, -k:]
+        scores = np.take_along_axis(scores, keep, axis=1)
+        rows = np.take_along_axis(rows, keep, axis=1)
+    return scores, rows
+
+class HarmonicSimilarityIndex:
+    """
+    Nearest-neighbour index over the chroma and tonnetz means of audio results.
+
+    Every recording is one row of a contiguous float32 (n, 18) matrix of unit
+    embeddings (see embed). Similarity is transposition invariant: a query is
+    expanded into its 12 transpositions (see transposition_matrices), all of
+    them are scored against the matrix in one multiply, and each row keeps its
+    best transposition. This costs the same as storing 12 rotations of every
+    row, at 1/12 of the storage. Queries are scored in blocks, in batches, and
+    only the best k per block are kept.
+
+    partition() adds an approximate inverted-file layer: spherical k-means
+    centroids, with rows stored grouped by nearest centroid. Clustering is
+    transposition invariant too: every row is matched to the centroids in all
+    12 transpositions, joins the list of the best match and is stored with
+    that shift, and centroids average the rows in their matched (canonical)
+    transposition. A list therefore holds one harmonic shape in every key, not
+    one key of it. A query scores only the rows of its nprobe best centroids,
+    where each centroid is scored with the best transposition too.
+
+    The index directory holds one generation of arrays, read back through
+    np.load(mmap_mode='r'). meta.json is the commit point, so a rewrite is
+    never seen half done.
+    """
+
+    def __init__(self, path: str = "result/similarity_index", tonnetz_weight: float = 0.3,
+                 block_size: int = 1 << 16):
+        self.path = path
+        self.block_size = block_size
+        self.transpositions = transposition_matrices().astype(np.float32)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+        else:
+            meta = {"tonnetz_weight": tonnetz_weight, "generation": None, "partitioned": False}
+        # An existing index keeps the weight it was built with
+        self.tonnetz_weight = meta["tonnetz_weight"]
+        self._load(meta["generation"], meta["partitioned"])
+
+    def _load(self, generation: Optional[str], partitioned: bool):
+        self.generation = generation
+        self.partitioned = partitioned
+        self.names: List[str] = []
+        self.embeddings = np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        self.centroids: Optional[np.ndarray] = None
+        self.list_offsets: Optional[np.ndarray] = None
+        self.sources = np.full((0, 2), -1, dtype=np.int64)
+        if generation is not None:
+            gen_dir = os.path.join(self.path, generation)
+            with open(os.path.join(gen_dir, "names.json"), 'r') as f:
+                self.names = json.load(f)
+            self.embeddings = np.load(os.path.join(gen_dir, "embeddings.npy"), mmap_mode='r')
+            sources_path = os.path.join(gen_dir, "sources.npy")
+            if os.path.exists(sources_path):
+                self.sources = np.load(sources_path)
+            else:
+                self.sources = np.full((len(self.names), 2), -1, dtype=np.int64)
+            if partitioned:
+                self.centroids = np.load(os.path.join(gen_dir, "centroids.npy"))
+                self.list_offsets = np.load(os.path.join(gen_dir, "list_offsets.npy"))
+        self._rows = {name: row for row, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # Building
+
+    def _write(self, names: List[str], embeddings: np.ndarray, centroids: Optional[np.ndarray] = None,
+               sources: Optional[np.ndarray] = None):
+        """
+        Writes a new generation (rows grouped by nearest centroid when given) and
+        commits it. sources holds the (mtime_ns, size) each row was read from, -1 if unknown.
+        """
+        if sources is None:
+            sources = np.full((len(names), 2), -1, dtype=np.int64)
+        list_offsets = None
+        if centroids is not None:
+            lists, _ = self._assign(embeddings, centroids)
+            order = np.argsort(lists, kind='stable')
+            embeddings = embeddings[order]
+            sources = sources[order]
+            names = [names[i] for i in order]
+            list_offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1)).astype(np.int64)
+        os.makedirs(self.path, exist_ok=True)
+        numbers = [int(name.split('-')[1]) for name in os.listdir(self.path) if name.startswith("gen-")]
+        generation = f"gen-{max(numbers, default=-1) + 1:06d}"
+        tmp_dir = os.path.join(self.path, f".{generation}.{os.getpid()}.tmp")
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), np.ascontiguousarray(embeddings, dtype=np.float32))
+        with open(os.path.join(tmp_dir, "names.json"), 'w') as f:
+            json.dump(names, f)
+        np.save(os.path.join(tmp_dir, "sources.npy"), np.asarray(sources, dtype=np.int64))
+        if centroids is not None:
+            np.save(os.path.join(tmp_dir, "centroids.npy"), centroids.astype(np.float32))
+            np.save(os.path.join(tmp_dir, "list_offsets.npy"), list_offsets)
+        os.replace(tmp_dir, os.path.join(self.path, generation))
+
+        meta = {"tonnetz_weight": self.tonnetz_weight, "generation": generation, "partitioned": centroids is not None,
+                "count": len(names), "dim": EMBEDDING_DIM}
+        meta_path = os.path.join(self.path, "meta.json")
+        tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+        old = self.generation
+        self._load(generation, centroids is not None)
+        if old is not None:
+            shutil.rmtree(os.path.join(self.path, old), ignore_errors=True)
+
+    def _assign(self, embeddings: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Nearest centroid (by cosine, over all 12 transpositions of the row) of
+        every row, and the shift that reaches it, in blocks.
+        """
+        lists = np.zeros(len(embeddings), dtype=np.int64)
+        shifts = np.zeros(len(embeddings), dtype=np.int8)
+        # (T_s x) . c = x . (T_s^T c), so one product with the 12 * lists transposed centroids scores everything
+        targets = np.einsum('sij,ci->scj', self.transpositions, centroids).reshape(-1, EMBEDDING_DIM)
+        block_size = max(1, self.block_size // 12)
+        for start in range(0, len(embeddings), block_size):
+            block = np.asarray(embeddings[start:start + block_size])
+            shift, lists[start:start + len(block)] = np.divmod(np.argmax(block @ targets.T, axis=1), len(centroids))
+            shifts[start:start + len(block)] = shift
+        return lists, shifts
+
+    def _canonical(self, embeddings: np.ndarray, shifts: np.ndarray) -> np.ndarray:
+        """Every row transposed by its shift."""
+        rotated = np.empty_like(embeddings)
+        for shift in range(12):
+            rows = shifts == shift
+            rotated[rows] = embeddings[rows] @ self.transpositions[shift].T
+        return rotated
+
+    def _update(self, names: Sequence[str], embeddings: np.ndarray, sources: Optional[np.ndarray] = None,
+                remove: Iterable[str] = ()):
+        """Replaces or adds rows and drops the removed names, in a single rewrite."""
+        # Later duplicates within one call win, as later calls win over earlier ones
+        latest = {name: i for i, name in enumerate(names)}
+        gone = set(remove) - set(latest)
+        keep = [row for row, name in enumerate(self.names) if name not in latest and name not in gone]
+        if not latest and len(keep) == len(self.names):
+            return
+        rows = sorted(latest.values())
+        if sources is None:
+            sources = np.full((len(names), 2), -1, dtype=np.int64)
+        merged_names = [self.names[row] for row in keep] + [names[i] for i in rows]
+        merged = np.vstack([np.asarray(self.embeddings[keep]), embeddings[rows]])
+        merged_sources = np.vstack([self.sources[keep], np.asarray(sources, dtype=np.int64)[rows]])
+        self._write(merged_names, merged, self.centroids, merged_sources)
+
+    def add(self, names: Sequence[str], chroma: np.ndarray, tonnetz: np.ndarray,
+            sources: Optional[Sequence[Sequence[int]]] = None):
+        """
+        Adds recordings, replacing earlier entries of the same names. The whole
+        matrix is rewritten; an existing partitioning keeps its centroids and new
+        rows join their nearest list (run partition() again after large additions).
+        sources gives the (mtime_ns, size) of the result file of each recording,
+        so update_from_dir can skip it while that file is unchanged.
+        """
+        if len(names) == 0:
+            return
+        self._update(names, embed(chroma, tonnetz, self.tonnetz_weight),
+                     None if sources is None else np.array(sources, dtype=np.int64).reshape(-1, 2))
+
+    def add_results(self, names: Sequence[str], results: Sequence[Dict[str, Any]],
+                    sources: Optional[Sequence[Sequence[int]]] = None):
+        """Adds AudioAnalyzer results (their chroma_mean and tonnetz_mean) under the given names."""
+        if len(names) == 0:
+            return
+        self.add(names, np.array([r["chroma_mean"] for r in results]), np.array([r["tonnetz_mean"] for r in results]),
+                 sources)
+
+    def remove(self, names: Iterable[str]):
+        self._update([], np.zeros((0, EMBEDDING_DIM), dtype=np.float32), remove=names)
+
+    def update_from_dir(self, result_dir: str = "result") -> Dict[str, int]:
+        """
+        Indexes every *_audio_result.json in result_dir under its recording name
+        (the file name without the suffix) and drops entries whose JSON is gone.
+        Files whose (mtime, size) match what the index read last are not read
+        again, and nothing is rewritten when no file changed.
+        """
+        suffix = "_audio_result.json"
+        names, results, sources, seen = [], [], [], set()
+        for filename in sorted(os.listdir(result_dir)):
+            if not filename.endswith(suffix):
+                continue
+            name = filename[:-len(suffix)]
+            path = os.path.join(result_dir, filename)
+            st = os.stat(path)
+            source = [st.st_mtime_ns, st.st_size]
+            row = self._rows.get(name)
+            if row is not None and self.sources[row].tolist() == source:
+                seen.add(name)
+                continue
+            with open(path, 'r') as f:
+                result = json.load(f)
+            if "chroma_mean" in result and "tonnetz_mean" in result:
+                seen.add(name)
+                names.append(name)
+                results.append(result)
+                sources.append(source)
+        gone = [name for name in self.names if name not in seen]
+        if names:
+            embeddings = embed(np.array([r["chroma_mean"] for r in results]),
+                               np.array([r["tonnetz_mean"] for r in results]), self.tonnetz_weight)
+            self._update(names, embeddings, np.array(sources, dtype=np.int64), remove=gone)
+        elif gone:
+            self.remove(gone)
+        return {"indexed": len(names), "removed": len(gone), "unchanged": len(seen) - len(names)}
+
+    def partition(self, n_lists: Optional[int] = None, iterations: int = 10, sample_size: Optional[int] = None,
+                  seed: int = 0):
+        """
+        Trains transposition-invariant spherical k-means centroids (sqrt(n) of
+        them by default) on a sample of the rows and regroups the matrix by
+        nearest centroid.
+        """
+        n = len(self)
+        if n == 0:
+            return
+        n_lists = min(n, n_lists or max(1, int(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, sample_size or 64 * n_lists)
+        sample = np.asarray(self.embeddings[np.sort(rng.choice(n, sample_size, replace=False))])
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            lists, shifts = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, lists, self._canonical(sample, shifts))
+            empty = np.linalg.norm(sums, axis=1) == 0
+            # An emptied centroid restarts on a random sample row
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            centroids = _unit_rows(sums)
+        self._write(list(self.names), np.asarray(self.embeddings), centroids, self.sources)
+
+    # Querying
+
+    def _expand(self, queries: np.ndarray) -> np.ndarray:
+        """(12, q, 18): every query embedding in all 12 transpositions."""
+        return np.einsum('sij,qj->sqi', self.transpositions, queries)
+
+    @staticmethod
+    def _score(rows: np.ndarray, expanded: np.ndarray) -> np.ndarray:
+        """
+        (transpositions, q, rows) similarities. Transpositions are the outer
+        axis, so taking the best one is an elementwise maximum of whole slabs.
+        """
+        n_shifts, n_queries, _ = expanded.shape
+        return (expanded.reshape(-1, EMBEDDING_DIM) @ rows.T).reshape(n_shifts, n_queries, len(rows))
+
+    def search(self, queries: np.ndarray, k: int = 50, nprobe: Optional[int] = 16,
+               transpose: bool = True) -> List[List[Tuple[int, float, int]]]:
+        """
+        Top-k rows for each (q, 18) query embedding, as (row, similarity,
+        transposition) tuples, best first. The transposition is how many
+        semitones (-5..6) the query was shifted to match the row. Without
+        transpose only the untransposed query is scored. With a partitioned
+        index, only the rows of the nprobe nearest lists are scored; nprobe=None
+        scans everything.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        expanded = self._expand(queries) if transpose else queries[None]
+        k = min(k, len(self))
+        if k == 0:
+            return [[] for _ in queries]
+        if self.partitioned and nprobe is not None and nprobe < len(self.centroids):
+            return [self._search_lists(expanded[:, i:i + 1], k, nprobe) for i in range(len(queries))]
+
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self), self.block_size):
+            block = np.asarray(self.embeddings[start:start + self.block_size])
+            scores = self._score(block, expanded).max(axis=0)
+            rows = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_scores, best_rows = _merge_top_k(np.hstack([best_scores, scores]),
+                                                  np.hstack([best_rows, rows]), k)
+        return [self._ranked(best_rows[i], expanded[:, i:i + 1]) for i in range(len(queries))]
+
+    def _search_lists(self, expanded: np.ndarray, k: int, nprobe: int) -> List[Tuple[int, float, int]]:
+        centroid_scores = self._score(self.centroids, expanded).max(axis=0)[0]
+        probes = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        rows = np.concatenate([np.arange(self.list_offsets[l], self.list_offsets[l + 1]) for l in np.sort(probes)])
+        if len(rows) == 0:
+            return []
+        scores = self._score(np.asarray(self.embeddings[rows]), expanded).max(axis=0)
+        _, best = _merge_top_k(scores, rows[None, :], k)
+        return self._ranked(best[0], expanded)
+
+    def _ranked(self, rows: np.ndarray, expanded: np.ndarray) -> List[Tuple[int, float, int]]:
+        """Rescores a query's candidate rows and sorts them, best first."""
+        rows = np.sort(rows)
+        scores = self._score(np.asarray(self.embeddings[rows]), expanded)[:, 0]
+        shifts = scores.argmax(axis=0)
+        best = scores.max(axis=0)
+        order = np.argsort(-best, kind='stable')
+        return [(int(rows[i]), float(best[i]), int((shifts[i] + 5) % 12 - 5)) for i in order]
+
+    def query(self, chroma: Sequence[float], tonnetz: Sequence[float], k: int = 50, nprobe: Optional[int] = 16,
+              transpose: bool = True) -> List[Dict[str, Any]]:
+        """The k recordings most similar to a chroma/tonnetz mean pair."""
+        hits = self.search(embed(chroma, tonnetz, self.tonnetz_weight), k, nprobe, transpose)[0]
+        return [{"name": self.names[row], "similarity": score, "transposition": shift} for row, score, shift in hits]
+
+    def similar(self, name: str, k: int = 50, nprobe: Optional[int] = 16,
+                transpose: bool = True) -> List[Dict[str, Any]]:
+        """The k recordings most similar to an indexed one (itself excluded)."""
+        row = self._rows.get(name)
+        if row is None:
+            raise KeyError(f"{name} is not in the similarity index")
+        hits = self.search(np.asarray(self.embeddings[row:row + 1]), k + 1, nprobe, transpose)[0]
+        return [{"name": self.names[r], "similarity": score, "transposition": shift}
+                for r, score, shift in hits if r != row][:k]
@@ -0,0 +1,106 @@
+import os
+import json
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+import torch
+from torch.utils.data import IterableDataset, get_worker_info
+from src.tokenizer import SHARD_DTYPE
+
+class TokenShardDataset(IterableDataset):
+    """
+    Streams padded, length-bucketed batches of token windows from the shards
+    written by tokenizer.write_token_shards.
+
+    Every sequence is cut into windows of at most max_len tokens. Windows are
+    read straight from np.memmap views of the shards, so producing a batch is a
+    few slice copies with no MIDI parsing. Windows are shuffled, then sorted by
+    length within pools of buffer_batches batches so each batch holds windows of
+    similar length and little padding; the batch order is shuffled again.
+    Yields (tokens [B, L] int64, key_padding_mask [B, L] bool, True at padding),
+    so use DataLoader(dataset, batch_size=None). With DataLoader workers, each
+    worker streams a disjoint share of the windows.
+
+    For a MusicTransformer, one way to train on a batch is
+    model(tokens, tokens[:, :-1], tgt_mask=model.causal_mask(L - 1), ...) against
+    targets tokens[:, 1:].
+    """
+
+    def __init__(self, shard_dir: str, max_len: int = 512, batch_size: int = 32, shuffle: bool = True,
+                 buffer_batches: int = 64, min_len: int = 2, drop_last: bool = False, seed: int = 0):
+        with open(os.path.join(shard_dir, "meta.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.shard_dir = shard_dir
+        self.max_len = max_len
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.buffer_batches = buffer_batches
+        self.drop_last = drop_last
+        self.seed = seed
+        self.epoch = 0
+        self.pad_token_id = self.meta["pad_token_id"]
+        self.windows = self._build_windows(np.load(os.path.join(shard_dir, "index.npy")), max_len, min_len)
+        self._shards: Optional[List[np.memmap]] = None
+
+    @staticmethod
+    def _build_windows(index: np.ndarray, max_len: int, min_len: int) -> np.ndarray:
+        """(shard, offset, length) of every window, as an [N, 3] int64 array."""
+        counts = -(-index['length'].astype(np.int64) // max_len)
+        seq = np.repeat(np.arange(len(index)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        start = within * max_len
+        length = np.minimum(max_len, index['length'][seq].astype(np.int64) - start)
+        windows = np.stack([index['shard'][seq].astype(np.int64),
+                            index['offset'][seq].astype(np.int64) + start, length], axis=1)
+        return windows[length >= min_len]
+
+    def set_epoch(self, epoch: int):
+        """Changes the shuffle order; call once per epoch."""
+        self.epoch = epoch
+
+    def _open_shards(self) -> List[np.memmap]:
+        # Opened lazily so every DataLoader worker maps the files itself
+        if self._shards is None:
+            self._shards = [np.memmap(os.path.join(self.shard_dir, f"shard-{i:05d}.bin"), dtype=SHARD_DTYPE, mode='r')
+                            for i in range(self.meta["num_shards"])]
+        return self._shards
+
+    def batches(self) -> Iterator[np.ndarray]:
+        """Yields the window rows of each batch, for this worker and epoch."""
+        windows = self.windows
+        info = get_worker_info()
+        rng = np.random.default_rng((self.seed, self.epoch))
+        order = rng.permutation(len(windows)) if self.shuffle else np.arange(len(windows))
+        if info is not None:
+            order = order[info.id::info.num_workers]
+        pool_size = self.batch_size * self.buffer_batches
+        for pool_start in range(0, len(order), pool_size):
+            pool = order[pool_start:pool_start + pool_size]
+            pool = pool[np.argsort(windows[pool, 2], kind='stable')]
+            batches = [pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size)]
+            if self.drop_last and batches and len(batches[-1]) < self.batch_size:
+                batches.pop()
+            if self.shuffle:
+                rng.shuffle(batches)
+            for batch in batches:
+                yield windows[batch]
+
+    def collate(self, rows: np.ndarray) -> Tuple[torch.Tensor, torch.Tensor]:
+        shards = self._open_shards()
+        lengths = rows[:, 2]
+        tokens = np.full((len(rows), int(lengths.max())), self.pad_token_id, dtype=np.int64)
+        for i, (shard, offset, length) in enumerate(rows):
+            tokens[i, :length] = shards[shard][offset:offset + length]
+        mask = np.arange(tokens.shape[1])[None, :] >= lengths[:, None]
+        return torch.from_numpy(tokens), torch.from_numpy(mask)
+
+    def __iter__(self) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+        for rows in self.batches():
+            yield self.collate(rows)
+
+    def padding_fraction(self) -> float:
+        """Share of padding tokens over one epoch of batches."""
+        real = padded = 0
+        for rows in self.batches():
+            real += int(rows[:, 2].sum())
+            padded += len(rows) * int(rows[:, 2].max())
+        return 1.0 - real / padded if padded else 0.0
@@ -0,0 +1,207 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from src.data_loader import NOTE_EVENT_DTYPE, TIME_SIGNATURE_DTYPE, MusicDataLoader, NoteEvents
+
+# One row per tokenized sequence: which shard it lives in, where it starts (in tokens)
+# and how long it is, plus the position of its source file in meta.json's file list
+TOKEN_INDEX_DTYPE = np.dtype([
+    ('shard', np.uint32),
+    ('offset', np.uint64),
+    ('length', np.uint32),
+    ('file', np.uint32),
+])
+
+SHARD_DTYPE = np.dtype('<u2')
+
+class RemiTokenizer:
+    """
+    REMI-style event tokenizer for NoteEvents.
+
+    A score becomes BOS, then for every note (in onset, pitch order) a Bar token
+    for each barline crossed, a Position token when the onset moves within the
+    bar, and Pitch, Velocity and Duration tokens; then EOS. Time is quantized to
+    `resolution` steps per quarter note and bars follow the score's time
+    signatures (4/4 when it has none). All parts are merged into one stream.
+
+    Vocabulary layout (contiguous ranges, so every id fits in uint16):
+    PAD, BOS, EOS, BAR | Position x max_positions | Pitch x 128 |
+    Velocity x n_velocities | Duration x max_duration
+    """
+
+    PAD, BOS, EOS, BAR = 0, 1, 2, 3
+
+    def __init__(self, resolution: int = 12, max_bar_quarters: int = 8, max_duration_quarters: int = 8,
+                 n_velocities: int = 32):
+        self.resolution = resolution
+        self.max_positions = resolution * max_bar_quarters
+        self.max_duration = resolution * max_duration_quarters
+        self.n_velocities = n_velocities
+        self.position_offset = 4
+        self.pitch_offset = self.position_offset + self.max_positions
+        self.velocity_offset = self.pitch_offset + 128
+        self.duration_offset = self.velocity_offset + n_velocities
+        self.vocab_size = self.duration_offset + self.max_duration
+        if self.vocab_size > np.iinfo(SHARD_DTYPE).max:
+            raise ValueError("Vocabulary does not fit in uint16 tokens")
+        self._max_bar_quarters = max_bar_quarters
+        self._max_duration_quarters = max_duration_quarters
+
+    def config(self) -> Dict[str, int]:
+        return {"resolution": self.resolution, "max_bar_quarters": self._max_bar_quarters,
+                "max_duration_quarters": self._max_duration_quarters, "n_velocities": self.n_velocities}
+
+    def bar_starts(self, time_signatures: np.ndarray, end_tick: int) -> np.ndarray:
+        """Tick of every barline up to end_tick under the given time signature changes."""
+        if len(time_signatures) == 0:
+            time_signatures = np.array([(0.0, 4, 4)], dtype=TIME_SIGNATURE_DTYPE)
+        starts = []
+        changes = np.sort(time_signatures, order='time')
+        for i, ts in enumerate(changes):
+            start = int(round(ts['time'] * self.resolution))
+            stop = int(round(changes[i + 1]['time'] * self.resolution)) if i + 1 < len(changes) else end_tick + 1
+            bar_ticks = max(1, int(round(ts['numerator'] * 4 / ts['denominator'] * self.resolution)))
+            if i == 0 and start > 0:
+                # Material before the first time signature is measured in 4/4
+                starts.append(np.arange(0, start, 4 * self.resolution))
+            starts.append(np.arange(start, max(stop, start + 1), bar_ticks))
+        return np.concatenate(starts)
+
+    def encode(self, events: NoteEvents) -> np.ndarray:
+        """Tokenizes a score; returns a uint16 array starting with BOS and ending with EOS."""
+        notes = events.notes
+        if len(notes) == 0:
+            return np.array([self.BOS, self.EOS], dtype=SHARD_DTYPE)
+        onset = np.rint(notes['onset'] * self.resolution).astype(np.int64)
+        duration = np.clip(np.rint((notes['offset'] - notes['onset']) * self.resolution).astype(np.int64),
+                           1, self.max_duration)
+        order = np.lexsort((notes['pitch'], onset))
+        onset, duration = onset[order], duration[order]
+        pitch = notes['pitch'][order].astype(np.int64)
+        velocity = notes['velocity'][order].astype(np.int64) * self.n_velocities // 128
+
+        starts = self.bar_starts(events.time_signatures, int(onset[-1]))
+        bar = np.searchsorted(starts, onset, side='right') - 1
+        position = np.minimum(onset - starts[bar], self.max_positions - 1)
+
+        # Tokens per note: the barlines crossed since the previous note, an optional
+        # Position, then Pitch, Velocity and Duration
+        prev_bar = np.concatenate([[-1], bar[:-1]])
+        n_bars = bar - prev_bar
+        new_position = (n_bars > 0) | (position != np.concatenate([[-1], position[:-1]]))
+        lengths = n_bars + new_position + 3
+        group_start = 1 + np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        total = int(lengths.sum()) + 2
+
+        tokens = np.empty(total, dtype=np.int64)
+        tokens[0] = self.BOS
+        tokens[-1] = self.EOS
+        bar_slots = np.repeat(group_start, n_bars) + (np.arange(n_bars.sum()) - np.repeat(np.cumsum(n_bars) - n_bars, n_bars))
+        tokens[bar_slots] = self.BAR
+        note_start = group_start + n_bars
+        tokens[note_start[new_position]] = self.position_offset + position[new_position]
+        note_start = note_start + new_position
+        tokens[note_start] = self.pitch_offset + pitch
+        tokens[note_start + 1] = self.velocity_offset + velocity
+        tokens[note_start + 2] = self.duration_offset + duration - 1
+        return tokens.astype(SHARD_DTYPE)
+
+    def decode(self, tokens: Sequence[int], time_signatures: Optional[np.ndarray] = None) -> NoteEvents:
+        """
+        Rebuilds NoteEvents (as a single part) from tokens. Bar lengths follow
+        time_signatures, 4/4 by default; velocities come back as bin centres.
+        """
+        tokens = np.asarray(tokens, dtype=np.int64)
+        n_bars = int((tokens == self.BAR).sum())
+        ts = time_signatures if time_signatures is not None else np.zeros(0, TIME_SIGNATURE_DTYPE)
+        starts = self.bar_starts(ts, 0)
+        while len(starts) < n_bars:
+            starts = self.bar_starts(ts, int(starts[-1]) * 2 + 8 * self.resolution)
+        rows = []
+        bar = -1
+        position = 0
+        pending: Dict[str, int] = {}
+        for t in tokens:
+            if t == self.BAR:
+                bar += 1
+                position = 0
+            elif self.position_offset <= t < self.pitch_offset:
+                position = t - self.position_offset
+            elif self.pitch_offset <= t < self.velocity_offset:
+                pending = {"pitch": t - self.pitch_offset}
+            elif self.velocity_offset <= t < self.duration_offset:
+                pending["velocity"] = (t - self.velocity_offset) * 128 // self.n_velocities + 64 // self.n_velocities
+            elif self.duration_offset <= t < self.vocab_size and "pitch" in pending:
+                onset = (starts[max(bar, 0)] + position) / self.resolution
+                length = (t - self.duration_offset + 1) / self.resolution
+                rows.append((onset, onset + length, pending["pitch"], min(127, pending.get("velocity", 64)), 0))
+                pending = {}
+        return NoteEvents(np.array(rows, dtype=NOTE_EVENT_DTYPE), time_signatures=time_signatures)
+
+def _tokenize_file(file_path: str, config: Dict[str, int]) -> Optional[np.ndarray]:
+    """Worker: loads one MIDI file as NoteEvents and tokenizes it (module level so it pickles)."""
+    events = MusicDataLoader().load_note_events(file_path)
+    if events is None:
+        return None
+    return RemiTokenizer(**config).encode(events)
+
+def write_token_shards(file_paths: Sequence[str], out_dir: str, tokenizer: Optional[RemiTokenizer] = None,
+                       workers: int = 1, shard_tokens: int = 1 << 22) -> Dict[str, Any]:
+    """
+    Tokenizes file_paths (in parallel with workers > 1) into out_dir:
+    shard-NNNNN.bin files of raw little-endian uint16 tokens, holding up to
+    shard_tokens tokens each, index.npy (TOKEN_INDEX_DTYPE, one row per
+    sequence) and meta.json (tokenizer config, vocabulary size, file list).
+    A sequence never spans two shards; one longer than shard_tokens gets a shard
+    of its own. Files that fail to load are skipped. Returns the meta dict.
+    """
+    tokenizer = tokenizer or RemiTokenizer()
+    config = tokenizer.config()
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):
+        if name.startswith("shard-") and name.endswith(".bin"):
+            os.remove(os.path.join(out_dir, name))
+
+    file_paths = list(file_paths)
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        chunksize = max(1, len(file_paths) // (workers * 8))
+        # map() yields in submission order, so shard contents do not depend on scheduling
+        sequences = pool.map(_tokenize_file, file_paths, [config] * len(file_paths), chunksize=chunksize)
+    else:
+        pool = None
+        sequences = (_tokenize_file(p, config) for p in file_paths)
+
+    index: List[Tuple[int, int, int, int]] = []
+    files: List[str] = []
+    shard = -1
+    shard_fill = shard_tokens
+    f = None
+    try:
+        for file_path, tokens in zip(file_paths, sequences):
+            if tokens is None:
+                continue
+            if shard_fill + len(tokens) > shard_tokens and shard_fill > 0:
+                if f is not None:
+                    f.close()
+                shard += 1
+                shard_fill = 0
+                f = open(os.path.join(out_dir, f"shard-{shard:05d}.bin"), 'wb')
+            f.write(tokens.astype(SHARD_DTYPE, copy=False).tobytes())
+            index.append((shard, shard_fill, len(tokens), len(files)))
+            files.append(file_path)
+            shard_fill += len(tokens)
+    finally:
+        if f is not None:
+            f.close()
+        if pool is not None:
+            pool.shutdown()
+
+    np.save(os.path.join(out_dir, "index.npy"), np.array(index, dtype=TOKEN_INDEX_DTYPE))
+    meta = {"tokenizer": config, "vocab_size": tokenizer.vocab_size, "pad_token_id": RemiTokenizer.PAD,
+            "num_shards": shard + 1, "num_tokens": int(sum(row[2] for row in index)), "files": files}
+    with open(os.path.join(out_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=4)
+    return meta
@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set, Tuple
+from batch_analysis import analyze_file, analyzer_fingerprint, format_report, result_json_path, write_outputs
+from src.cache import ResultCache, file_digest
+from src.data_loader import MusicDataLoader, output_name
+from src.run_journal import file_source
+
+if TYPE_CHECKING:
+    from src.progression_index import ProgressionIndex
+    from src.result_store import ResultStore
+
+class CorpusManifest:
+    """
+    On-disk record of the corpus state that the current outputs reflect.
+
+    Each score (keyed by its path relative to the data directory) stores the
+    mtime, size and SHA-256 it was analyzed at, the name of its outputs (see
+    output_name), where its section sits in full_report.txt (an insertion
+    sequence number and a byte length) and its error, if any.
+
+    The manifest is a JSON lines log: a header with the analyzer fingerprint,
+    then one line per changed entry ({"key": ..., "entry": ...}, with a null
+    entry for a deleted score), so save() only appends what changed since the
+    last save. Later lines supersede earlier ones; a torn last line is cut off
+    on load, and the log is compacted once it holds more than twice as many
+    lines as entries. When the fingerprint changes every entry is treated as stale.
+    """
+
+    def __init__(self, path: str, fingerprint: str = ""):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.stale = False
+        self._dirty: Set[str] = set()
+        self._lines = 0
+        header = None
+        good = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    good += len(line)
+                    if header is None:
+                        header = record
+                    elif record["entry"] is None:
+                        self.entries.pop(record["key"], None)
+                    else:
+                        self.entries[record["key"]] = record["entry"]
+                    self._lines += 1
+        except (OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+            header = None
+        if header is None:
+            self._lines = 0
+            return
+        self.stale = header.get("fingerprint") != fingerprint
+        # Only the last line can be torn; cut it off so appended lines start cleanly
+        if good < os.path.getsize(path):
+            os.truncate(path, good)
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        self.entries[key] = entry
+        self._dirty.add(key)
+
+    def pop(self, key: str) -> Dict[str, Any]:
+        self._dirty.add(key)
+        return self.entries.pop(key)
+
+    def save(self):
+        """Appends the changed entries, or rewrites the log atomically when stale or due for compaction."""
+        if not self._lines or self.stale or self._lines + len(self._dirty) > 2 * len(self.entries) + 64:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(json.dumps({"fingerprint": self.fingerprint}) + "\n")
+                for key, entry in self.entries.items():
+                    f.write(json.dumps({"key": key, "entry": entry}) + "\n")
+            os.replace(tmp_path, self.path)
+            self._lines = len(self.entries) + 1
+        elif self._dirty:
+            lines = [json.dumps({"key": key, "entry": self.entries.get(key)}) + "\n" for key in sorted(self._dirty)]
+            with open(self.path, 'a') as f:
+                f.write("".join(lines))
+            self._lines += len(lines)
+        self._dirty.clear()
+        self.stale = False
+
+def remove_outputs(name: str, result_dir: str, analysis_dir: str):
+    """Deletes the per-file outputs written by batch_analysis.write_outputs."""
+    for path in (result_json_path(name, result_dir),
+                 os.path.join(analysis_dir, f"{name}_analysis.txt")):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+class CorpusWatcher:
+    """
+    Keeps the analysis outputs of a corpus directory in step with its contents.
+
+    Each sync() stats the files found by MusicDataLoader.get_files_by_extension
+    and compares them with the manifest. Only files whose mtime or size changed
+    are hashed, and only those whose contents changed are analyzed; outputs of
+    deleted files are removed. Outputs are named by the file's path under the
+    data directory (see output_name), and results carry that path as their
+    filename, so same-named scores in different directories stay apart.
+    full_report.txt is edited in place (see update_report), so a sync costs in
+    proportion to what changed, not to the corpus.
+    Files modified less than `settle` seconds ago are left for the next sync,
+    so a file that is still being written is not analyzed half-finished.
+    """
+
+    def __init__(self, data_dir: str = "data", result_dir: str = "result", analysis_dir: str = "analysis",
+                 extension: str = ".mid", manifest_path: Optional[str] = None,
+                 cache: Optional[ResultCache] = None, store: Optional["ResultStore"] = None,
+                 index: Optional["ProgressionIndex"] = None, workers: int = 1, settle: float = 1.0):
+        self.loader = MusicDataLoader(data_dir)
+        self.data_dir = data_dir
+        self.result_dir = result_dir
+        self.analysis_dir = analysis_dir
+        self.extension = extension
+        self.manifest = CorpusManifest(manifest_path or os.path.join(result_dir, ".corpus_manifest.json"),
+                                       fingerprint=analyzer_fingerprint())
+        self.cache = cache
+        self.store = store
+        self.index = index
+        self.workers = workers
+        self.settle = settle
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def scan(self) -> Tuple[List[Tuple[str, str, os.stat_result, str]], List[str], bool]:
+        """
+        Compares the data directory with the manifest.
+        Returns (changed, deleted, touched): changed holds (key, path, stat, sha256)
+        per added or modified file, deleted the manifest keys of removed files, and
+        touched whether any entry only needs its mtime refreshed.
+        """
+        entries = self.manifest.entries
+        stale = self.manifest.stale
+        now = time.time()
+        changed = []
+        touched = False
+        seen = set()
+        for path in self.loader.get_files_by_extension(self.extension):
+            rel = os.path.relpath(path, self.data_dir)
+            seen.add(rel)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entry = entries.get(rel)
+            if not stale and entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                continue
+            if now - st.st_mtime < self.settle:
+                continue
+            digest = file_digest(path).hexdigest()
+            if not stale and entry is not None and entry["sha256"] == digest:
+                # Touched or copied over with identical contents: nothing to re-analyze
+                self.manifest.set(rel, dict(entry, mtime_ns=st.st_mtime_ns))
+                touched = True
+                continue
+            changed.append((rel, path, st, digest))
+        deleted = sorted(set(entries) - seen)
+        return sorted(changed, key=lambda change: change[0]), deleted, touched
+
+    def _analyze(self, paths: List[str]) -> list:
+        if self.workers > 1 and len(paths) > 1:
+            if self._pool is None:
+                # Kept warm across syncs so each drop of files does not pay for worker startup
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            n = len(paths)
+            return list(self._pool.map(analyze_file, paths, [self.result_dir] * n, [self.analysis_dir] * n,
+                                       [self.cache] * n, [False] * n))
+        return [analyze_file(p, self.result_dir, self.analysis_dir, self.cache, export=False) for p in paths]
+
+    def sync(self) -> Dict[str, int]:
+        """
+        Brings outputs, report and manifest up to date with the data directory.
+        Returns counts of added, modified, deleted and failed files.
+        """
+        changed, deleted, touched = self.scan()
+        summary = {"added": 0, "modified": 0, "deleted": len(deleted), "failed": 0}
+        if not changed and not deleted:
+            if touched or self.manifest.stale:
+                self.manifest.save()
+            return summary
+
+        os.makedirs(self.result_dir, exist_ok=True)
+        os.makedirs(self.analysis_dir, exist_ok=True)
+        entries = self.manifest.entries
+        layout = self._report_layout()
+
+        dropped = []
+        for rel in deleted:
+            print(f"Removed {rel}")
+            dropped.append(rel)
+            remove_outputs(self.manifest.pop(rel)["name"], self.result_dir, self.analysis_dir)
+
+        removed = list(dropped)
+        results = []
+        sources = []
+        sections: List[Tuple[str, str]] = []
+        outcomes = self._analyze([path for _, path, _, _ in changed])
+        for (rel, path, st, digest), (_, _, error, result_data) in zip(changed, outcomes):
+            summary["modified" if rel in entries else "added"] += 1
+            if rel in entries:
+                dropped.append(rel)
+            name = output_name(path, self.data_dir)
+            entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest, "name": name,
+                     "report_seq": None, "report_len": 0, "error": error}
+            if error is not None:
+                summary["failed"] += 1
+                removed.append(rel)
+                # Drop outputs from an earlier, successful version of the file
+                remove_outputs(name, self.result_dir, self.analysis_dir)
+            else:
+                # Named by the path under the data directory, like the outputs
+                result_data = dict(result_data, filename=rel)
+                analysis_text = format_report(result_data)
+                write_outputs(name, result_data, analysis_text, self.result_dir, self.analysis_dir)
+                results.append(result_data)
+                sources.append(file_source(result_json_path(name, self.result_dir)))
+                sections.append((rel, analysis_text))
+            self.manifest.set(rel, entry)
+
+        if self.store is not None:
+            self.store.append_results(results)
+        if self.index is not None:
+            self.index.add_results(results, sources=sources)
+            if removed:
+                self.index.remove(removed)
+        self.update_report(layout, dropped, sections)
+        self.manifest.save()
+        return summary
+
+    def _report_layout(self) -> Dict[str, Tuple[int, int]]:
+        """(offset, length) in full_report.txt of every manifest entry with a report section."""
+        layout = {}
+        offset = 0
+        placed = [(e["report_seq"], rel, e["report_len"]) for rel, e in self.manifest.entries.items()
+                  if e.get("report_seq") is not None]
+        for _, rel, length in sorted(placed):
+            layout[rel] = (offset, length)
+            offset += length
+        return layout
+
+    def update_report(self, layout: Dict[str, Tuple[int, int]], dropped: Sequence[str],
+                      sections: Sequence[Tuple[str, str]]):
+        """
+        Edits full_report.txt in place: cuts out the sections of dropped keys
+        (layout gives where every section sat before this sync) and appends the
+        new sections. Only the part of the file after the first dropped section
+        is rewritten, and nothing is rewritten when files are only added. New
+        sections go at the end, so after the first full sync the report is in
+        the order files arrived rather than sorted. If the file does not match
+        the layout (missing, or rewritten by batch_analysis.py), it is rebuilt
+        from the per-file reports.
+        """
+        path = os.path.join(self.analysis_dir, "full_report.txt")
+        expected = sum(length for _, length in layout.values())
+        try:
+            intact = os.path.getsize(path) == expected
+        except OSError:
+            intact = False
+        spans = sorted(layout[rel] for rel in dropped if rel in layout)
+        with open(path, 'r+b' if intact else 'wb') as f:
+            if not intact:
+                self._rebuild_report(f, set(dropped))
+            elif spans:
+                start = spans[0][0]
+                f.seek(start)
+                tail = f.read()
+                kept = []
+                position = start
+                for offset, length in spans:
+                    kept.append(tail[position - start:offset - start])
+                    position = offset + length
+                kept.append(tail[position - start:])
+                f.seek(start)
+                f.write(b"".join(kept))
+                f.truncate()
+            f.seek(0, os.SEEK_END)
+            next_seq = max((e["report_seq"] for e in self.manifest.entries.values()
+                            if e.get("report_seq") is not None), default=-1) + 1
+            for rel, text in sections:
+                data = text.encode('utf-8')
+                f.write(data)
+                self.manifest.set(rel, dict(self.manifest.entries[rel], report_seq=next_seq, report_len=len(data)))
+                next_seq += 1
+
+    def _rebuild_report(self, f, skip: Set[str]):
+        """Writes every current section, except those of skip, from the per-file reports to f."""
+        placed = sorted((e["report_seq"], rel) for rel, e in self.manifest.entries.items()
+                        if e.get("report_seq") is not None and rel not in skip)
+        for seq, rel in placed:
+            entry = self.manifest.entries[rel]
+            try:
+                with open(os.path.join(self.analysis_dir, f"{entry['name']}_analysis.txt"), 'rb') as section:
+                    data = section.read()
+            except OSError:
+                self.manifest.set(rel, dict(entry, report_seq=None, report_len=0))
+                continue
+            f.write(data)
+            if len(data) != entry["report_len"]:
+                self.manifest.set(rel, dict(entry, report_len=len(data)))
+
+    def watch(self, interval: float = 2.0, max_cycles: Optional[int] = None):
+        """Polls the data directory every interval seconds until interrupted."""
+        print(f"Watching {self.data_dir}/ for {self.extension} files (Ctrl+C to stop)")
+        cycles = 0
+        try:
+            while max_cycles is None or cycles < max_cycles:
+                summary = self.sync()
+                if any(summary.values()):
+                    print("Synced: " + ", ".join(f"{v} {k}" for k, v in summary.items()))
+                cycles += 1
+                if max_cycles is None or cycles < max_cycles:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+def build_parser(prog: Optional[str] = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog=prog, description="Keep analysis outputs in sync with a MIDI corpus, "
+                                                            "analyzing only new or changed files.")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--result-dir", default="result")
+    parser.add_argument("--analysis-dir", default="analysis")
+    parser.add_argument("--manifest", help="Manifest path (default: RESULT_DIR/.corpus_manifest.json)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, kept warm between syncs")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between directory scans")
+    parser.add_argument("--settle", type=float, default=1.0,
+                        help="Skip files modified less than this many seconds ago (still being written)")
+    parser.add_argument("--once", action="store_true", help="Sync once and exit instead of watching")
+    parser.add_argument("--cache-dir", default=".cache/results",
+                        help="Directory of the persistent result cache")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--store", metavar="PATH", help="Also append new results to a columnar result store")
+    parser.add_argument("--index", metavar="PATH", help="Also keep a progression index (search_progressions.py) "
+                                                        "up to date")
+    return parser
+
+def main(argv: Optional[Sequence[str]] = None, prog: Optional[str] = None):
+    args = build_parser(prog).parse_args(argv)
+    cache = None if args.no_cache else ResultCache(args.cache_dir, fingerprint=analyzer_fingerprint())
+    store = None
+    if args.store:
+        from src.result_store import ResultStore
+        store = ResultStore(args.store)
+    index = None
+    if args.index:
+        from src.progression_index import ProgressionIndex
+        index = ProgressionIndex(args.index)
+    watcher = CorpusWatcher(args.data_dir, args.result_dir, args.analysis_dir, manifest_path=args.manifest,
+                            cache=cache, store=store, index=index, workers=args.workers, settle=args.settle)
+    if args.once:
+        summary = watcher.sync()
+        watcher.close()
+        print("Synced: " + ", ".join(f"{v} {k}" for k, v in summary.items()))
+    else:
+        watcher.watch(args.interval)
+
+if __name__ == "__main__":
+    main()